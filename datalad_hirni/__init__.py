@@ -5,17 +5,6 @@ __docformat__ = 'restructuredtext'
 from .version import __version__
 
 import os.path as op
-from os.path import curdir
-from os.path import abspath
-
-from datalad.interface.base import Interface
-from datalad.interface.base import build_doc
-from datalad.support.param import Parameter
-from datalad.distribution.dataset import datasetmethod
-from datalad.interface.utils import eval_results
-from datalad.support.constraints import EnsureChoice
-
-from datalad.interface.results import get_status_dict
 
 # defines a datalad command suite
 # this symbol must be identified as a setuptools entrypoint
@@ -31,6 +20,12 @@ command_suite = (
             'hirni-import-dcm',
             'hirni_import_dcm',
         ),
+        (
+            'datalad_hirni.commands.batch_import',
+            'BatchImportDicoms',
+            'hirni-batch-import-dcm',
+            'hirni_batch_import_dcm',
+        ),
         (
             'datalad_hirni.commands.spec4anything',
             'Spec4Anything',
@@ -49,10 +44,67 @@ command_suite = (
             'hirni-spec2bids',
             'hirni_spec2bids',
         ),
+        (
+            'datalad_hirni.commands.maintenance',
+            'Maintenance',
+            'hirni-maintenance',
+            'hirni_maintenance',
+        ),
+        (
+            'datalad_hirni.commands.aggregate',
+            'Aggregate',
+            'hirni-aggregate',
+            'hirni_aggregate',
+        ),
+        (
+            'datalad_hirni.commands.catalog',
+            'Catalog',
+            'hirni-catalog',
+            'hirni_catalog',
+        ),
+        (
+            'datalad_hirni.commands.validate',
+            'Validate',
+            'hirni-validate',
+            'hirni_validate',
+        ),
+        (
+            'datalad_hirni.commands.bulk_edit',
+            'BulkEdit',
+            'hirni-bulk-edit',
+            'hirni_bulk_edit',
+        ),
+        (
+            'datalad_hirni.commands.export_specs',
+            'ExportSpecs',
+            'hirni-export-specs',
+            'hirni_export_specs',
+        ),
+        (
+            'datalad_hirni.commands.daemon',
+            'Daemon',
+            'hirni-daemon',
+            'hirni_daemon',
+        ),
+        (
+            'datalad_hirni.commands.watch',
+            'Watch',
+            'hirni-watch',
+            'hirni_watch',
+        ),
     ]
 )
 
 webapp_location = op.join('resources', 'webapp')
 
-from datalad import setup_package
-from datalad import teardown_package
+
+# Note: Wrapped rather than imported from datalad, so that importing this
+# package (e.g. for hirni-client) doesn't import datalad.
+def setup_package():
+    from datalad import setup_package
+    return setup_package()
+
+
+def teardown_package():
+    from datalad import teardown_package
+    return teardown_package()
@@ -0,0 +1,173 @@
+"""Thin client submitting commands to a running hirni-daemon
+
+This module must not import datalad (or anything heavy), since avoiding the
+cost of doing so is the entire point of it.
+
+Usage::
+
+  hirni-client [-d DATASET] [-s SOCKET] [--json] COMMAND [KEY=VALUE ...]
+
+COMMAND is the name of a hirni command, like 'import-dcm' or 'dicom2spec'.
+Each KEY=VALUE is passed on as a keyword argument of that command, with VALUE
+being parsed as JSON if possible and taken as a string otherwise. Special
+commands are 'ping' and 'shutdown'.
+
+The client's working directory and dataset are sent along, so that the daemon
+executes the command as if it was called by the client: in the client's
+dataset, with relative paths resolved against the client's working directory.
+"""
+
+import argparse
+import json
+import os
+import os.path as op
+import socket
+import sys
+
+# location of the socket relative to the study dataset's root
+socket_file = op.join('.git', 'datalad', 'hirni', 'daemon.sock')
+
+
+def get_socket_path(ds_path):
+    return op.join(ds_path, socket_file)
+
+
+def send_message(sock, message):
+    """Send a message (a JSON-serializable dict) as a line of JSON"""
+
+    sock.sendall(json.dumps(message, default=str).encode('utf-8') + b'\n')
+
+
+def iter_messages(sock):
+    """Yield messages (dicts) from a socket until it's closed"""
+
+    buffer = b''
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            break
+        buffer += data
+        while b'\n' in buffer:
+            line, buffer = buffer.split(b'\n', 1)
+            if line.strip():
+                yield json.loads(line.decode('utf-8'))
+
+
+def submit(socket_path, command, kwargs=None, cwd=None, dataset=None):
+    """Submit a command to a daemon and yield its results
+
+    Parameters
+    ----------
+    socket_path: str
+    command: str
+      hirni command (e.g. 'import-dcm'), 'ping' or 'shutdown'
+    kwargs: dict, optional
+      keyword arguments for the command
+    cwd: str, optional
+      directory to resolve relative paths against. Defaults to the current
+      working directory.
+    dataset: str, optional
+      dataset to execute the command in, unless `kwargs` specifies one.
+      Defaults to the dataset the daemon is serving.
+
+    Yields
+    ------
+    dict
+      result records
+    """
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        send_message(sock, dict(command=command,
+                                kwargs=kwargs or {},
+                                cwd=op.abspath(cwd or os.getcwd()),
+                                dataset=dataset))
+        for msg in iter_messages(sock):
+            yield msg
+    finally:
+        sock.close()
+
+
+def _find_dataset_root(path):
+    path = op.abspath(path)
+    while True:
+        if op.isdir(op.join(path, '.datalad')) or \
+                op.exists(op.join(path, '.git')):
+            return path
+        parent = op.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def _parse_kwargs(args):
+    kwargs = dict()
+    for arg in args:
+        if '=' not in arg:
+            raise ValueError("arguments need to be given as KEY=VALUE, "
+                             "got: {}".format(arg))
+        k, v = arg.split('=', 1)
+        try:
+            v = json.loads(v)
+        except ValueError:
+            pass
+        kwargs[k.replace('-', '_')] = v
+    return kwargs
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog='hirni-client',
+        description="Submit a command to a running hirni-daemon")
+    parser.add_argument('-d', '--dataset', default=os.curdir,
+                        help="study dataset the daemon is serving")
+    parser.add_argument('-s', '--socket',
+                        help="path of the daemon's socket. Defaults to the "
+                             "one within the dataset")
+    parser.add_argument('--json', action='store_true',
+                        help="print results as JSON lines")
+    parser.add_argument('command')
+    parser.add_argument('arguments', nargs='*', metavar='KEY=VALUE')
+    args = parser.parse_args(args)
+
+    root = _find_dataset_root(args.dataset)
+    socket_path = args.socket
+    if not socket_path:
+        if root is None:
+            parser.error("no dataset found at {}".format(args.dataset))
+        socket_path = get_socket_path(root)
+
+    try:
+        kwargs = _parse_kwargs(args.arguments)
+    except ValueError as e:
+        parser.error(str(e))
+
+    failed = False
+    try:
+        for res in submit(socket_path, args.command, kwargs,
+                          dataset=root):
+            if args.json:
+                print(json.dumps(res))
+            else:
+                msg = res.get('message')
+                if isinstance(msg, list):
+                    try:
+                        msg = msg[0] % tuple(msg[1:])
+                    except TypeError:
+                        msg = str(msg)
+                print("{}({}): {}{}".format(
+                    res.get('action', ''),
+                    res.get('status', ''),
+                    res.get('path', ''),
+                    " [{}]".format(msg) if msg else ''))
+            failed = failed or res.get('status') in ('impossible', 'error')
+    except (OSError, socket.error) as e:
+        print("Failed to connect to hirni-daemon at {}: {}"
+              "".format(socket_path, e), file=sys.stderr)
+        return 2
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""Run deferred metadata aggregation of DICOM datasets"""
+
+from datalad.interface.base import build_doc, Interface
+from datalad.interface.common_opts import jobs_opt
+from datalad.support.constraints import EnsureStr
+from datalad.support.constraints import EnsureNone
+from datalad.support.param import Parameter
+from datalad.distribution.dataset import datasetmethod
+from datalad.distribution.dataset import EnsureDataset
+from datalad.distribution.dataset import require_dataset
+from datalad.distribution.dataset import resolve_path
+from datalad.interface.utils import eval_results
+from datalad.utils import assure_list
+
+from datalad_hirni.support.aggregation import (
+    get_pending,
+    run_aggregation,
+)
+
+import logging
+lgr = logging.getLogger('datalad.hirni.aggregate')
+
+
+@build_doc
+class Aggregate(Interface):
+    """Aggregate pending metadata of imported DICOM datasets in one step.
+
+    Importing DICOMs doesn't necessarily aggregate the metadata of the new
+    DICOM datasets into the study dataset right away. Instead those datasets
+    are recorded as pending aggregation and aggregated in a single batched
+    step, once the number of pending datasets reaches
+    `datalad.hirni.aggregate.threshold` (default: 1, i.e. right away; 0
+    disables automatic aggregation). Their extracted DICOMs are kept until
+    then and dropped afterwards. This command runs all pending aggregation
+    explicitly.
+    """
+
+    _params_ = dict(
+        dataset=Parameter(
+            args=("-d", "--dataset"),
+            metavar='PATH',
+            doc="""study dataset to aggregate metadata into. If no dataset is
+            given, an attempt is made to identify the dataset based on the
+            current working directory""",
+            constraints=EnsureDataset() | EnsureNone()),
+        path=Parameter(
+            args=("path",),
+            metavar='PATH',
+            doc="""path(s) of DICOM datasets to aggregate regardless of
+            whether they are pending. By default all pending datasets are
+            aggregated.""",
+            nargs="*",
+            constraints=EnsureStr() | EnsureNone()),
+        jobs=jobs_opt,
+    )
+
+    @staticmethod
+    @datasetmethod(name='hirni_aggregate')
+    @eval_results
+    def __call__(path=None, dataset=None, jobs='auto'):
+        ds = require_dataset(dataset, check_installed=True,
+                             purpose="hirni aggregate")
+
+        path = [resolve_path(p, ds) for p in assure_list(path)] or None
+        if jobs == 'auto':
+            # let the configuration decide
+            jobs = None
+
+        lgr.debug("Pending aggregation: %s", get_pending(ds))
+        for r in run_aggregation(ds, paths=path, jobs=jobs):
+            yield r
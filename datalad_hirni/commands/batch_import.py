@@ -0,0 +1,269 @@
+"""Import many DICOM tarballs into a study dataset at once"""
+
+from glob import glob
+from os import cpu_count
+from os import makedirs
+import os.path as op
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from datalad.interface.base import build_doc, Interface
+from datalad.interface.common_opts import jobs_opt
+from datalad.interface.results import get_status_dict
+from datalad.support.constraints import EnsureStr
+from datalad.support.constraints import EnsureNone
+from datalad.support.param import Parameter
+from datalad.support.network import RI, PathRI
+from datalad.distribution.dataset import Dataset
+from datalad.distribution.dataset import datasetmethod
+from datalad.distribution.dataset import EnsureDataset
+from datalad.distribution.dataset import require_dataset
+from datalad.interface.utils import eval_results
+from datalad.utils import (
+    assure_list,
+    rmtree,
+)
+from datalad.dochelpers import exc_str
+
+from datalad_hirni.commands.import_dicoms import (
+    _create_subds_from_tarball,
+    _guess_acquisition,
+    _move_to_acquisition,
+)
+
+from datalad_hirni.support.aggregation import (
+    aggregate_if_due,
+    schedule_aggregation,
+)
+from datalad_hirni.support.maintenance import (
+    maintain_if_due,
+    schedule_maintenance,
+)
+from datalad_hirni.support.tarball_index import (
+    get_tarball_key,
+    TarballIndex,
+)
+
+import logging
+lgr = logging.getLogger('datalad.hirni.batch_import')
+
+
+def _expand_tarballs(paths):
+    """Expand glob patterns in local paths; URLs are passed on as is"""
+
+    tarballs = []
+    for p in paths:
+        if isinstance(RI(p), PathRI) and any(c in p for c in '*?['):
+            matches = sorted(glob(p))
+            if not matches:
+                lgr.warning("No tarball matches %s", p)
+            tarballs.extend(matches)
+        else:
+            tarballs.append(p)
+    return tarballs
+
+
+def _import_into_tmp(tarball, tmp_dir, target_path, extract=True):
+    """Import `tarball` into an isolated dataset beneath `tmp_dir`
+
+    This runs in a worker process and therefore only exchanges paths and
+    strings with the caller.
+
+    Returns
+    -------
+    str
+      the acquisition ID derived from the DICOM metadata
+    """
+
+    dicom_ds = _create_subds_from_tarball(tarball, tmp_dir, extract=extract)
+    return _guess_acquisition(dicom_ds, Dataset(target_path), tarball=tarball)
+
+
+@build_doc
+class BatchImportDicoms(Interface):
+    """Import many DICOM archives into a study raw dataset in parallel.
+
+    Each archive is imported into an isolated temporary dataset by a pool of
+    worker processes. The acquisition ID is derived from DICOM metadata as
+    configured by `datalad.hirni.import.acquisition-format` (see
+    hirni-import-dcm). Once all archives are imported, the new acquisitions
+    are saved to the study dataset and their metadata is aggregated into it in
+    a single step each (unless deferred, see
+    `datalad.hirni.aggregate.threshold`). Subsequently a study specification
+    is created for each acquisition via hirni-dicom2spec.
+    """
+
+    _params_ = dict(
+        dataset=Parameter(
+            args=("-d", "--dataset"),
+            metavar='PATH',
+            doc="""specify the dataset to import the DICOM archives into.  If
+            no dataset is given, an attempt is made to identify the dataset
+            based on the current working directory""",
+            constraints=EnsureDataset() | EnsureNone()),
+        path=Parameter(
+            args=("path",),
+            metavar='PATH',
+            doc="""path(s) or URL(s) of the DICOM archives to be imported.
+            Local paths may be glob patterns (quote them to prevent the shell
+            from expanding them).""",
+            nargs="+",
+            constraints=EnsureStr()),
+        properties=Parameter(
+            args=("--properties",),
+            metavar="PATH or JSON string",
+            doc="""a JSON string or a path to a JSON file, to provide
+            overrides/additions to the to be created specification snippets
+            for all imported acquisitions.""",
+            constraints=EnsureStr() | EnsureNone()),
+        no_extract=Parameter(
+            args=("--no-extract",),
+            action="store_true",
+            doc="""don't extract the archives. See hirni-import-dcm."""),
+        jobs=jobs_opt,
+    )
+
+    @staticmethod
+    @datasetmethod(name='hirni_batch_import_dcm')
+    @eval_results
+    def __call__(path, dataset=None, properties=None, no_extract=False,
+                 jobs='auto'):
+        # bound dataset methods; imported here to not slow down loading
+        # the command suite
+        import datalad_hirni.commands.dicom2spec
+
+        ds = require_dataset(dataset, check_installed=True,
+                             purpose="import DICOM sessions")
+
+        res_kwargs = dict(action='import DICOM tarball', logger=lgr)
+
+        tarballs = _expand_tarballs(assure_list(path))
+        if not tarballs:
+            yield get_status_dict(
+                status='impossible',
+                ds=ds,
+                message="no DICOM archive to import",
+                **res_kwargs)
+            return
+
+        if jobs is None or jobs == 'auto':
+            jobs = cpu_count() or 1
+
+        tmp_base = op.join(ds.path, '.git', 'datalad', 'hirni_import_batch')
+        if not op.exists(tmp_base):
+            makedirs(tmp_base)
+
+        tarball_index = TarballIndex(ds)
+
+        imported = []
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            # phase 1: skip tarballs whose content was imported before (or
+            # that occur several times in this batch)
+            keys = {t: pool.submit(get_tarball_key, t)
+                    for t in tarballs if isinstance(RI(t), PathRI)}
+            keys = {t: f.result() for t, f in keys.items()}
+            to_import = []
+            for tarball in tarballs:
+                key = keys.get(tarball)
+                known_acq = tarball_index.get(key) if key else None
+                if known_acq and op.exists(op.join(ds.path, known_acq)):
+                    yield get_status_dict(
+                        status='notneeded',
+                        path=op.join(ds.path, known_acq, 'dicoms'),
+                        type='dataset',
+                        message=("%s was imported as acquisition %s already",
+                                 tarball, known_acq),
+                        **res_kwargs)
+                elif key and key in [keys.get(t) for t in to_import]:
+                    yield get_status_dict(
+                        status='notneeded',
+                        path=tarball,
+                        type='file',
+                        message="same content as another tarball in this "
+                                "batch",
+                        **res_kwargs)
+                else:
+                    to_import.append(tarball)
+
+            # phase 2: import every tarball into its own temporary dataset
+            futures = []
+            for tarball in to_import:
+                tmp_dir = tempfile.mkdtemp(prefix='acq_', dir=tmp_base)
+                futures.append(
+                    (tarball, tmp_dir,
+                     pool.submit(_import_into_tmp, tarball, tmp_dir, ds.path,
+                                 not no_extract)))
+
+            for tarball, tmp_dir, future in futures:
+                try:
+                    acqid = future.result()
+                except Exception as e:
+                    yield get_status_dict(
+                        status='error',
+                        path=tarball,
+                        type='file',
+                        message=exc_str(e),
+                        **res_kwargs)
+                    rmtree(tmp_dir)
+                    continue
+
+                if op.lexists(op.join(ds.path, acqid)) or \
+                        acqid in [a for a, d in imported]:
+                    yield get_status_dict(
+                        status='impossible',
+                        path=tarball,
+                        type='file',
+                        message=("acquisition %s already exists", acqid),
+                        **res_kwargs)
+                    rmtree(tmp_dir)
+                    continue
+
+                if tarball in keys:
+                    tarball_index.add(keys[tarball], acqid)
+                imported.append(
+                    (acqid, _move_to_acquisition(tmp_dir, ds, acqid)))
+
+        rmtree(tmp_base)
+
+        if not imported:
+            return
+
+        # phase 3: record all new acquisitions in one go
+        to_save = [d.path for a, d in imported]
+        if op.exists(tarball_index.path):
+            to_save.append(tarball_index.path)
+        ds.save(
+            to_save,
+            to_git=True,
+            message="[HIRNI] Add aquisitions {}".format(
+                ", ".join(a for a, d in imported))
+        )
+
+        if not no_extract:
+            # aggregate metadata of all new acquisitions in one go and drop
+            # extracted DICOMs afterwards, if due (see
+            # datalad.hirni.aggregate.threshold)
+            schedule_aggregation(ds, [d.path for a, d in imported])
+            for r in aggregate_if_due(ds, jobs=jobs):
+                yield r
+
+        for acqid, dicom_ds in imported:
+            ds.hirni_dicom2spec(
+                path=dicom_ds.path,
+                spec=op.normpath(op.join(
+                    dicom_ds.path, op.pardir, "studyspec.json")),
+                acquisition=acqid,
+                properties=properties
+            )
+
+        for acqid, dicom_ds in imported:
+            yield get_status_dict(
+                status='ok',
+                path=dicom_ds.path,
+                type='dataset',
+                **res_kwargs)
+
+        # clean up git objects in bulk, if due
+        schedule_maintenance(ds, [d.path for a, d in imported])
+        for r in maintain_if_due(ds):
+            yield r
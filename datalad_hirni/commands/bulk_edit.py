@@ -0,0 +1,220 @@
+"""Edit and approve fields of many specification snippets at once"""
+
+import os.path as op
+
+from datalad.interface.base import build_doc, Interface
+from datalad.support.constraints import EnsureStr
+from datalad.support.constraints import EnsureNone
+from datalad.support.exceptions import InsufficientArgumentsError
+from datalad.support.param import Parameter
+from datalad.distribution.dataset import datasetmethod
+from datalad.distribution.dataset import EnsureDataset
+from datalad.distribution.dataset import require_dataset
+from datalad.distribution.dataset import resolve_path
+from datalad.interface.utils import eval_results
+from datalad.interface.results import get_status_dict
+from datalad.utils import assure_list
+
+from datalad_hirni.commands.catalog import _parse_match
+from datalad_hirni.support.bulk_edit import (
+    edit_file,
+    SnippetFilter,
+)
+from datalad_hirni.support.spec_catalog import find_spec_files
+from datalad_hirni.support.spec_schema import managed_fields
+
+import logging
+lgr = logging.getLogger('datalad.hirni.bulk_edit')
+
+
+@build_doc
+class BulkEdit(Interface):
+    """Set and approve fields of all matching specification snippets.
+
+    Snippets are selected across all specification files of a study dataset
+    (or the given ones) by their type, UID, field values, regular expressions
+    on field values, unapproved fields and tags. All criteria need to be met;
+    without any, every snippet is selected. Editable fields of the selected
+    snippets are then set and/or (un)approved.
+
+    Each specification file is read and written in a single pass, keeping the
+    lines of unchanged snippets as they are, and all changed files are saved
+    in a single commit. A result is reported for each file with matching
+    snippets.
+
+    Examples:
+
+      Set and approve the task label of all functional series::
+
+        % datalad hirni-bulk-edit --type dicomseries \\
+            --regex 'description=^func_task-oneback' \\
+            --set bids-task=oneback --approve bids-task
+
+      Approve all anonymized subject labels of a single acquisition::
+
+        % datalad hirni-bulk-edit --approve anon-subject acq1
+    """
+
+    _params_ = dict(
+        dataset=Parameter(
+            args=("-d", "--dataset"),
+            metavar='PATH',
+            doc="""study dataset to edit. If no dataset is given, an attempt
+            is made to identify the dataset based on the current working
+            directory""",
+            constraints=EnsureDataset() | EnsureNone()),
+        path=Parameter(
+            args=("path",),
+            metavar='PATH',
+            doc="""path(s) of specification files or acquisition directories
+            to edit. By default, the specification file at the root of the
+            dataset and the ones of all acquisitions are edited.""",
+            nargs="*",
+            constraints=EnsureStr() | EnsureNone()),
+        type=Parameter(
+            args=("--type",),
+            metavar="TYPE",
+            doc="""only edit snippets of this type, e.g. 'dicomseries'. Can
+            be a glob pattern, like 'generic_*'""",
+            constraints=EnsureStr() | EnsureNone()),
+        uid=Parameter(
+            args=("--uid",),
+            metavar="UID",
+            doc="""only edit the snippet of the series with this UID. Can be a
+            glob pattern""",
+            constraints=EnsureStr() | EnsureNone()),
+        match=Parameter(
+            args=("--match",),
+            metavar="KEY=VALUE",
+            action='append',
+            doc="""only edit snippets whose field KEY has the value VALUE,
+            e.g. 'bids-modality=bold'. Non-string values are compared by their
+            JSON representation. [CMD: This option can be given multiple times.
+            CMD][PY: Can also be a dict. PY]""",
+            constraints=EnsureStr() | EnsureNone()),
+        regex=Parameter(
+            args=("--regex",),
+            metavar="KEY=REGEX",
+            action='append',
+            doc="""only edit snippets whose field KEY has a value the regular
+            expression REGEX is found in, e.g. 'description=^func'.
+            [CMD: This option can be given multiple times. CMD][PY: Can also
+            be a dict. PY]""",
+            constraints=EnsureStr() | EnsureNone()),
+        unapproved=Parameter(
+            args=("--unapproved",),
+            metavar="KEY",
+            action='append',
+            doc="""only edit snippets having a field KEY that is not approved
+            yet. [CMD: This option can be given multiple times. CMD]""",
+            constraints=EnsureStr() | EnsureNone()),
+        tag=Parameter(
+            args=("--tag",),
+            metavar="TAG",
+            action='append',
+            doc="""only edit snippets with this tag. [CMD: This option can be
+            given multiple times. CMD]""",
+            constraints=EnsureStr() | EnsureNone()),
+        values=Parameter(
+            args=("--set",),
+            dest="values",
+            metavar="KEY=VALUE",
+            action='append',
+            doc="""set the value of the editable field KEY to VALUE. A field
+            that doesn't exist yet is added as unapproved. [CMD: VALUE is
+            taken as a string. This option can be given multiple times.
+            CMD][PY: Can also be a dict, to set values other than strings.
+            PY]""",
+            constraints=EnsureStr() | EnsureNone()),
+        approve=Parameter(
+            args=("--approve",),
+            metavar="KEY",
+            action='append',
+            doc="""approve the field KEY. [CMD: This option can be given
+            multiple times. CMD]""",
+            constraints=EnsureStr() | EnsureNone()),
+        unapprove=Parameter(
+            args=("--unapprove",),
+            metavar="KEY",
+            action='append',
+            doc="""revoke the approval of the field KEY. [CMD: This option can
+            be given multiple times. CMD]""",
+            constraints=EnsureStr() | EnsureNone()),
+    )
+
+    @staticmethod
+    @datasetmethod(name='hirni_bulk_edit')
+    @eval_results
+    def __call__(path=None, dataset=None, type=None, uid=None, match=None,
+                 regex=None, unapproved=None, tag=None, values=None,
+                 approve=None, unapprove=None):
+
+        ds = require_dataset(dataset, check_installed=True,
+                             purpose="hirni bulk edit")
+        res_kwargs = dict(action='hirni bulk edit', logger=lgr,
+                          refds=ds.path)
+
+        values = _parse_match(values)
+        approve = assure_list(approve)
+        unapprove = assure_list(unapprove)
+        if not (values or approve or unapprove):
+            raise InsufficientArgumentsError(
+                "nothing to edit; give fields to set, approve or unapprove")
+        managed = sorted(set(managed_fields).intersection(
+            list(values) + approve + unapprove))
+        if managed:
+            raise InsufficientArgumentsError(
+                "can't edit automatically managed field(s) {}".format(
+                    ", ".join(managed)))
+
+        snippet_filter = SnippetFilter(
+            type=type,
+            uid=uid,
+            match=_parse_match(match),
+            regex=_parse_match(regex),
+            unapproved=assure_list(unapproved),
+            tags=assure_list(tag))
+
+        spec_filename = ds.config.get("datalad.hirni.studyspec.filename",
+                                      "studyspec.json")
+        paths = []
+        for p in assure_list(path):
+            p = resolve_path(p, ds)
+            paths.append(op.join(p, spec_filename) if op.isdir(p) else p)
+        paths = paths or find_spec_files(ds)
+
+        to_save = []
+        n_changed = 0
+        for p in paths:
+            if not op.exists(p):
+                yield get_status_dict(
+                    status='impossible',
+                    path=p,
+                    type='file',
+                    message="specification file not found",
+                    **res_kwargs)
+                continue
+            matched, changed = edit_file(p, snippet_filter, values=values,
+                                         approve=approve,
+                                         unapprove=unapprove)
+            if not matched:
+                continue
+            if changed:
+                to_save.append(p)
+                n_changed += changed
+            yield get_status_dict(
+                status='ok' if changed else 'notneeded',
+                path=p,
+                type='file',
+                message=("%d of %d matching snippet(s) changed", changed,
+                         matched),
+                **res_kwargs)
+
+        if to_save:
+            for r in ds.save(
+                    to_save,
+                    to_git=True,
+                    message="[HIRNI] Edit {} snippet(s) in {} specification "
+                            "file(s)".format(n_changed, len(to_save)),
+                    return_type='generator'):
+                yield r
@@ -0,0 +1,139 @@
+"""Query specification snippets across an entire study dataset"""
+
+import os.path as op
+
+from datalad.interface.base import build_doc, Interface
+from datalad.support.constraints import EnsureStr
+from datalad.support.constraints import EnsureNone
+from datalad.support.exceptions import InsufficientArgumentsError
+from datalad.support.param import Parameter
+from datalad.distribution.dataset import datasetmethod
+from datalad.distribution.dataset import EnsureDataset
+from datalad.distribution.dataset import require_dataset
+from datalad.interface.utils import eval_results
+from datalad.interface.results import get_status_dict
+from datalad.utils import assure_list
+
+from datalad_hirni.support.spec_catalog import SpecCatalog
+
+import logging
+lgr = logging.getLogger('datalad.hirni.catalog')
+
+
+def _parse_match(match):
+    if isinstance(match, dict):
+        return match
+    parsed = dict()
+    for m in assure_list(match):
+        if '=' not in m:
+            raise InsufficientArgumentsError(
+                "match needs to be given as KEY=VALUE, got: {}".format(m))
+        k, v = m.split('=', 1)
+        parsed[k] = v
+    return parsed
+
+
+@build_doc
+class Catalog(Interface):
+    """Query specification snippets of all acquisitions of a study dataset.
+
+    All specification files of the study dataset (the one at its root and
+    the ones of all acquisitions) are mirrored into a SQLite database within
+    the dataset's .git directory. Only files whose content changed since the
+    last call are read again. Queries are then answered from that database,
+    rather than by parsing every specification file.
+
+    Without any filter, the catalog is updated and a result for each
+    specification file is reported. With a filter, a result is reported for
+    each matching snippet, carrying the snippet itself in a 'snippet' field.
+
+    Examples:
+
+      All series with modality bold::
+
+        % datalad hirni-catalog --type dicomseries --match bids-modality=bold
+
+      All snippets with an unapproved task label::
+
+        % datalad hirni-catalog --unapproved bids-task
+    """
+
+    _params_ = dict(
+        dataset=Parameter(
+            args=("-d", "--dataset"),
+            metavar='PATH',
+            doc="""study dataset to query. If no dataset is given, an attempt
+            is made to identify the dataset based on the current working
+            directory""",
+            constraints=EnsureDataset() | EnsureNone()),
+        type=Parameter(
+            args=("--type",),
+            metavar="TYPE",
+            doc="""only report snippets of this type, e.g. 'dicomseries'""",
+            constraints=EnsureStr() | EnsureNone()),
+        match=Parameter(
+            args=("--match",),
+            metavar="KEY=VALUE",
+            action='append',
+            doc="""only report snippets whose field KEY has the value VALUE,
+            e.g. 'bids-modality=bold'. Non-string values are compared by their
+            JSON representation. [CMD: This option can be given multiple times.
+            CMD][PY: Can also be a dict. PY]""",
+            constraints=EnsureStr() | EnsureNone()),
+        unapproved=Parameter(
+            args=("--unapproved",),
+            metavar="KEY",
+            action='append',
+            doc="""only report snippets having a field KEY that is not
+            approved yet. [CMD: This option can be given multiple times.
+            CMD]""",
+            constraints=EnsureStr() | EnsureNone()),
+        tag=Parameter(
+            args=("--tag",),
+            metavar="TAG",
+            action='append',
+            doc="""only report snippets with this tag. [CMD: This option can
+            be given multiple times. CMD]""",
+            constraints=EnsureStr() | EnsureNone()),
+    )
+
+    @staticmethod
+    @datasetmethod(name='hirni_catalog')
+    @eval_results
+    def __call__(dataset=None, type=None, match=None, unapproved=None,
+                 tag=None):
+
+        ds = require_dataset(dataset, check_installed=True,
+                             purpose="hirni catalog")
+        res_kwargs = dict(action='hirni catalog', logger=lgr,
+                          refds=ds.path)
+        match = _parse_match(match)
+        unapproved = assure_list(unapproved)
+        tag = assure_list(tag)
+        query = type or match or unapproved or tag
+
+        catalog = SpecCatalog(ds)
+        try:
+            for path, status in catalog.update():
+                if query:
+                    continue
+                yield get_status_dict(
+                    status='notneeded' if status == 'unchanged' else 'ok',
+                    path=path,
+                    type='file',
+                    message=status,
+                    **res_kwargs)
+            if not query:
+                return
+            for path, snippet in catalog.query(type=type,
+                                               match=match,
+                                               unapproved=unapproved,
+                                               tags=tag):
+                yield get_status_dict(
+                    status='ok',
+                    path=op.join(ds.path, path),
+                    type='file',
+                    snippet=snippet,
+                    **res_kwargs)
+        finally:
+            catalog.close()
@@ -0,0 +1,89 @@
+"""Serve hirni commands from a long-running process"""
+
+from datalad.interface.base import build_doc, Interface
+from datalad.support.constraints import EnsureStr
+from datalad.support.constraints import EnsureNone
+from datalad.support.param import Parameter
+from datalad.distribution.dataset import datasetmethod
+from datalad.distribution.dataset import EnsureDataset
+from datalad.distribution.dataset import require_dataset
+from datalad.dochelpers import exc_str
+from datalad.interface.utils import eval_results
+from datalad.interface.results import get_status_dict
+
+from datalad_hirni.support.daemon import HirniDaemon
+
+import logging
+lgr = logging.getLogger('datalad.hirni.daemon')
+
+
+@build_doc
+class Daemon(Interface):
+    """Run a daemon executing hirni commands submitted by `hirni-client`.
+
+    Calling hirni commands as separate processes over and over again (like an
+    automated pipeline attached to a scanner would) pays for starting python,
+    loading datalad and its extensions, reading the configuration and
+    instantiating datasets every single time. Instead, this daemon keeps a
+    process with all of that loaded (including dicom2spec rule sets) and
+    executes commands submitted by the lightweight `hirni-client` over a
+    Unix socket. Submitted commands are executed one at a time.
+
+    The daemon runs in the foreground until it receives a 'shutdown' command.
+
+    Examples:
+
+      Start a daemon for the study dataset in the current directory::
+
+        % datalad hirni-daemon &
+
+      Import a tarball and shut the daemon down::
+
+        % hirni-client import-dcm path=/data/incoming/sub-01.tar
+        % hirni-client shutdown
+
+    Arguments of the submitted command are given as KEY=VALUE, where VALUE is
+    parsed as JSON if possible. Results are reported by the client. Commands
+    are executed in the client's dataset and working directory, so that paths
+    are resolved as if the client had called the command itself.
+    """
+
+    _params_ = dict(
+        dataset=Parameter(
+            args=("-d", "--dataset"),
+            metavar='PATH',
+            doc="""study dataset to serve. Commands are executed in this
+            dataset, unless a client specifies a dataset. If no dataset is
+            given, an attempt is made to identify the dataset based on the
+            current working directory""",
+            constraints=EnsureDataset() | EnsureNone()),
+        socket=Parameter(
+            args=("-s", "--socket"),
+            metavar='PATH',
+            doc="""path of the Unix socket to listen at. By default a socket
+            within the dataset's .git directory is used. Note, that the length
+            of socket paths is rather limited on most systems.""",
+            constraints=EnsureStr() | EnsureNone()),
+    )
+
+    @staticmethod
+    @datasetmethod(name='hirni_daemon')
+    @eval_results
+    def __call__(dataset=None, socket=None):
+        ds = require_dataset(dataset, check_installed=True,
+                             purpose="hirni daemon")
+        res_kwargs = dict(action='hirni daemon', path=ds.path, type='dataset',
+                          logger=lgr)
+
+        daemon = HirniDaemon(ds, socket_path=socket)
+        try:
+            daemon.serve()
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            yield get_status_dict(status='error', message=exc_str(e),
+                                  **res_kwargs)
+            return
+        yield get_status_dict(status='ok',
+                              message=("served %d command(s)", daemon.jobs),
+                              **res_kwargs)
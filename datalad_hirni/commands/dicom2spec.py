@@ -22,16 +22,50 @@ from datalad.support.param import Parameter
 from datalad_hirni.commands.spec4anything import _get_edit_dict
 from datalad_hirni.support.spec_helpers import (
     get_specval,
-    has_specval
+    has_specval,
+    write_spec,
+)
+from datalad_hirni.support.tracing import (
+    count,
+    span,
+    traced,
 )
-
-# bound dataset method
-import datalad_metalad.dump
 
 
 lgr = logging.getLogger('datalad.hirni.dicom2spec')
 
 
+# rules classes loaded from files by path; a long-running process (like
+# hirni-daemon) doesn't need to import them again, unless they changed
+_rules_cache = dict()
+
+
+def _load_rules(file):
+    """Get the rules class defined in `file`"""
+
+    mtime = op.getmtime(file)
+    cached = _rules_cache.get(file)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    from datalad.utils import import_module_from_file
+    from datalad.dochelpers import exc_str
+    try:
+        mod = import_module_from_file(file)
+    except Exception as e:
+        # any exception means full stop
+        raise ValueError("Rules definition file at {} is broken: {}"
+                         "".format(file, exc_str(e)))
+
+    # check file's __datalad_hirni_rules for the actual class:
+    if not hasattr(mod, "__datalad_hirni_rules"):
+        raise ValueError("Rules definition file {} missed attribute "
+                         "'__datalad_hirni_rules'.".format(file))
+    rules = getattr(mod, "__datalad_hirni_rules")
+    _rules_cache[file] = (mtime, rules)
+    return rules
+
+
 class RuleSet(object):
     """Holds and applies the current rule set for deriving BIDS terms from
     DICOM metadata"""
@@ -66,20 +100,7 @@ class RuleSet(object):
                             "definition: %s", file)
                 continue
 
-            from datalad.utils import import_module_from_file
-            from datalad.dochelpers import exc_str
-            try:
-                mod = import_module_from_file(file)
-            except Exception as e:
-                # any exception means full stop
-                raise ValueError("Rules definition file at {} is broken: {}"
-                                 "".format(file, exc_str(e)))
-
-            # check file's __datalad_hirni_rules for the actual class:
-            if not hasattr(mod, "__datalad_hirni_rules"):
-                raise ValueError("Rules definition file {} missed attribute "
-                                 "'__datalad_hirni_rules'.".format(file))
-            self._rule_set.append(getattr(mod, "__datalad_hirni_rules"))
+            self._rule_set.append(_load_rules(file))
 
         if not self._rule_set:
             self._rule_set = [DefaultRules]
@@ -145,8 +166,83 @@ class RuleSet(object):
         return result_dicts
 
 
+def _get_dicom_metadata(dataset, path):
+    """Yield dataset-level metadata records for the DICOM datasets at `path`
+
+    DICOM datasets imported without extracting their tarball
+    (hirni-import-dcm --no-extract) keep the metadata derived from the DICOM
+    headers within the dataset. DICOM datasets, whose metadata wasn't
+    aggregated into `dataset` yet (see datalad.hirni.aggregate.threshold),
+    still have their DICOMs extracted, so their headers are read directly.
+    For those a record is built from that. Any other path is queried from the
+    aggregated metadata in `dataset`. Series queried from the aggregated
+    metadata are cached by the DICOM dataset's ID and refcommit (see
+    datalad.hirni.metadata-cache.max-size), so they aren't dumped again as
+    long as the DICOM dataset doesn't change.
+    """
+
+    from datalad.distribution.dataset import Dataset
+    from datalad_metalad import get_refcommit
+    from datalad_hirni.support.aggregation import get_pending
+    from datalad_hirni.support.dicom_tarball import (
+        read_series_metadata,
+        scan_dicom_dataset,
+    )
+    from datalad_hirni.support.metadata_cache import get_series_cache
+
+    cache = get_series_cache(dataset)
+    pending = None
+    to_dump = []
+    for p in path:
+        series = read_series_metadata(p)
+        if series is None:
+            if pending is None:
+                pending = get_pending(dataset)
+            if p in pending:
+                series = scan_dicom_dataset(p)
+        dicom_ds = Dataset(p)
+        dsid = refcommit = None
+        if dicom_ds.is_installed():
+            dsid = dicom_ds.id
+            refcommit = get_refcommit(dicom_ds)
+        if series is None:
+            series = cache.get(dsid, refcommit)
+        if series is None:
+            to_dump.append(p)
+            continue
+        yield dict(status='ok',
+                   path=dicom_ds.path,
+                   type='dataset',
+                   dsid=dsid,
+                   refcommit=refcommit,
+                   metadata={'dicom': {'Series': series}})
+
+    if to_dump:
+        # bound dataset method
+        import datalad_metalad.dump
+        for meta in dataset.meta_dump(
+                to_dump,
+                recursive=False,  # always False?
+                reporton='datasets',
+                return_type='generator',
+                result_renderer='disabled'):
+            series = meta.get('metadata', {}).get('dicom', {}).get('Series')
+            if meta.get('status') == 'ok' and series:
+                cache.put(meta.get('dsid'), meta.get('refcommit'), series)
+            yield meta
+
+
 def add_to_spec(ds_metadata, spec_list, basepath,
-                subject=None, anon_subject=None, session=None, overrides=None, dataset=None):
+                subject=None, anon_subject=None, session=None, overrides=None, dataset=None,
+                spec_index=None):
+    """
+    Parameters
+    ----------
+    spec_index: SpecIndex, optional
+      index of the spec file `spec_list` was loaded from. If given, existing
+      snippets of image series are looked up by means of the index, rather
+      than by scanning `spec_list`.
+    """
 
     # TODO: discover procedures and write default config into spec for more convenient editing!
     # But: Would need toolbox present to create a spec. If not - what version of toolbox to use?
@@ -187,15 +283,17 @@ def add_to_spec(ds_metadata, spec_list, basepath,
             #        if not series_is_valid(series) else [],
         })
 
-    rules_new = RuleSet(dataset=dataset)   # TODO: Pass on dataset for config access! => RF the entire thing
-    derived = rules_new.apply(ds_metadata['metadata']['dicom']['Series'],
-                              subject=subject,
-                              anon_subject=anon_subject,
-                              session=session
-                              )
+    with span('dicom2spec.rules'):
+        rules_new = RuleSet(dataset=dataset)   # TODO: Pass on dataset for config access! => RF the entire thing
+        derived = rules_new.apply(ds_metadata['metadata']['dicom']['Series'],
+                                  subject=subject,
+                                  anon_subject=anon_subject,
+                                  session=session
+                                  )
 
     # TODO: Move assertion to a test?
     assert len(derived) == len(base_list)
+    count('dicom2spec.series', len(base_list))
     for idx in range(len(base_list)):
         base_list[idx].update(derived[idx])
 
@@ -204,9 +302,13 @@ def add_to_spec(ds_metadata, spec_list, basepath,
 
         series.update(overrides)
 
-        existing = [i for s, i in
-                    zip(spec_list, range(len(spec_list)))
-                    if s['type'] == 'dicomseries' and s['uid'] == series['uid']]
+        if spec_index is not None:
+            key = spec_index.find('dicomseries', series['uid'])
+            existing = [spec_index.position(key)] if key else []
+        else:
+            existing = [i for s, i in
+                        zip(spec_list, range(len(spec_list)))
+                        if s['type'] == 'dicomseries' and s['uid'] == series['uid']]
         if existing:
             lgr.debug("Updating existing spec for image series %s",
                       series['uid'])
@@ -314,6 +416,7 @@ class Dicom2Spec(Interface):
     @staticmethod
     @datasetmethod(name='hirni_dicom2spec')
     @eval_results
+    @traced('dicom2spec')
     def __call__(path=None, spec=None, dataset=None, subject=None,
                  anon_subject=None, acquisition=None, properties=None):
 
@@ -348,15 +451,16 @@ class Dicom2Spec(Interface):
 
         spec_series_list = \
             [r for r in json_py.load_stream(spec)] if op.exists(spec) else list()
+        spec_index = None
+        if spec_series_list:
+            from datalad_hirni.support.spec_index import SpecIndex
+            spec_index = SpecIndex(spec)
 
         # get dataset level metadata:
         found_some = False
-        for meta in dataset.meta_dump(
-                path,
-                recursive=False,  # always False?
-                reporton='datasets',
-                return_type='generator',
-                result_renderer='disabled'):
+        with span('dicom2spec.metadata'):
+            metadata = list(_get_dicom_metadata(dataset, path))
+        for meta in metadata:
             if meta.get('status', None) not in ['ok', 'notneeded']:
                 yield meta
                 continue
@@ -412,7 +516,8 @@ class Dicom2Spec(Interface):
                                            # NOT a good default for bids_session!
                                            # Particularly wrt to anonymization
                                            overrides=overrides,
-                                           dataset=dataset
+                                           dataset=dataset,
+                                           spec_index=spec_index
                                            )
 
         if not found_some:
@@ -458,24 +563,26 @@ class Dicom2Spec(Interface):
         # store as a stream (one record per file) to be able to
         # easily concat files without having to parse them, or
         # process them line by line without having to fully parse them
-        from datalad_hirni.support.spec_helpers import sort_spec
-        # Note: Sorting paradigm needs to change. See above.
-        # spec_series_list = sorted(spec_series_list, key=lambda x: sort_spec(x))
-        json_py.dump2stream(spec_series_list, spec)
+        # Note: The file is written in canonical order, independent of the
+        # sorting above.
+        with span('dicom2spec.write'):
+            write_spec(spec_series_list, spec)
 
         # make sure spec is in git:
         dataset.repo.set_gitattributes([(spec,
                                          {'annex.largefiles': 'nothing'})],
                                        '.gitattributes')
 
-        for r in Save.__call__(dataset=dataset,
-                               path=[spec, '.gitattributes'],
-                               to_git=True,
-                               message="[HIRNI] Added study specification "
-                                       "snippet for %s" %
-                                       op.relpath(path[0], dataset.path),
-                               return_type='generator',
-                               result_renderer='disabled'):
+        with span('dicom2spec.save'):
+            results = Save.__call__(dataset=dataset,
+                                    path=[spec, '.gitattributes'],
+                                    to_git=True,
+                                    message="[HIRNI] Added study specification "
+                                            "snippet for %s" %
+                                            op.relpath(path[0], dataset.path),
+                                    return_type='list',
+                                    result_renderer='disabled')
+        for r in results:
             if r.get('status', None) not in ['ok', 'notneeded']:
                 yield r
             elif r['path'] in [spec, op.join(dataset.path, '.gitattributes')] \
@@ -0,0 +1,115 @@
+"""Export specification snippets of a study dataset into Parquet files"""
+
+import os.path as op
+
+from datalad.interface.base import build_doc, Interface
+from datalad.support.constraints import EnsureStr
+from datalad.support.constraints import EnsureNone
+from datalad.support.param import Parameter
+from datalad.distribution.dataset import datasetmethod
+from datalad.distribution.dataset import EnsureDataset
+from datalad.distribution.dataset import require_dataset
+from datalad.distribution.dataset import resolve_path
+from datalad.interface.utils import eval_results
+from datalad.interface.results import get_status_dict
+from datalad.utils import assure_list
+
+from datalad_hirni.support.spec_catalog import find_spec_files
+
+import logging
+lgr = logging.getLogger('datalad.hirni.export_specs')
+
+
+@build_doc
+class ExportSpecs(Interface):
+    """Export specification snippets into Parquet files for analysis.
+
+    Each specification file is exported into a Parquet file at the same
+    relative path within the target directory. All of them share the same
+    schema and together form a single table with a row per snippet, to be
+    loaded with pandas, DuckDB or any other Arrow-based tool. Automatically
+    managed fields (like 'type' or 'uid') become a column each. All other
+    fields are in the column 'fields', which maps a field's name to its
+    'value' and whether it's 'approved' (null for fields that aren't
+    editable). Values are stored as strings; non-string values in their JSON
+    representation.
+
+    Calling this again on the same target refreshes the export, only
+    rewriting the Parquet files of specification files that changed and
+    removing those of specification files that vanished. Snippets are
+    exported in batches, so memory use is independent of the size of the
+    study.
+
+    This requires the 'pyarrow' package.
+
+    Examples:
+
+      Export all specifications of the current study dataset::
+
+        % datalad hirni-export-specs /tmp/specs
+
+      Load them into pandas::
+
+        >>> pandas.read_parquet('/tmp/specs')
+    """
+
+    _params_ = dict(
+        dataset=Parameter(
+            args=("-d", "--dataset"),
+            metavar='PATH',
+            doc="""study dataset to export. If no dataset is given, an attempt
+            is made to identify the dataset based on the current working
+            directory""",
+            constraints=EnsureDataset() | EnsureNone()),
+        target=Parameter(
+            args=("target",),
+            metavar='TARGET',
+            doc="""directory to export into""",
+            constraints=EnsureStr()),
+        path=Parameter(
+            args=("-p", "--path"),
+            metavar='PATH',
+            action='append',
+            doc="""path of a specification file to export. By default, the
+            specification file at the root of the dataset and the ones of
+            all acquisitions are exported, and the exports of specification
+            files that don't exist anymore are removed. [CMD: This option can
+            be given multiple times. CMD]""",
+            constraints=EnsureStr() | EnsureNone()),
+    )
+
+    @staticmethod
+    @datasetmethod(name='hirni_export_specs')
+    @eval_results
+    def __call__(target, dataset=None, path=None):
+
+        ds = require_dataset(dataset, check_installed=True,
+                             purpose="hirni export specs")
+        res_kwargs = dict(action='hirni export specs', logger=lgr,
+                          refds=ds.path)
+
+        try:
+            import pyarrow
+        except ImportError:
+            yield get_status_dict(
+                status='impossible',
+                path=ds.path,
+                type='dataset',
+                message="exporting to Parquet requires the 'pyarrow' "
+                        "package",
+                **res_kwargs)
+            return
+
+        from datalad_hirni.support.spec_export import export_specs
+
+        target = op.abspath(op.expanduser(target))
+        paths = [resolve_path(p, ds) for p in assure_list(path)]
+        for p, status, n in export_specs(ds.path, paths or find_spec_files(ds),
+                                         target, full=not paths):
+            yield get_status_dict(
+                status='notneeded' if status == 'unchanged' else 'ok',
+                path=p,
+                type='file',
+                message=(status if n is None
+                         else ("%s: %d snippet(s)", status, n)),
+                **res_kwargs)
@@ -5,6 +5,7 @@ from os import makedirs
 from os import rename
 import os.path as op
 import shutil
+import tempfile
 from datalad.consts import ARCHIVES_SPECIAL_REMOTE
 from datalad.consts import DATALAD_SPECIAL_REMOTES_UUIDS
 from datalad.interface.base import build_doc, Interface
@@ -18,24 +19,122 @@ from datalad.distribution.dataset import datasetmethod
 from datalad.distribution.dataset import EnsureDataset
 from datalad.distribution.dataset import require_dataset
 from datalad.interface.utils import eval_results
-from datalad.utils import (
-    rmtree,
-    with_pathsep
-)
+from datalad.utils import rmtree
 from datalad.dochelpers import exc_str
 
+from datalad_hirni.support.dicom_tarball import (
+    get_first_dicom_header,
+    read_series_metadata,
+    scan_tarball,
+    series_metadata_file,
+    write_series_metadata,
+)
+from datalad_hirni.support.aggregation import (
+    aggregate_if_due,
+    schedule_aggregation,
+)
+from datalad_hirni.support.maintenance import (
+    maintain_if_due,
+    schedule_maintenance,
+)
+from datalad_hirni.support.metadata_cache import get_series_cache
+from datalad_hirni.support.tarball_index import (
+    get_tarball_key,
+    TarballIndex,
+)
+from datalad_hirni.support.tracing import (
+    count,
+    span,
+    traced,
+)
+
 # bound dataset method
-import datalad_hirni.commands.dicom2spec
-import datalad_metalad.aggregate
-import datalad_metalad.dump
-import datalad.interface.download_url
 
 import logging
 lgr = logging.getLogger('datalad.hirni.import_dicoms')
 
 
+def _get_annex_backend(ds, path):
+    """Get the git-annex backend for `path` configured in `ds`'s .gitattributes
+
+    Defaults to the one configured via git (annex.backend) or git-annex's
+    default (SHA256E).
+    """
+
+    out, _ = ds.repo._git_custom_command(
+        [], ['git', 'check-attr', 'annex.backend', '--', path])
+    backend = out.strip().rsplit(': ', 1)[-1]
+    if backend in ('unspecified', 'unset', 'set', ''):
+        backends = ds.config.get('annex.backend', None) or \
+            ds.config.get('annex.backends', None)
+        backend = backends.split()[0] if backends else 'SHA256E'
+    return backend
+
+
+def _register_tarball_content(target_ds, filename):
+    """Register the content of an archive without extracting it
+
+    Every regular file within the archive is annexed under a key computed
+    from its content while streaming through the archive. A datalad-archives
+    URL pointing into the archive is registered for each key, so the actual
+    files can be obtained via `datalad get` later on. DICOM headers are parsed
+    along the way.
+
+    Parameters
+    ----------
+    target_ds: Dataset
+    filename: str
+      path of the (annexed) archive relative to `target_ds`
+
+    Returns
+    -------
+    list of dict
+      metadata of the DICOM series within the archive
+    """
+
+    from datalad.customremotes.archives import ArchiveAnnexCustomRemote
+
+    # keys of the same content need to match those of extracted archives,
+    # i.e. be computed by the backend configured for the dataset
+    members, series = scan_tarball(op.join(target_ds.path, filename),
+                                   backend=_get_annex_backend(target_ds,
+                                                              filename))
+
+    archive_key = target_ds.repo.get_file_key(filename)
+    annexarchive = ArchiveAnnexCustomRemote(path=target_ds.path,
+                                            persistent_cache=True)
+
+    # feed all members to git-annex in batch mode; register URLs first, since
+    # `fromkey` refuses keys that aren't known to be available anywhere
+    with tempfile.TemporaryFile(mode='w+') as urls, \
+            tempfile.TemporaryFile(mode='w+') as keys:
+        for path, size, key in members:
+            urls.write("{} {}\n".format(
+                key, annexarchive.get_file_url(archive_key=archive_key,
+                                               file=path,
+                                               size=size)))
+            keys.write("{} {}\n".format(key, path))
+        for annex_cmd, stdin in [('registerurl', urls), ('fromkey', keys)]:
+            stdin.seek(0)
+            target_ds.repo._run_annex_command(annex_cmd,
+                                              annex_options=['--batch'],
+                                              stdin=stdin)
+
+    # as add_archive_content(delete=True) would do:
+    target_ds.repo.remove(filename)
+
+    return series
+
+
 # TODO: Commit-Message to contain hint on the imported tarball
-def _import_dicom_tarball(target_ds, tarball, filename):
+def _import_dicom_tarball(target_ds, tarball, filename, extract=True):
+    """Import `tarball` into `target_ds`
+
+    Returns
+    -------
+    list of dict or None
+      DICOM series metadata if the tarball wasn't extracted, None otherwise
+    """
 
     # # TODO: doesn't work for updates yet:
     # # - branches are expected to not exist yet
@@ -49,12 +148,15 @@ def _import_dicom_tarball(target_ds, tarball, filename):
                      DATALAD_SPECIAL_REMOTES_UUIDS[ARCHIVES_SPECIAL_REMOTE])
                  ])
 
-    if isinstance(RI(tarball), PathRI):
-        shutil.copy2(tarball, op.join(target_ds.path, filename))
-        target_ds.repo.add(filename)
+    with span('import.copy'):
+        if isinstance(RI(tarball), PathRI):
+            shutil.copy2(tarball, op.join(target_ds.path, filename))
+            target_ds.repo.add(filename)
+            count('import.bytes', op.getsize(tarball))
 
-    else:
-        target_ds.repo.add_url_to_file(file_=filename, url=tarball, batch=False)
+        else:
+            target_ds.repo.add_url_to_file(file_=filename, url=tarball,
+                                           batch=False)
 
     target_ds.repo.commit(msg="Retrieved %s" % tarball)
     target_ds.repo.checkout('incoming-processed', options=['--orphan'])
@@ -65,32 +167,42 @@ def _import_dicom_tarball(target_ds, tarball, filename):
                          expect_stderr=True)
     target_ds.repo._git_custom_command([], "git read-tree -m -u incoming")
 
-    from datalad.coreapi import add_archive_content
-    # # TODO: Reconsider value of --existing
-    add_archive_content(archive=filename,
-                        annex=target_ds.repo,
-                        existing='archive-suffix',
-                        delete=True,
-                        commit=False,
-                        allow_dirty=True)
+    series = None
+    with span('import.extract'):
+        if extract:
+            from datalad.coreapi import add_archive_content
+            # # TODO: Reconsider value of --existing
+            add_archive_content(archive=filename,
+                                annex=target_ds.repo,
+                                existing='archive-suffix',
+                                delete=True,
+                                commit=False,
+                                allow_dirty=True)
+            target_ds.repo.commit(msg="Extracted %s" % tarball)
+        else:
+            series = _register_tarball_content(target_ds, filename)
+            target_ds.repo.commit(msg="Registered content of %s" % tarball)
 
-    target_ds.repo.commit(msg="Extracted %s" % tarball)
     target_ds.repo.checkout('master')
     target_ds.repo.merge('incoming-processed', options=["--allow-unrelated"])
 
+    return series
 
-def _create_subds_from_tarball(tarball, targetdir):
+
+def _create_subds_from_tarball(tarball, targetdir, extract=True):
 
     filename = op.basename(tarball)
 
-    importds = Dataset(op.join(targetdir, "dicoms")).create(
-        return_type='item-or-list',
-        result_xfm='datasets',
-        result_filter=EnsureKeyChoice('action', ('create',)) \
-        & EnsureKeyChoice('status', ('ok', 'notneeded'))
-    )
+    with span('import.create'):
+        importds = Dataset(op.join(targetdir, "dicoms")).create(
+            return_type='item-or-list',
+            result_xfm='datasets',
+            result_filter=EnsureKeyChoice('action', ('create',)) \
+            & EnsureKeyChoice('status', ('ok', 'notneeded'))
+        )
 
-    _import_dicom_tarball(importds, tarball, filename)
+    series = _import_dicom_tarball(importds, tarball, filename,
+                                   extract=extract)
 
     importds.config.add(
         var="datalad.metadata.nativetype",
@@ -108,46 +220,117 @@ def _create_subds_from_tarball(tarball, targetdir):
         var="datalad.metadata.maxfieldsize",
         value='10000000',
         where="dataset")
-    importds.save(op.join(".datalad", "config"),
+    to_save = [op.join(".datalad", "config")]
+    if series is not None:
+        # without extracted DICOMs, there's nothing to extract metadata from
+        # later on. Keep what we got from the headers instead:
+        write_series_metadata(importds.path, series)
+        to_save.append(series_metadata_file)
+    importds.save(to_save,
+                  to_git=True,
                   message="[HIRNI] initial config for DICOM metadata")
 
     return importds
 
 
-def _guess_acquisition_and_move(ds, target_ds):
+def _guess_acquisition(ds, target_ds, tarball=None):
+    """Derive an acquisition ID for `ds` from its DICOM metadata
 
-    ds.meta_aggregate()
-    res = ds.meta_dump(
-        reporton='datasets',
-        return_type='item-or-list',
-        result_renderer='disabled')
-    # there should be exactly one result and therefore a dict
-    assert isinstance(res, dict)
+    The format is read from `target_ds`' configuration
+    (datalad.hirni.import.acquisition-format). If the local `tarball` `ds` was
+    created from is given, the header of a single DICOM image from it is
+    used. Only otherwise DICOM metadata of `ds` needs to be aggregated.
+    """
 
     # TODO: Move default to config definition
     #       This requires a general mechanism to plugin an extension's config specs
     format_string = \
         target_ds.config.get("datalad.hirni.import.acquisition-format", default="{PatientID}")
-    # Note: simply the metadata dict for first Series herein is passed into
-    # format ATM.
+    if '{' not in format_string:
+        return format_string
+
+    # Note: simply the metadata dict for first Series (or image) herein is
+    # passed into format ATM.
     # TODO: Eventually make entire result from `metadata` available.
     # (unify implementation with datalad's --output-format)
-    if '{' in format_string:
-        ses = format_string.format(**res['metadata']['dicom']['Series'][0])
-    else:
-        ses = format_string
+    header = None
+    series = read_series_metadata(ds.path)
+    if series:
+        header = series[0]
+    elif tarball and isinstance(RI(tarball), PathRI):
+        with span('import.header'):
+            header = get_first_dicom_header(tarball)
+    if header is None:
+        from datalad_metalad import get_refcommit
+        cache = get_series_cache(target_ds)
+        refcommit = get_refcommit(ds)
+        series = cache.get(ds.id, refcommit)
+        if series is None:
+            # bound dataset methods
+            import datalad_metalad.aggregate
+            import datalad_metalad.dump
+            with span('import.metadata'):
+                ds.meta_aggregate()
+                res = ds.meta_dump(
+                    reporton='datasets',
+                    return_type='item-or-list',
+                    result_renderer='disabled')
+            # there should be exactly one result and therefore a dict
+            assert isinstance(res, dict)
+            series = res['metadata']['dicom']['Series']
+            cache.put(ds.id, refcommit, series)
+        header = series[0]
+
+    return format_string.format(**header)
+
+
+def _move_to_acquisition(src_dir, target_ds, ses):
+    """Move an imported acquisition directory into place
+
+    Parameters
+    ----------
+    src_dir: str
+      temporary directory containing the 'dicoms' subdataset
+    target_ds: Dataset
+      study dataset
+    ses: str
+      acquisition ID; used as the path relative to `target_ds`
+
+    Returns
+    -------
+    Dataset
+      the moved DICOM dataset
+    """
 
     # `ses` might consist of several levels, so `rename` doesn't always
     # automatically create the target dir:
     if not op.lexists(op.dirname(ses)):
         makedirs(op.join(target_ds.path, ses))
 
-    rename(op.join(target_ds.path, '.git', 'datalad', 'hirni_import'),
-           op.join(target_ds.path, ses))
+    rename(src_dir, op.join(target_ds.path, ses))
 
     return Dataset(op.join(target_ds.path, ses, 'dicoms'))
 
 
+def _guess_acquisition_and_move(ds, target_ds, tarball=None):
+
+    ses = _guess_acquisition(ds, target_ds, tarball=tarball)
+    return _move_to_acquisition(op.dirname(ds.path), target_ds, ses)
+
+
+def _drop_extracted(path):
+    """Drop extracted DICOMs of the dataset at `path`
+
+    Takes a path rather than a Dataset, so it can be handed to worker
+    processes.
+    """
+
+    dicom_ds = Dataset(path)
+    # We have the tarball and can drop extracted stuff:
+    dicom_ds.drop([f for f in listdir(dicom_ds.path)
+                   if f != ".datalad" and f != ".git"])
+
+
 @build_doc
 class ImportDicoms(Interface):
     """Import a DICOM archive into a study raw dataset.
@@ -202,16 +385,50 @@ class ImportDicoms(Interface):
             overrides/additions to the to be created specification snippets for this acquisition.
             """,
             constraints=EnsureStr() | EnsureNone()),
-
+        no_extract=Parameter(
+            args=("--no-extract",),
+            action="store_true",
+            doc="""don't extract the archive. Instead its content is
+            registered with git-annex while streaming through the archive and
+            DICOM metadata is read from the headers along the way. Nothing but
+            the archive itself is written to disk. Extracted files can still
+            be obtained via `datalad get` later on. Note, that DICOM metadata
+            is then kept within the DICOM dataset and not aggregated into the
+            study dataset."""),
     )
 
     @staticmethod
     @datasetmethod(name='hirni_import_dcm')
     @eval_results
+    @traced('import')
     def __call__(path, acqid=None, dataset=None,
-                 subject=None, anon_subject=None, properties=None):
+                 subject=None, anon_subject=None, properties=None,
+                 no_extract=False):
+        # bound dataset methods; imported here to not slow down loading
+        # the command suite
+        import datalad_hirni.commands.dicom2spec
+        import datalad.interface.download_url
+
         ds = require_dataset(dataset, check_installed=True,
                              purpose="import DICOM session")
+
+        # look up the tarball's content in what was imported before:
+        tarball_index = TarballIndex(ds)
+        tarball_key = None
+        if isinstance(RI(path), PathRI):
+            with span('import.hash'):
+                tarball_key = get_tarball_key(path)
+            known_acq = tarball_index.get(tarball_key)
+            if known_acq and op.exists(op.join(ds.path, known_acq)):
+                yield dict(status='notneeded',
+                           path=op.join(ds.path, known_acq, 'dicoms'),
+                           type='dataset',
+                           action='import DICOM tarball',
+                           logger=lgr,
+                           message=("%s was imported as acquisition %s "
+                                    "already", path, known_acq))
+                return
+
         if acqid:
             # acquisition was specified => we know where to create subds
             acq_dir = op.join(ds.path, acqid)
@@ -219,7 +436,8 @@ class ImportDicoms(Interface):
                 makedirs(acq_dir)
             # TODO: if exists: needs to be empty?
 
-            dicom_ds = _create_subds_from_tarball(path, acq_dir)
+            dicom_ds = _create_subds_from_tarball(path, acq_dir,
+                                                  extract=not no_extract)
 
         else:
             # we don't know the acquisition id yet => create in tmp
@@ -229,8 +447,10 @@ class ImportDicoms(Interface):
             # TODO: don't assert; check and adapt instead
 
             try:
-                dicom_ds = _create_subds_from_tarball(path, acq_dir)
-                dicom_ds = _guess_acquisition_and_move(dicom_ds, ds)
+                dicom_ds = _create_subds_from_tarball(path, acq_dir,
+                                                  extract=not no_extract)
+                dicom_ds = _guess_acquisition_and_move(dicom_ds, ds,
+                                                       tarball=path)
             except OSError as e:
                 # TODO: Was FileExistsError. Find more accurate PY2/3 solution
                 # than just OSError
@@ -248,14 +468,27 @@ class ImportDicoms(Interface):
                     rmtree(acq_dir)
 
         acqid = op.basename(op.dirname(dicom_ds.path))
-        ds.save(
-            dicom_ds.path,
-            message="[HIRNI] Add aquisition {}".format(acqid)
-        )
-
-        # Note: use path with trailing slash to indicate we want metadata about the content of this subds,
-        # not the subds itself.
-        ds.meta_aggregate(with_pathsep(dicom_ds.path), into='top')
+        to_save = [dicom_ds.path]
+        if tarball_key:
+            tarball_index.add(tarball_key,
+                              op.relpath(op.dirname(dicom_ds.path), ds.path))
+            to_save.append(tarball_index.path)
+        with span('import.save'):
+            ds.save(
+                to_save,
+                to_git=True,
+                message="[HIRNI] Add aquisition {}".format(acqid)
+            )
+
+        if not no_extract:
+            # aggregate metadata and drop extracted DICOMs afterwards; this is
+            # deferred until enough datasets are pending (see
+            # datalad.hirni.aggregate.threshold):
+            schedule_aggregation(ds, [dicom_ds.path])
+            with span('import.aggregate'):
+                results = list(aggregate_if_due(ds))
+            for r in results:
+                yield r
 
         ds.hirni_dicom2spec(
             path=dicom_ds.path,
@@ -267,14 +500,15 @@ class ImportDicoms(Interface):
             properties=properties
         )
 
-        # TODO: This should probably be optional
-        # We have the tarball and can drop extracted stuff:
-        dicom_ds.drop([f for f in listdir(dicom_ds.path)
-                       if f != ".datalad" and f != ".git"])
-
-        # finally clean up git objects:
-        dicom_ds.repo.cmd_call_wrapper.run(['git', 'gc'])
+        # finally clean up git objects; this is deferred until enough datasets
+        # are pending (see datalad.hirni.maintenance.threshold):
+        schedule_maintenance(ds, [dicom_ds.path])
+        with span('import.maintenance'):
+            results = list(maintain_if_due(ds))
+        for r in results:
+            yield r
 
+        count('import.acquisitions')
         # TODO: yield error results etc.
         yield dict(
             status='ok',
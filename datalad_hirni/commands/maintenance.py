@@ -0,0 +1,72 @@
+"""Run deferred git maintenance on datasets within a study dataset"""
+
+from datalad.interface.base import build_doc, Interface
+from datalad.interface.common_opts import jobs_opt
+from datalad.support.constraints import EnsureStr
+from datalad.support.constraints import EnsureNone
+from datalad.support.param import Parameter
+from datalad.distribution.dataset import datasetmethod
+from datalad.distribution.dataset import EnsureDataset
+from datalad.distribution.dataset import require_dataset
+from datalad.distribution.dataset import resolve_path
+from datalad.interface.utils import eval_results
+from datalad.utils import assure_list
+
+from datalad_hirni.support.maintenance import (
+    get_pending,
+    run_maintenance,
+)
+
+import logging
+lgr = logging.getLogger('datalad.hirni.maintenance')
+
+
+@build_doc
+class Maintenance(Interface):
+    """Run pending git maintenance on datasets of a study dataset.
+
+    Importing DICOMs doesn't necessarily clean up git objects of the created
+    DICOM datasets right away. Instead those datasets are recorded as pending
+    maintenance and `git gc` is run on all of them in bulk, once the number of
+    pending datasets reaches `datalad.hirni.maintenance.threshold` (default:
+    1, i.e. right away; 0 disables automatic maintenance). This command runs
+    all pending maintenance explicitly.
+
+    A dataset is only repacked if it has more than
+    `datalad.hirni.maintenance.max-loose-objects` (default: 0) loose objects
+    or more than `datalad.hirni.maintenance.max-packs` (default: 1) packs.
+    """
+
+    _params_ = dict(
+        dataset=Parameter(
+            args=("-d", "--dataset"),
+            metavar='PATH',
+            doc="""study dataset to run maintenance for. If no dataset is
+            given, an attempt is made to identify the dataset based on the
+            current working directory""",
+            constraints=EnsureDataset() | EnsureNone()),
+        path=Parameter(
+            args=("path",),
+            metavar='PATH',
+            doc="""path(s) of datasets to maintain regardless of whether they
+            are pending. By default all pending datasets are maintained.""",
+            nargs="*",
+            constraints=EnsureStr() | EnsureNone()),
+        jobs=jobs_opt,
+    )
+
+    @staticmethod
+    @datasetmethod(name='hirni_maintenance')
+    @eval_results
+    def __call__(path=None, dataset=None, jobs='auto'):
+        ds = require_dataset(dataset, check_installed=True,
+                             purpose="hirni maintenance")
+
+        path = [resolve_path(p, ds) for p in assure_list(path)] or None
+        if jobs == 'auto':
+            # let the configuration decide
+            jobs = None
+
+        lgr.debug("Pending maintenance: %s", get_pending(ds))
+        for r in run_maintenance(ds, paths=path, jobs=jobs):
+            yield r
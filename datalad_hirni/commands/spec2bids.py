@@ -2,12 +2,18 @@
 
 __docformat__ = 'restructuredtext'
 
+from concurrent.futures import as_completed
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from os import makedirs
 import os.path as op
 from os.path import isabs
 from os.path import join as opj
 from os.path import basename
 from os.path import lexists
 from os.path import relpath
+from shlex import quote
+import tempfile
 
 from datalad.interface.base import Interface
 from datalad.interface.base import build_doc
@@ -18,6 +24,7 @@ from datalad.distribution.dataset import require_dataset
 from datalad.distribution.dataset import resolve_path
 from datalad.interface.results import get_status_dict
 from datalad.interface.utils import eval_results
+from datalad.support.constraints import EnsureInt
 from datalad.support.constraints import EnsureStr
 from datalad.support.constraints import EnsureNone
 from datalad.support.exceptions import InsufficientArgumentsError
@@ -25,18 +32,330 @@ from datalad.support.json_py import load_stream
 from datalad.utils import assure_list
 from datalad.utils import rmtree
 from datalad.config import anything2bool
+from datalad.dochelpers import exc_str
 
-from datalad.coreapi import remove
-from datalad_container import containers_run
 import logging
+from datalad_hirni.support.container_pool import get_container_pool
+from datalad_hirni.support.hirni_heuristic import get_series_groups
+from datalad_hirni.support.manifest import (
+    find_manifests,
+    get_manifest_path,
+    select_files,
+    verify_manifest,
+    write_manifest,
+)
+from datalad_hirni.support.relabel import relabel_files
+from datalad_hirni.support.run_records import (
+    format_run_record,
+    parse_commit_message,
+)
+from datalad_hirni.support.sandbox import (
+    create_sandbox,
+    merge_sandbox,
+    record_annexed_content,
+    relocate_results,
+)
+from datalad_hirni.support.scheduler import (
+    add_dependencies,
+    default_type_order,
+    get_type_rank,
+    ProcedureTask,
+    run_tasks,
+)
 from datalad_hirni.support.spec_helpers import (
     get_specval,
-    has_specval
+    has_specval,
+    load_stream_of_type,
+)
+from datalad_hirni.support.tracing import (
+    count,
+    span,
+    traced,
 )
 
 lgr = logging.getLogger("datalad.hirni.spec2bids")
 
 
+def _run_procedure(ds_path, proc_name, env):
+    """Run procedure `proc_name` in a worker process with `env` patched in
+
+    Returns
+    -------
+    list of dict
+      results of the procedure run
+    """
+
+    from unittest.mock import patch
+    from datalad.distribution.dataset import Dataset
+
+    with patch.dict('os.environ', env):
+        ds = Dataset(ds_path)
+        ds.config.reload()
+        # loggers of results don't need to travel back
+        return [{k: v for k, v in r.items() if k != 'logger'}
+                for r in ds.run_procedure(spec=proc_name,
+                                          on_failure='ignore',
+                                          return_type='generator',
+                                          result_renderer='disabled')]
+
+
+def _run_procedure_isolated(ds_path, proc_name, env, sandbox_dir,
+                            unsaved=False):
+    """Run procedure `proc_name` in a worker process in a sandbox
+
+    The sandbox is a clone of the dataset at `ds_path` within `sandbox_dir`
+    (see `datalad_hirni.support.sandbox`), starting from the changes not
+    saved in the dataset, if `unsaved` is True.
+
+    Returns
+    -------
+    tuple
+      path of the sandbox, the commit the run started from and the results
+      of the procedure run
+    """
+
+    path = tempfile.mkdtemp(prefix='sandbox_', dir=sandbox_dir)
+    sandbox = create_sandbox(ds_path, path, unsaved=unsaved)
+    base = sandbox.repo.get_hexsha()
+    return path, base, relocate_results(
+        _run_procedure(path, proc_name, env), path, ds_path)
+
+
+def _make_sandbox_dir(dataset):
+    """Create a directory for the sandboxes of concurrent procedure runs"""
+
+    top = op.join(dataset.path, '.git', 'datalad', 'hirni_sandboxes')
+    if not op.exists(top):
+        makedirs(top)
+    return tempfile.mkdtemp(dir=top)
+
+
+def _merge_isolated(dataset, run, save=True):
+    """Yield the results of an isolated run and replay it in `dataset`
+
+    Parameters
+    ----------
+    dataset: Dataset
+    run: tuple
+      as returned by `_run_procedure_isolated`
+    save: bool, optional
+      whether to save the replayed commits (see `merge_sandbox`)
+    """
+
+    sandbox_path, base, run_results = run
+    for r in run_results:
+        yield r
+    for r in merge_sandbox(dataset, sandbox_path, base, save=save):
+        yield r
+
+
+def _run_procedure_groups(dataset, proc_name, env, groups):
+    """Run procedure `proc_name` once per group of series in parallel
+
+    Each run gets the UIDs of its group's series passed via the environment
+    variable HIRNI_SERIES_UIDS. Runs are isolated in sandboxes, whose commits
+    are replayed in `dataset` one run after another, as they finish.
+    """
+
+    sandbox_dir = _make_sandbox_dir(dataset)
+    try:
+        with ProcessPoolExecutor(max_workers=len(groups)) as pool:
+            futures = [pool.submit(_run_procedure_isolated, dataset.path,
+                                   proc_name,
+                                   dict(env, HIRNI_SERIES_UIDS=' '.join(uids)),
+                                   sandbox_dir)
+                       for uids in groups]
+            for future in as_completed(futures):
+                try:
+                    for r in _merge_isolated(dataset, future.result()):
+                        yield r
+                except Exception as e:
+                    yield get_status_dict(
+                        action=proc_name,
+                        path=dataset.path,
+                        type='dataset',
+                        status='error',
+                        message=exc_str(e),
+                        logger=lgr)
+    finally:
+        rmtree(sandbox_dir)
+
+
+def _get_conversion_result(proc_name, spec_path, snippet, run_results):
+    if not all(r['status'] in ['ok', 'notneeded'] for r in run_results):
+        count('spec2bids.procedure_failures')
+        return {'action': proc_name,
+                'path': spec_path,
+                'snippet': snippet,
+                'status': 'error',
+                'message': "acquisition conversion failed. "
+                           "See previous message(s)."}
+    return {'action': proc_name,
+            'path': spec_path,
+            'snippet': snippet,
+            'status': 'ok',
+            'message': "acquisition converted."}
+
+
+def _get_squash_cmd(specs, anonymize, only_type, manifest):
+    """Get the command line re-executing a conversion with --squash"""
+
+    cmd = ['datalad', 'hirni-spec2bids', '--squash']
+    if anonymize:
+        cmd.append('--anonymize')
+    if only_type:
+        cmd.extend(['--only-type', only_type])
+    if manifest:
+        cmd.append('--manifest')
+    return ' '.join(quote(a) for a in cmd + specs)
+
+
+def _get_committed_files(dataset, start):
+    """Get the files (relative to `dataset`) committed since `start`"""
+
+    out, _ = dataset.repo._git_custom_command(
+        [], ['git', 'diff', '--name-only', '-z', '--no-renames',
+             '--diff-filter=d', start, 'HEAD'])
+    return [f for f in out.split('\0') if f]
+
+
+def _verify(dataset, manifests, jobs):
+    """Check the BIDS files of `dataset` against `manifests`"""
+
+    for manifest in manifests:
+        res_kwargs = dict(action='hirni verify', logger=lgr)
+        if not op.exists(manifest):
+            yield get_status_dict(
+                path=manifest,
+                type='file',
+                status='impossible',
+                message="no manifest; convert with --manifest first",
+                **res_kwargs)
+            continue
+        try:
+            with span('spec2bids.verify'):
+                checked = verify_manifest(dataset.path, manifest, jobs=jobs)
+        except (ImportError, KeyError, ValueError) as e:
+            yield get_status_dict(
+                path=manifest,
+                type='file',
+                status='impossible',
+                message=("can't read manifest: %s", exc_str(e)),
+                **res_kwargs)
+            continue
+        failed = 0
+        for f, state in sorted(checked.items()):
+            if state != 'ok':
+                failed += 1
+                yield get_status_dict(
+                    path=op.join(dataset.path, f),
+                    type='file',
+                    status='error',
+                    message=state,
+                    **res_kwargs)
+        yield get_status_dict(
+            path=manifest,
+            type='file',
+            status='error' if failed else 'ok',
+            message=("%d of %d file(s) missing or modified", failed,
+                     len(checked)),
+            **res_kwargs)
+
+
+def _get_reuse_key(snippet):
+    """Get (subject, session) of `snippet`, whose conversion may be reused"""
+
+    return tuple(get_specval(snippet, k) if has_specval(snippet, k) else None
+                 for k in ('subject', 'bids-session'))
+
+
+def _reuse_conversion(dataset, src_path, snippet, reused, save=True):
+    """Copy the files converted for `snippet`'s subject (session) relabeled
+
+    If they can't be copied without revealing the subject's identity (see
+    `relabel_files`), nothing is copied and the snippet is to be converted
+    the regular way. The 'ok' result lists the copied files (relative to
+    `dataset`) under 'files'.
+
+    Parameters
+    ----------
+    dataset: Dataset
+      BIDS dataset to copy to
+    src_path: str
+      BIDS dataset converted without anonymization
+    snippet: dict
+    reused: dict
+      (subject, session) -> whether its converted files were copied; updated
+    save: bool, optional
+      whether to save the copied files
+    """
+
+    from datalad.distribution.dataset import Dataset
+
+    subject, session = key = _get_reuse_key(snippet)
+    anon_subject = get_specval(snippet, 'anon-subject') \
+        if has_specval(snippet, 'anon-subject') else None
+    if not subject or not anon_subject or key in reused:
+        return
+    reused[key] = False
+
+    # Note: paths and messages must not reveal the non-anonymized subject
+    res_kwargs = dict(action='hirni reuse conversion', type='directory',
+                      logger=lgr)
+    path = op.join(dataset.path, 'sub-{}'.format(anon_subject))
+    src = op.join(src_path, 'sub-{}'.format(subject))
+    if session:
+        path = op.join(path, 'ses-{}'.format(session))
+        src = op.join(src, 'ses-{}'.format(session))
+    if not op.isdir(src):
+        yield get_status_dict(
+            path=path,
+            status='impossible',
+            message="no converted files to reuse; converting instead",
+            **res_kwargs)
+        return
+
+    src_ds = Dataset(src_path)
+    if src_ds.is_installed():
+        src_ds.get(src, on_failure='ignore', return_type='list',
+                   result_renderer='disabled')
+    try:
+        with span('spec2bids.reuse'):
+            copied = relabel_files(src_path, dataset.path, subject,
+                                   anon_subject, session=session)
+    except ValueError as e:
+        # Note: the message doesn't reveal the label
+        yield get_status_dict(
+            path=path,
+            status='impossible',
+            message=("can't reuse converted files (%s); converting instead",
+                     e),
+            **res_kwargs)
+        return
+    except (IOError, OSError) as e:
+        # Note: not the exception itself, which may name a source path
+        yield get_status_dict(
+            path=path,
+            status='error',
+            message=("failed to reuse converted files; converting instead: "
+                     "%s", e.strerror or e.__class__.__name__),
+            **res_kwargs)
+        return
+    reused[key] = True
+    if save:
+        for r in dataset.save(
+                copied,
+                message="[HIRNI] Reuse converted files for anonymized subject",
+                return_type='generator'):
+            yield r
+    yield get_status_dict(
+        path=path,
+        status='ok',
+        message=("reused %d converted file(s)", len(copied)),
+        files=[relpath(p, dataset.path) for p in copied],
+        **res_kwargs)
+
+
 @build_doc
 class Spec2Bids(Interface):
     """Convert to BIDS based on study specification
@@ -67,18 +386,143 @@ class Spec2Bids(Interface):
             to use 'anon_subject' instead of 'subject' from spec and to use 
             datalad-run with a sidecar file, to not leak potentially identifying 
             information into its record.""",),
+        from_dataset=Parameter(
+            args=("--from-dataset",),
+            metavar="PATH",
+            doc="""BIDS dataset converted from the same specification without
+            --anonymize, to reuse for an anonymized conversion (requires
+            --anonymize). Instead of converting the DICOMs again, the files
+            of each subject (and session) are copied from that dataset, with
+            the subject label replaced by the anonymized one in file names and
+            within JSON, TSV and text files. Only procedures marked
+            'on-anonymize' (like defacing) are run afterwards. Files outside
+            the subject directories (like participants.tsv and .heudiconv)
+            are not copied. Only JSON, TSV, text, bval/bvec and NIfTI files
+            are copied, scrubbed of fields naming persons and of the names in
+            gzip headers. Unless the original label appears nowhere in them
+            afterwards (and NIfTI headers have no extensions), nothing of the
+            subject (session) is copied and it is converted from the DICOMs
+            instead. Numeric labels (like 02), which can't be told apart from
+            numbers and times, are looked for as 'sub-<label>' only.""",
+            constraints=EnsureStr() | EnsureNone()),
         only_type=Parameter(
             args=("--only-type",),
             metavar="TYPE",
             doc="specify snippet type to convert. If given only this type of "
                 "specification snippets is considered for conversion",
-            constraints=EnsureStr() | EnsureNone(),)
+            constraints=EnsureStr() | EnsureNone(),),
+        series_groups=Parameter(
+            args=("--series-groups",),
+            metavar="N",
+            doc="""convert the DICOM series of an acquisition in up to N groups
+            in parallel, instead of all of them at once. The procedures of a
+            'dicomseries:all' snippet are then run once per group with the
+            environment variable HIRNI_SERIES_UIDS listing the UIDs of the
+            group's series, which restricts hirni's heudiconv heuristic to
+            them. Series converted to the same BIDS name always belong to the
+            same group, so that no two groups write the same image files. Each
+            group is converted in a temporary clone of the BIDS dataset, whose
+            commits are replayed in the dataset afterwards. Files written by
+            several groups (like participants.tsv, scans.tsv or the files in
+            .heudiconv) are merged. If not given, the value of
+            'datalad.hirni.spec2bids.series-groups' is used, which defaults to
+            1.""",
+            constraints=EnsureInt() | EnsureNone()),
+        squash=Parameter(
+            args=("--squash",),
+            action="store_true",
+            doc="""save all changes of the conversion in a single commit at
+            the end. Procedures are run in temporary clones of the BIDS
+            dataset as with --jobs (even with a single job), and their
+            commits are replayed in the dataset without saving them, so that
+            the dataset is saved only once. That commit is a run record of
+            the hirni-spec2bids call (naming the specification files), which
+            `datalad rerun` can re-execute. The run records of the procedures
+            are kept in it, too. Files reused via --from-dataset and the
+            manifests are saved in that commit as well. Defaults to the value
+            of 'datalad.hirni.spec2bids.squash'."""),
+        warm_container=Parameter(
+            args=("--warm-container",),
+            metavar="NAME",
+            action="append",
+            doc="""name of a container (as listed by `datalad containers-list
+            -r`) to keep running during the conversion. The Singularity image
+            is started as an instance once and the `datalad containers-run`
+            calls of the procedures are executed in that instance, instead of
+            starting the image for each of them. Requires a container that is
+            executed via `singularity exec` (the default) and whose name
+            consists of lowercase letters, digits and dashes only. Containers
+            that can't be kept warm are run the usual way. The instances are
+            stopped at the end, unless 'datalad.hirni.containers.keep-warm' is
+            set, in which case they keep running for the lifetime of the
+            process (like hirni-daemon's). If not given, the
+            (whitespace-separated) names in
+            'datalad.hirni.spec2bids.warm-containers' are used.
+            [CMD: This option can be given multiple times. CMD]""",
+            constraints=EnsureStr() | EnsureNone()),
+        jobs=Parameter(
+            args=("-J", "--jobs"),
+            metavar="NJOBS",
+            doc="""number of conversion procedures to run in parallel. With
+            more than one, procedures are run in dependency order rather than
+            one after another in the order of the specification. Procedures
+            can declare the paths they read and write as the fields 'inputs'
+            and 'outputs' of their specification (a path or a list of paths
+            or globs, relative to the dataset, that may contain the same
+            placeholders as 'procedure-call'). A procedure then waits for
+            every earlier one that writes what it reads or writes, or reads
+            what it writes. Procedures without such a declaration wait for
+            the procedures of their acquisition's snippets of an earlier
+            type, according to 'datalad.hirni.spec2bids.type-order' (by
+            default: 'dicomseries:all', then 'dicomseries', then any other
+            type). Procedures of the same snippet always run in the given
+            order, and a procedure is skipped if one it depends on failed.
+            A procedure without such a declaration is assumed to write
+            anything within its snippet's subject directory, so it never runs
+            concurrently with another one writing into that directory. Each
+            procedure runs in a temporary clone of the BIDS
+            dataset, whose commits are replayed in the dataset once it
+            finished; files written concurrently (like participants.tsv) are
+            merged. If not given, the value of
+            'datalad.hirni.spec2bids.jobs' is used, which defaults to 1.""",
+            constraints=EnsureInt() | EnsureNone()),
+        manifest=Parameter(
+            args=("--manifest",),
+            action="store_true",
+            doc="""record the BIDS files of each converted acquisition in a
+            manifest. The manifest of a specification file is saved at
+            .hirni/manifests/<path of the specification file> within the BIDS
+            dataset and lists each file the procedures of the specification
+            committed within its subject (and session) directories, except
+            the scans and sessions tables other acquisitions write to as well,
+            along with its size and a fast content hash (xxHash, if the
+            'xxhash' package is installed, BLAKE2b otherwise). Files recorded
+            by an earlier conversion are kept, as long as they exist, since
+            converting them to the same content again commits nothing.
+            Defaults to the value of 'datalad.hirni.spec2bids.manifest'."""),
+        verify=Parameter(
+            args=("--verify",),
+            action="store_true",
+            doc="""don't convert, but check the BIDS files against the
+            manifests of the given specification files, or all manifests if
+            none are given. Each file is reported as missing or modified, if
+            it doesn't exist anymore or its size or content hash changed.
+            Files are checked in parallel according to --jobs, without
+            calling git or git-annex."""),
     )
 
     @staticmethod
     @datasetmethod(name='hirni_spec2bids')
     @eval_results
-    def __call__(specfile, dataset=None, anonymize=False, only_type=None):
+    @traced('spec2bids')
+    def __call__(specfile, dataset=None, anonymize=False, only_type=None,
+                 series_groups=None, squash=False,
+                 warm_container=None, jobs=None, manifest=False,
+                 verify=False, from_dataset=None):
+
+        # bound dataset method; imported here to not slow down loading the
+        # command suite
+        from datalad_container import containers_run
 
         dataset = require_dataset(dataset, check_installed=True,
                                   purpose="spec2bids")
@@ -86,262 +530,490 @@ class Spec2Bids(Interface):
         specfile = assure_list(specfile)
         specfile = [resolve_path(p, dataset) for p in specfile]
 
-        for spec_path in specfile:
-
-            # Note/TODO: ran_procedure per spec file still isn't ideal. Could
-            # be different spec files for same acquisition. It's actually about
-            # the exact same call. How to best get around substitutions?
-            # Also: per snippet isn't correct either.
-            # substitutions is real issue. Example "copy {location} ."
-            #
-            # => datalad.interface.run.format_command / normalize_command ?
-
-            # TODO: Also can we skip prepare_inputs within run? At least specify
-            # more specifically. Note: Can be globbed!
-
-            ran_procedure = dict()
-
-            if not lexists(spec_path):
-                yield get_status_dict(
-                    action='spec2bids',
-                    path=spec_path,
-                    status='impossible',
-                    message="{} not found".format(spec_path)
-                )
-
-            if op.isdir(spec_path):
-                if op.realpath(op.join(spec_path, op.pardir)) == \
-                        op.realpath(dataset.path):
-                    spec_path = op.join(
-                            spec_path,
-                            dataset.config.get(
-                                    "datalad.hirni.studyspec.filename",
-                                    "studyspec.json")
-                    )
-                    # TODO: check existence of that file!
-                else:
+        if series_groups is None:
+            series_groups = int(dataset.config.get(
+                "datalad.hirni.spec2bids.series-groups", default=1))
+
+        if jobs is None:
+            jobs = int(dataset.config.get("datalad.hirni.spec2bids.jobs",
+                                          default=1))
+
+        if verify:
+            if specfile:
+                manifests = [
+                    get_manifest_path(dataset.path, relpath(
+                        op.join(p, dataset.config.get(
+                            "datalad.hirni.studyspec.filename",
+                            "studyspec.json")) if op.isdir(p) else p,
+                        dataset.path))
+                    for p in specfile]
+            else:
+                manifests = find_manifests(dataset.path)
+            for r in _verify(dataset, manifests, jobs):
+                yield r
+            return
+
+        if from_dataset:
+            if not anonymize:
+                raise InsufficientArgumentsError(
+                    "reusing a conversion requires --anonymize")
+            from_dataset = resolve_path(from_dataset, dataset)
+        # (subject, session) -> whether its conversion was reused:
+        reused = dict()
+
+        manifest = manifest or dataset.config.getbool(
+            "datalad.hirni", "spec2bids.manifest", default=False)
+        # BIDS directories (relative to dataset) per converted specification:
+        bids_dirs = dict()
+        # files (relative to dataset) the procedures of a specification
+        # committed:
+        produced = dict()
+
+        squash = squash or dataset.config.getbool(
+            "datalad.hirni", "spec2bids.squash", default=False)
+        # files (relative to dataset) replayed or reused without saving them,
+        # and the messages of the replayed commits:
+        unsaved = set()
+        replayed = []
+        # whether a procedure failed or was skipped:
+        failed = False
+
+        if jobs > 1 or squash:
+            type_order = dataset.config.get(
+                "datalad.hirni.spec2bids.type-order", default=None)
+            type_order = type_order.split() if type_order is not None \
+                else default_type_order
+        # procedure calls to be scheduled, if run in parallel:
+        tasks = []
+
+        converted = []
+
+        if warm_container is None:
+            warm_container = dataset.config.get(
+                "datalad.hirni.spec2bids.warm-containers", default="").split()
+        pool = get_container_pool()
+        try:
+            if warm_container:
+                with span('spec2bids.warm'):
+                    for r in pool.start(dataset, assure_list(warm_container)):
+                        # a container not kept warm is run the usual way
+                        if r['status'] == 'impossible':
+                            r['status'] = 'notneeded'
+                        yield r
+
+            for spec_path in specfile:
+
+                # Note/TODO: ran_procedure per spec file still isn't ideal. Could
+                # be different spec files for same acquisition. It's actually about
+                # the exact same call. How to best get around substitutions?
+                # Also: per snippet isn't correct either.
+                # substitutions is real issue. Example "copy {location} ."
+                #
+                # => datalad.interface.run.format_command / normalize_command ?
+
+                # TODO: Also can we skip prepare_inputs within run? At least specify
+                # more specifically. Note: Can be globbed!
+
+                ran_procedure = dict()
+                head = dataset.repo.get_hexsha() if manifest else None
+
+                if not lexists(spec_path):
                     yield get_status_dict(
                         action='spec2bids',
                         path=spec_path,
                         status='impossible',
-                        message="{} is neither a specification file nor an "
-                                "acquisition directory".format(spec_path)
+                        message="{} not found".format(spec_path)
                     )
 
-            # relative path to spec to be recorded:
-            rel_spec_path = relpath(spec_path, dataset.path) \
-                if isabs(spec_path) else spec_path
-
-            # check each dict (snippet) in the specification for what to do
-            # wrt conversion:
-            for spec_snippet in load_stream(spec_path):
-
-                if only_type and not spec_snippet['type'].startswith(only_type):
-                    # ignore snippets not matching `only_type`
-                    # Note/TODO: the .startswith part is meant for
-                    # matching "dicomseries:all" to given "dicomseries" but not
-                    # vice versa. This prob. needs refinement (and doc)
-                    continue
-
-                if 'procedures' not in spec_snippet:
-                    # no conversion procedures defined at all:
-                    yield get_status_dict(
-                            action='spec2bids',
-                            path=spec_path,
-                            snippet=spec_snippet,
-                            status='notneeded',
-                    )
-                    continue
-
-                procedure_list = spec_snippet['procedures']
-                if not procedure_list:
-                    # no conversion procedures defined at all:
-                    yield get_status_dict(
+                if op.isdir(spec_path):
+                    if op.realpath(op.join(spec_path, op.pardir)) == \
+                            op.realpath(dataset.path):
+                        spec_path = op.join(
+                                spec_path,
+                                dataset.config.get(
+                                        "datalad.hirni.studyspec.filename",
+                                        "studyspec.json")
+                        )
+                        # TODO: check existence of that file!
+                    else:
+                        yield get_status_dict(
                             action='spec2bids',
                             path=spec_path,
-                            snippet=spec_snippet,
-                            status='notneeded',
-                    )
-                    continue
-
-                # accept a single dict as a one item list:
-                if isinstance(procedure_list, dict):
-                    procedure_list = [procedure_list]
-
-                # build a dict available for placeholders in format strings:
-                # Note: This is flattening the structure since we don't need
-                # value/approved for the substitutions. In addition 'subject'
-                # and 'anon_subject' are not passed on, but a new key
-                # 'bids_subject' instead the value of which depends on the
-                # --anonymize switch.
-                # Additionally 'location' is recomputed to be relative to
-                # dataset.path, since this is where the procedures are running
-                # from within.
-                replacements = dict()
-                for k, v in spec_snippet.items():
-                    if k == 'subject':
-                        if not anonymize:
-                            replacements['bids-subject'] = v['value']
-                    elif k == 'anon-subject':
-                        if anonymize:
-                            replacements['bids-subject'] = v['value']
-                    elif k == 'location':
-                        replacements[k] = op.join(op.dirname(rel_spec_path), v)
-                    elif k == 'procedures':
-                        # 'procedures' is a list of dicts (not suitable for
-                        # substitutions) and it makes little sense to be
-                        # referenced by converter format strings anyway:
-                        continue
-                    else:
-                        replacements[k] = v['value'] if isinstance(v, dict) else v
-
-                # build dict to patch os.environ with for passing
-                # replacements on to procedures:
-                env_subs = dict()
-                for k, v in replacements.items():
-                    env_subs['DATALAD_RUN_SUBSTITUTIONS_{}'
-                             ''.format(k.upper().replace('-', '__'))] = str(v)
-                env_subs['DATALAD_RUN_SUBSTITUTIONS_SPECPATH'] = rel_spec_path
-                env_subs['DATALAD_RUN_SUBSTITUTIONS_ANONYMIZE'] = str(anonymize)
-
-                # TODO: The above two blocks to build replacements dict and
-                # env_subs should be joined eventually.
-
-                for proc in procedure_list:
-                    if has_specval(proc, 'procedure-name'):
-                        proc_name = get_specval(proc, 'procedure-name')
-                    else:
-                        # invalid procedure spec
-                        lgr.warning("conversion procedure missing key "
-                                    "'procedure-name' in %s: %s",
-                                    spec_path, proc)
-                        # TODO: continue or yield impossible/error so it can be
-                        # dealt with via on_failure?
+                            status='impossible',
+                            message="{} is neither a specification file nor an "
+                                    "acquisition directory".format(spec_path)
+                        )
+
+                # relative path to spec to be recorded:
+                rel_spec_path = relpath(spec_path, dataset.path) \
+                    if isabs(spec_path) else spec_path
+                converted.append(rel_spec_path)
+
+                # check each dict (snippet) in the specification for what to do
+                # wrt conversion:
+                # Note/TODO: matching `only_type` as a prefix is meant for
+                # matching "dicomseries:all" to given "dicomseries" but not
+                # vice versa. This prob. needs refinement (and doc)
+                snippets = load_stream_of_type(spec_path, only_type, prefix=True) \
+                    if only_type else load_stream(spec_path)
+                for spec_snippet in snippets:
+
+                    if 'procedures' not in spec_snippet:
+                        # no conversion procedures defined at all:
+                        yield get_status_dict(
+                                action='spec2bids',
+                                path=spec_path,
+                                snippet=spec_snippet,
+                                status='notneeded',
+                        )
                         continue
 
-                    if has_specval(proc, 'on-anonymize') \
-                        and anything2bool(
-                            get_specval(proc, 'on-anonymize')
-                            ) and not anonymize:
-                        # don't run that procedure, if we weren't called with
-                        # --anonymize while procedure is specified to be run on
-                        # that switch only
+                    procedure_list = spec_snippet['procedures']
+                    if not procedure_list:
+                        # no conversion procedures defined at all:
+                        yield get_status_dict(
+                                action='spec2bids',
+                                path=spec_path,
+                                snippet=spec_snippet,
+                                status='notneeded',
+                        )
                         continue
 
-                    proc_call = get_specval(proc, 'procedure-call') \
-                        if has_specval(proc, 'procedure-call') \
-                        else None
-
-                    if ran_procedure.get(hash((proc_name, proc_call)), None):
-                        # if we ran the exact same call already,
-                        # don't call it again
-                        # TODO: notneeded?
+                    # accept a single dict as a one item list:
+                    if isinstance(procedure_list, dict):
+                        procedure_list = [procedure_list]
+
+                    # build a dict available for placeholders in format strings:
+                    # Note: This is flattening the structure since we don't need
+                    # value/approved for the substitutions. In addition 'subject'
+                    # and 'anon_subject' are not passed on, but a new key
+                    # 'bids_subject' instead the value of which depends on the
+                    # --anonymize switch.
+                    # Additionally 'location' is recomputed to be relative to
+                    # dataset.path, since this is where the procedures are running
+                    # from within.
+                    replacements = dict()
+                    for k, v in spec_snippet.items():
+                        if k == 'subject':
+                            if not anonymize:
+                                replacements['bids-subject'] = v['value']
+                        elif k == 'anon-subject':
+                            if anonymize:
+                                replacements['bids-subject'] = v['value']
+                        elif k == 'location':
+                            replacements[k] = op.join(op.dirname(rel_spec_path), v)
+                        elif k == 'procedures':
+                            # 'procedures' is a list of dicts (not suitable for
+                            # substitutions) and it makes little sense to be
+                            # referenced by converter format strings anyway:
+                            continue
+                        else:
+                            replacements[k] = v['value'] if isinstance(v, dict) else v
+
+                    if replacements.get('bids-subject'):
+                        bids_dirs.setdefault(rel_spec_path, set()).add(
+                            op.join('sub-{}'.format(replacements['bids-subject']),
+                                    'ses-{}'.format(replacements['bids-session'])
+                                    if replacements.get('bids-session') else ''
+                                    ).rstrip(op.sep))
+
+                    if from_dataset:
+                        for r in _reuse_conversion(dataset, from_dataset,
+                                                   spec_snippet, reused,
+                                                   save=not squash):
+                            if squash and r.get('files'):
+                                unsaved.update(r['files'])
+                                produced.setdefault(rel_spec_path,
+                                                    set()).update(r['files'])
+                            yield r
+                    reused_conversion = reused.get(
+                        _get_reuse_key(spec_snippet), False)
+
+                    # build dict to patch os.environ with for passing
+                    # replacements on to procedures:
+                    env_subs = dict()
+                    for k, v in replacements.items():
+                        env_subs['DATALAD_RUN_SUBSTITUTIONS_{}'
+                                 ''.format(k.upper().replace('-', '__'))] = str(v)
+                    env_subs['DATALAD_RUN_SUBSTITUTIONS_SPECPATH'] = rel_spec_path
+                    env_subs['DATALAD_RUN_SUBSTITUTIONS_ANONYMIZE'] = str(anonymize)
+                    # execute containers-run calls in running instances:
+                    env_subs.update(pool.env)
+
+                    # TODO: The above two blocks to build replacements dict and
+                    # env_subs should be joined eventually.
+
+                    groups = None
+                    if series_groups > 1 and \
+                            spec_snippet['type'] == 'dicomseries:all':
+                        groups = get_series_groups(
+                            [s for s in load_stream_of_type(spec_path,
+                                                            'dicomseries')
+                             if s.get('location') == spec_snippet.get('location')],
+                            series_groups)
+
+                    for proc in procedure_list:
+                        if has_specval(proc, 'procedure-name'):
+                            proc_name = get_specval(proc, 'procedure-name')
+                        else:
+                            # invalid procedure spec
+                            lgr.warning("conversion procedure missing key "
+                                        "'procedure-name' in %s: %s",
+                                        spec_path, proc)
+                            # TODO: continue or yield impossible/error so it can be
+                            # dealt with via on_failure?
+                            continue
+
+                        if has_specval(proc, 'on-anonymize') \
+                            and anything2bool(
+                                get_specval(proc, 'on-anonymize')
+                                ) and not anonymize:
+                            # don't run that procedure, if we weren't called with
+                            # --anonymize while procedure is specified to be run on
+                            # that switch only
+                            continue
+
+                        if reused_conversion and not (
+                                has_specval(proc, 'on-anonymize') and
+                                anything2bool(get_specval(proc, 'on-anonymize'))):
+                            # the results of that procedure were reused
+                            continue
+
+                        proc_call = get_specval(proc, 'procedure-call') \
+                            if has_specval(proc, 'procedure-call') \
+                            else None
+
+                        if ran_procedure.get(hash((proc_name, proc_call)), None):
+                            # if we ran the exact same call already,
+                            # don't call it again
+                            # TODO: notneeded?
+                            continue
+
+                        # if spec comes with call format string, it takes precedence
+                        # over what is generally configured for the procedure
+                        # TODO: Not sure yet whether this is how we should deal with it
+                        if proc_call:
+                            env_subs['DATALAD_PROCEDURES_{}_CALL__FORMAT'
+                                     ''.format(proc_name.upper().replace('-', '__'))
+                                     ] = proc_call
+
+                        if jobs > 1 or squash:
+                            tasks.append(ProcedureTask(
+                                spec_path, spec_snippet, proc, proc_name,
+                                dict(env_subs), replacements,
+                                get_type_rank(spec_snippet['type'], type_order),
+                                groups=groups))
+                            continue
+
+                        run_results = list()
+                        if groups and len(groups) > 1:
+                            # environment for the runs is patched in the worker
+                            # processes
+                            with span('spec2bids.procedure', procedure=proc_name,
+                                      spec=rel_spec_path, groups=len(groups)):
+                                for r in _run_procedure_groups(dataset, proc_name,
+                                                               env_subs, groups):
+                                    yield r
+                                    run_results.append(r)
+                        else:
+                            # Note, that we can't use dataset.config.overrides to
+                            # pass run-substitution config to procedures, since we
+                            # leave python context and thereby loose the dataset
+                            # instance. Use patched os.environ instead. Note also,
+                            # that this requires names of substitutions to not
+                            # contain underscores, since they would be translated to
+                            # '.' by ConfigManager when reading them from within the
+                            # procedure's datalad-run calls.
+                            from unittest.mock import patch
+
+                            # TODO: Reconsider that patching. Shouldn't it be an update?
+                            with patch.dict('os.environ', env_subs), \
+                                    span('spec2bids.procedure', procedure=proc_name,
+                                         spec=rel_spec_path):
+                                # apparently reload is necessary to consider config
+                                # overrides via env:
+                                dataset.config.reload()
+                                for r in dataset.run_procedure(
+                                        spec=proc_name,
+                                        return_type='generator'
+                                ):
+
+                                    # # if there was an issue yield original result,
+                                    # # otherwise swallow:
+                                    # if r['status'] not in ['ok', 'notneeded']:
+                                    yield r
+                                    run_results.append(r)
+
+                        count('spec2bids.procedures')
+                        yield _get_conversion_result(proc_name, spec_path,
+                                                     spec_snippet, run_results)
+
+                        # mark as a procedure we ran on this acquisition:
+                        # TODO: rethink. Doesn't work that way. Disabled for now
+                        # ran_procedure[hash((proc_name, proc_call))] = True
+
+
+
+
+                        # elif proc_name != 'hirni-dicom-converter':
+                        #     # specific converter procedure call
+                        #
+                        #     from mock import patch
+                        #     with patch.dict('os.environ', env_subs):
+                        #         # apparently reload is necessary to consider config
+                        #         # overrides via env:
+                        #         dataset.config.reload()
+                        #
+                        #         for r in dataset.run_procedure(
+                        #                 spec=[proc_name, rel_spec_path, anonymize],
+                        #                 return_type='generator'
+                        #         ):
+                        #
+                        #             # if there was an issue with containers-run,
+                        #             # yield original result, otherwise swallow:
+                        #             if r['status'] not in ['ok', 'notneeded']:
+                        #                 yield r
+                        #
+                        #             run_results.append(r)
+                        #
+                        #     if not all(r['status'] in ['ok', 'notneeded']
+                        #                for r in run_results):
+                        #         yield {'action': proc_name,
+                        #                'path': spec_path,
+                        #                'snippet': spec_snippet,
+                        #                'status': 'error',
+                        #                'message': "Conversion failed. "
+                        #                           "See previous message(s)."}
+                        #
+                        #     else:
+                        #         yield {'action': proc_name,
+                        #                'path': spec_path,
+                        #                'snippet': spec_snippet,
+                        #                'status': 'ok',
+                        #                'message': "specification converted."}
+
+                        # elif ran_heudiconv and proc_name == 'hirni-dicom-converter':
+                        #     # in this case we acted upon this snippet already and
+                        #     # do not have to produce a result
+                        #     pass
+                        #
+                        # else:
+                        #     # this shouldn't happen!
+                        #     raise RuntimeError
+
+                if manifest:
+                    # procedures run (or conversions reused) right away
+                    produced.setdefault(rel_spec_path, set()).update(
+                        _get_committed_files(dataset, head))
+
+                yield {'action': 'spec2bids',
+                       'path': spec_path,
+                       'status': 'ok'}
+
+            if tasks:
+                add_dependencies(tasks)
+                # procedures run in sandboxes, which are replayed in the
+                # dataset by this process, one after another
+                sandbox_dir = _make_sandbox_dir(dataset)
+                try:
+                    with span('spec2bids.schedule', procedures=len(tasks),
+                              jobs=jobs):
+                        for task, run_results in run_tasks(
+                                tasks, jobs,
+                                partial(_run_procedure_isolated,
+                                        sandbox_dir=sandbox_dir,
+                                        unsaved=squash),
+                                dataset.path,
+                                merge=lambda run: list(
+                                    _merge_isolated(dataset, run,
+                                                    save=not squash))):
+                            count('spec2bids.procedures')
+                            if run_results is None:
+                                count('spec2bids.procedure_failures')
+                                failed = True
+                                yield {'action': task.proc_name,
+                                       'path': task.spec_path,
+                                       'snippet': task.snippet,
+                                       'status': 'impossible',
+                                       'message': "not run, since a "
+                                                  "procedure it depends on "
+                                                  "failed"}
+                                continue
+                            for r in run_results:
+                                if r.get('action') == 'hirni merge' and \
+                                        'files' in r:
+                                    produced.setdefault(
+                                        relpath(task.spec_path, dataset.path)
+                                        if isabs(task.spec_path)
+                                        else task.spec_path,
+                                        set()).update(r['files'])
+                                    if squash:
+                                        unsaved.update(r['files'])
+                                        replayed.append(r['commit_message'])
+                                yield r
+                            res = _get_conversion_result(task.proc_name,
+                                                         task.spec_path,
+                                                         task.snippet,
+                                                         run_results)
+                            failed = failed or res['status'] != 'ok'
+                            yield res
+                finally:
+                    rmtree(sandbox_dir)
+
+            manifests = []
+            if manifest:
+                for rel_spec_path in converted:
+                    if rel_spec_path not in bids_dirs:
                         continue
-
-                    # if spec comes with call format string, it takes precedence
-                    # over what is generally configured for the procedure
-                    # TODO: Not sure yet whether this is how we should deal with it
-                    if proc_call:
-                        env_subs['DATALAD_PROCEDURES_{}_CALL__FORMAT'
-                                 ''.format(proc_name.upper().replace('-', '__'))
-                                 ] = proc_call
-
-                    run_results = list()
-                    # Note, that we can't use dataset.config.overrides to
-                    # pass run-substitution config to procedures, since we
-                    # leave python context and thereby loose the dataset
-                    # instance. Use patched os.environ instead. Note also,
-                    # that this requires names of substitutions to not
-                    # contain underscores, since they would be translated to
-                    # '.' by ConfigManager when reading them from within the
-                    # procedure's datalad-run calls.
-                    from mock import patch
-
-                    # TODO: Reconsider that patching. Shouldn't it be an update?
-                    with patch.dict('os.environ', env_subs):
-                        # apparently reload is necessary to consider config
-                        # overrides via env:
-                        dataset.config.reload()
-                        for r in dataset.run_procedure(
-                                spec=proc_name,
-                                return_type='generator'
-                        ):
-
-                            # # if there was an issue yield original result,
-                            # # otherwise swallow:
-                            # if r['status'] not in ['ok', 'notneeded']:
+                    with span('spec2bids.manifest', spec=rel_spec_path):
+                        path = write_manifest(
+                            dataset.path, rel_spec_path,
+                            select_files(produced.get(rel_spec_path, []),
+                                         bids_dirs[rel_spec_path]),
+                            jobs=jobs)
+                    manifests.append(path)
+                if manifests and not squash:
+                    for r in dataset.save(
+                            manifests,
+                            to_git=True,
+                            message="[HIRNI] Update manifest(s) of {} "
+                                    "specification(s)".format(len(manifests)),
+                            return_type='generator'):
+                        yield r
+
+            if squash:
+                paths = [op.join(dataset.path, p) for p in sorted(unsaved)]
+                if paths or manifests:
+                    if manifests:
+                        # stage them the way they'd be saved on their own
+                        dataset.repo.add(manifests, git=True)
+                    with span('spec2bids.commit'):
+                        for r in dataset.save(
+                                paths + manifests,
+                                message=format_run_record(
+                                    dataset,
+                                    _get_squash_cmd(converted, anonymize,
+                                                    only_type, manifest),
+                                    "[HIRNI] Convert {} specification(s)"
+                                    "".format(len(converted)),
+                                    exit_code=1 if failed else 0,
+                                    hirni_procedures=[
+                                        parse_commit_message(m)
+                                        for m in replayed]),
+                                return_type='generator'):
                             yield r
-                            run_results.append(r)
-
-                    if not all(r['status'] in ['ok', 'notneeded']
-                               for r in run_results):
-                        yield {'action': proc_name,
-                               'path': spec_path,
-                               'snippet': spec_snippet,
-                               'status': 'error',
-                               'message': "acquisition conversion failed. "
-                                          "See previous message(s)."}
-
-                    else:
-                        yield {'action': proc_name,
-                               'path': spec_path,
-                               'snippet': spec_snippet,
-                               'status': 'ok',
-                               'message': "acquisition converted."}
-
-                    # mark as a procedure we ran on this acquisition:
-                    # TODO: rethink. Doesn't work that way. Disabled for now
-                    # ran_procedure[hash((proc_name, proc_call))] = True
-
-
-
-
-                    # elif proc_name != 'hirni-dicom-converter':
-                    #     # specific converter procedure call
-                    #
-                    #     from mock import patch
-                    #     with patch.dict('os.environ', env_subs):
-                    #         # apparently reload is necessary to consider config
-                    #         # overrides via env:
-                    #         dataset.config.reload()
-                    #
-                    #         for r in dataset.run_procedure(
-                    #                 spec=[proc_name, rel_spec_path, anonymize],
-                    #                 return_type='generator'
-                    #         ):
-                    #
-                    #             # if there was an issue with containers-run,
-                    #             # yield original result, otherwise swallow:
-                    #             if r['status'] not in ['ok', 'notneeded']:
-                    #                 yield r
-                    #
-                    #             run_results.append(r)
-                    #
-                    #     if not all(r['status'] in ['ok', 'notneeded']
-                    #                for r in run_results):
-                    #         yield {'action': proc_name,
-                    #                'path': spec_path,
-                    #                'snippet': spec_snippet,
-                    #                'status': 'error',
-                    #                'message': "Conversion failed. "
-                    #                           "See previous message(s)."}
-                    #
-                    #     else:
-                    #         yield {'action': proc_name,
-                    #                'path': spec_path,
-                    #                'snippet': spec_snippet,
-                    #                'status': 'ok',
-                    #                'message': "specification converted."}
-
-                    # elif ran_heudiconv and proc_name == 'hirni-dicom-converter':
-                    #     # in this case we acted upon this snippet already and
-                    #     # do not have to produce a result
-                    #     pass
-                    #
-                    # else:
-                    #     # this shouldn't happen!
-                    #     raise RuntimeError
-
-            yield {'action': 'spec2bids',
-                   'path': spec_path,
-                   'status': 'ok'}
+                        record_annexed_content(dataset, paths)
+                yield get_status_dict(
+                    action='spec2bids',
+                    path=dataset.path,
+                    type='dataset',
+                    status='ok' if paths or manifests else 'notneeded',
+                    message=("saved the changes of %d procedure commit(s) "
+                             "at once", len(replayed)),
+                    logger=lgr)
+        finally:
+            # also if the conversion failed or its results weren't consumed
+            if not dataset.config.getbool("datalad.hirni",
+                                          "containers.keep-warm",
+                                          default=False):
+                pool.stop()
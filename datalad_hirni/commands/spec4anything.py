@@ -20,8 +20,10 @@ from datalad.utils import assure_list
 from datalad.interface.annotate_paths import AnnotatePaths
 from datalad.interface.results import get_status_dict
 
-# bound dataset method
-import datalad_metalad.dump
+from datalad_hirni.support.tracing import (
+    span,
+    traced,
+)
 
 import logging
 lgr = logging.getLogger('datalad.hirni.spec4anything')
@@ -36,18 +38,16 @@ def _get_edit_dict(value=None, approved=False):
     return dict(approved=approved, value=value)
 
 
-def _add_to_spec(spec, spec_dir, path, ds, overrides=None, replace=False):
+def _get_snippet(spec_dir, path, ds, overrides=None):
     """
     Parameters
     ----------
-    spec: list of dict
-      specification to add the snippet to
     spec_dir:
       path to where the spec file is (paths in spec are relative to that location)
     path:
       path to the entity this snippet is about
-    meta:
-      metadata of the dataset (for dataset_id and refcommit)
+    ds:
+      dataset (for dataset_id and refcommit)
     overrides: dict
       key, values to add/overwrite the default
     """
@@ -64,22 +64,33 @@ def _add_to_spec(spec, spec_dir, path, ds, overrides=None, replace=False):
     }
 
     snippet.update(overrides)
+    return snippet
 
-    # figure, whether we need to append the snippet or replace an
-    # existing one
-    if replace:
-        for s in spec:
-            if s['type'] == snippet['type'] and \
-               s['location'] == snippet['location'] and \
-               s['id']['value'] == snippet['id']['value']:
-                # replace existing snippet:
-                # Note: This needs to be documented. The identification as well
-                # as the fact that only first occurence will be replaced.
-                s.update(snippet)
-                return spec
 
-    spec.append(snippet)
-    return spec
+def _replace_in_spec(spec_path, snippet):
+    """Replace an existing snippet within a spec file
+
+    The snippet to replace is identified by the values of 'type', 'location'
+    and 'id'. Note, that only the first occurrence is replaced. It is looked
+    up by means of the spec file's index and only its line is rewritten.
+
+    Returns
+    -------
+    bool
+      whether there was a snippet to replace
+    """
+
+    from datalad_hirni.support.spec_index import (
+        get_snippet_key,
+        SpecIndex,
+    )
+    spec_index = SpecIndex(spec_path)
+    existing = spec_index.get(get_snippet_key(snippet))
+    if existing is None:
+        return False
+    existing.update(snippet)
+    spec_index.replace(existing)
+    return True
 
 
 @build_doc
@@ -130,6 +141,7 @@ class Spec4Anything(Interface):
     @staticmethod
     @datasetmethod(name='hirni_spec4anything')
     @eval_results
+    @traced('spec4anything')
     def __call__(path, dataset=None, spec_file=None, properties=None,
                  replace=False):
         # TODO: message
@@ -258,8 +270,8 @@ class Spec4Anything(Interface):
             #
             # But then: This should concern non-editable fields only, right?
 
-            spec = _add_to_spec(spec, posixpath.split(spec_path)[0], ap,
-                                dataset, overrides=overrides, replace=replace)
+            snippet = _get_snippet(posixpath.split(spec_path)[0], ap,
+                                   dataset, overrides=overrides)
 
             # Note: Not sure whether we really want one commit per snippet.
             #       If not - consider:
@@ -270,9 +282,14 @@ class Spec4Anything(Interface):
             # collect paths of updated files, and give them to a single `add`
             # at the very end?
             # MIH: if we fail, we fail and nothing is committed
-            from datalad_hirni.support.spec_helpers import sort_spec
-            json_py.dump2stream(sorted(spec, key=lambda x: sort_spec(x)),
-                                spec_path)
+            from datalad_hirni.support.spec_helpers import write_spec
+            with span('spec4anything.write'):
+                # figure, whether we need to append the snippet or replace an
+                # existing one
+                if not (replace and spec and
+                        _replace_in_spec(spec_path, snippet)):
+                    spec.append(snippet)
+                    write_spec(spec, spec_path)
             updated_files.append(spec_path)
 
             yield get_status_dict(
@@ -289,10 +306,12 @@ class Spec4Anything(Interface):
                 paths=linesep.join(" - " + op.relpath(p['path'], dataset.path)
                                    for p in paths)
                 if len(paths) > 1 else op.relpath(paths[0]['path'], dataset.path))
-        for r in dataset.save(
+        with span('spec4anything.save'):
+            results = dataset.save(
                 updated_files,
                 to_git=True,
                 message=message,
-                return_type='generator',
-                result_renderer='disabled'):
+                return_type='list',
+                result_renderer='disabled')
+        for r in results:
             yield r
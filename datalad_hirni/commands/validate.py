@@ -0,0 +1,103 @@
+"""Validate specification files of a study dataset"""
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count
+
+from datalad.interface.base import build_doc, Interface
+from datalad.interface.common_opts import jobs_opt
+from datalad.support.constraints import EnsureStr
+from datalad.support.constraints import EnsureNone
+from datalad.support.param import Parameter
+from datalad.distribution.dataset import datasetmethod
+from datalad.distribution.dataset import EnsureDataset
+from datalad.distribution.dataset import require_dataset
+from datalad.distribution.dataset import resolve_path
+from datalad.dochelpers import exc_str
+from datalad.interface.utils import eval_results
+from datalad.interface.results import get_status_dict
+from datalad.utils import assure_list
+
+from datalad_hirni.support.spec_catalog import find_spec_files
+from datalad_hirni.support.spec_schema import validate_file
+
+import logging
+lgr = logging.getLogger('datalad.hirni.validate')
+
+
+@build_doc
+class Validate(Interface):
+    """Validate specification files against the snippet schema.
+
+    Every snippet is checked for the fields required by its type
+    ('dicomseries', 'dicomseries:all' or 'generic_*'), for the format of
+    automatically managed fields (like 'uid' or 'procedures') and for all
+    other fields to be editable ones, i.e. a dict with a 'value' and an
+    'approved' key.
+
+    Specification files are validated in parallel. All problems found are
+    reported at once, as part of an error result for each invalid file.
+    """
+
+    _params_ = dict(
+        dataset=Parameter(
+            args=("-d", "--dataset"),
+            metavar='PATH',
+            doc="""study dataset to validate. If no dataset is given, an
+            attempt is made to identify the dataset based on the current
+            working directory""",
+            constraints=EnsureDataset() | EnsureNone()),
+        path=Parameter(
+            args=("path",),
+            metavar='PATH',
+            doc="""path(s) of specification files to validate. By default,
+            the specification file at the root of the dataset and the ones
+            of all acquisitions are validated.""",
+            nargs="*",
+            constraints=EnsureStr() | EnsureNone()),
+        jobs=jobs_opt,
+    )
+
+    @staticmethod
+    @datasetmethod(name='hirni_validate')
+    @eval_results
+    def __call__(path=None, dataset=None, jobs='auto'):
+        ds = require_dataset(dataset, check_installed=True,
+                             purpose="hirni validate")
+        res_kwargs = dict(action='hirni validate', logger=lgr,
+                          refds=ds.path)
+
+        path = [resolve_path(p, ds) for p in assure_list(path)] \
+            or find_spec_files(ds)
+        if jobs is None or jobs == 'auto':
+            jobs = cpu_count() or 1
+
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [(p, pool.submit(validate_file, p)) for p in path]
+            for p, future in futures:
+                try:
+                    problems = future.result()
+                except Exception as e:
+                    yield get_status_dict(
+                        status='error',
+                        path=p,
+                        type='file',
+                        message=exc_str(e),
+                        **res_kwargs)
+                    continue
+                if not problems:
+                    yield get_status_dict(
+                        status='ok',
+                        path=p,
+                        type='file',
+                        **res_kwargs)
+                    continue
+                yield get_status_dict(
+                    status='error',
+                    path=p,
+                    type='file',
+                    message=("%d problem(s):\n%s",
+                             len(problems),
+                             "\n".join("line {}: {}".format(*pr)
+                                       for pr in problems)),
+                    problems=problems,
+                    **res_kwargs)
@@ -0,0 +1,281 @@
+"""Continuously import DICOM tarballs arriving in watched directories"""
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from os import cpu_count
+from os import makedirs
+import os.path as op
+import tempfile
+import time
+
+from datalad.interface.base import build_doc, Interface
+from datalad.interface.common_opts import jobs_opt
+from datalad.interface.results import get_status_dict
+from datalad.support.constraints import EnsureFloat
+from datalad.support.constraints import EnsureStr
+from datalad.support.constraints import EnsureNone
+from datalad.support.param import Parameter
+from datalad.distribution.dataset import datasetmethod
+from datalad.distribution.dataset import EnsureDataset
+from datalad.distribution.dataset import require_dataset
+from datalad.interface.utils import eval_results
+from datalad.utils import (
+    assure_list,
+    rmtree,
+)
+from datalad.dochelpers import exc_str
+
+from datalad_hirni.commands.batch_import import _import_into_tmp
+from datalad_hirni.commands.import_dicoms import _move_to_acquisition
+from datalad_hirni.support.aggregation import (
+    aggregate_if_due,
+    schedule_aggregation,
+)
+from datalad_hirni.support.maintenance import (
+    maintain_if_due,
+    schedule_maintenance,
+)
+from datalad_hirni.support.tarball_index import (
+    get_tarball_key,
+    TarballIndex,
+)
+from datalad_hirni.support.watch_folder import FolderWatcher
+
+import logging
+lgr = logging.getLogger('datalad.hirni.watch')
+
+
+@build_doc
+class Watch(Interface):
+    """Watch directories for DICOM tarballs and import them as they arrive.
+
+    Directories are polled every `interval` seconds. A tarball is picked up,
+    once it didn't change for `settle` seconds, so that tarballs still being
+    copied (e.g. from a scanner's export) aren't imported prematurely. Hidden
+    files are ignored.
+
+    Each tarball passes a pipeline of stages:
+
+    1. its content is hashed and looked up in the study dataset's record of
+       imported tarballs, so a tarball that was imported before is skipped;
+    2. it is imported into an isolated temporary dataset (copied, annexed
+       and its acquisition ID derived from its DICOM headers);
+    3. the new acquisition is moved into place and saved, its metadata is
+       aggregated and extracted DICOMs are dropped (which can be deferred and
+       batched across acquisitions, see `datalad.hirni.aggregate.threshold`)
+       and its specification is created via hirni-dicom2spec.
+
+    Stages 1 and 2 run in a pool of `jobs` worker processes, while stage 3
+    modifies the study dataset and runs one tarball at a time. Hence, the
+    metadata of one tarball is processed, while the next ones are copied and
+    annexed already. A tarball failing in any stage is reported as an error
+    and its temporary dataset is removed, while watching goes on.
+
+    Unless `once` is given, watching goes on until interrupted (Ctrl-C).
+    """
+
+    _params_ = dict(
+        dataset=Parameter(
+            args=("-d", "--dataset"),
+            metavar='PATH',
+            doc="""study dataset to import into. If no dataset is given, an
+            attempt is made to identify the dataset based on the current
+            working directory""",
+            constraints=EnsureDataset() | EnsureNone()),
+        path=Parameter(
+            args=("path",),
+            metavar='DIRECTORY',
+            doc="""directories to watch for DICOM tarballs""",
+            nargs="+",
+            constraints=EnsureStr()),
+        pattern=Parameter(
+            args=("--pattern",),
+            metavar='GLOB',
+            doc="""only consider files whose name matches this pattern""",
+            constraints=EnsureStr()),
+        interval=Parameter(
+            args=("--interval",),
+            metavar='SECONDS',
+            doc="""how often to check the watched directories""",
+            constraints=EnsureFloat()),
+        settle=Parameter(
+            args=("--settle",),
+            metavar='SECONDS',
+            doc="""how long a file needs to stay unchanged to be considered
+            complete""",
+            constraints=EnsureFloat()),
+        properties=Parameter(
+            args=("--properties",),
+            metavar="PATH or JSON string",
+            doc="""a JSON string or a path to a JSON file, to provide
+            overrides/additions to the to be created specification snippets
+            for all imported acquisitions.""",
+            constraints=EnsureStr() | EnsureNone()),
+        no_extract=Parameter(
+            args=("--no-extract",),
+            action="store_true",
+            doc="""don't extract the archives. See hirni-import-dcm."""),
+        once=Parameter(
+            args=("--once",),
+            action="store_true",
+            doc="""import whatever arrives until there is nothing left to do
+            and then stop, instead of watching forever."""),
+        jobs=jobs_opt,
+    )
+
+    @staticmethod
+    @datasetmethod(name='hirni_watch')
+    @eval_results
+    def __call__(path, dataset=None, pattern='*', interval=5., settle=10.,
+                 properties=None, no_extract=False, once=False, jobs='auto'):
+        # bound dataset methods; imported here to not slow down loading
+        # the command suite
+        import datalad_hirni.commands.dicom2spec
+
+        ds = require_dataset(dataset, check_installed=True,
+                             purpose="watch for DICOM tarballs")
+        res_kwargs = dict(action='import DICOM tarball', logger=lgr)
+
+        if jobs is None or jobs == 'auto':
+            jobs = cpu_count() or 1
+
+        watcher = FolderWatcher(assure_list(path), settle=settle,
+                                pattern=pattern)
+        tarball_index = TarballIndex(ds)
+        tmp_base = op.join(ds.path, '.git', 'datalad', 'hirni_import_watch')
+        if not op.exists(tmp_base):
+            makedirs(tmp_base)
+
+        # tarballs waiting for a worker
+        queue = deque()
+        # future -> (stage, tarball, key, tmp_dir)
+        in_flight = dict()
+        # tarballs with a pending key in stage 1 or 2; keeps the same content
+        # from being imported twice, if it arrives under several names
+        keys_in_flight = dict()
+
+        def finalize(tarball, key, tmp_dir, acqid):
+            # stage 3: runs in this process, one tarball at a time
+            if op.lexists(op.join(ds.path, acqid)):
+                rmtree(tmp_dir)
+                yield get_status_dict(
+                    status='impossible',
+                    path=tarball,
+                    type='file',
+                    message=("acquisition %s already exists", acqid),
+                    **res_kwargs)
+                return
+            dicom_ds = _move_to_acquisition(tmp_dir, ds, acqid)
+            tarball_index.add(key, acqid)
+            ds.save([dicom_ds.path, tarball_index.path],
+                    to_git=True,
+                    message="[HIRNI] Add aquisition {}".format(acqid))
+            if not no_extract:
+                # extracted DICOMs are dropped after aggregation
+                schedule_aggregation(ds, [dicom_ds.path])
+                for r in aggregate_if_due(ds, jobs=jobs):
+                    yield r
+            ds.hirni_dicom2spec(
+                path=dicom_ds.path,
+                spec=op.normpath(op.join(
+                    dicom_ds.path, op.pardir, "studyspec.json")),
+                acquisition=acqid,
+                properties=properties)
+            yield get_status_dict(
+                status='ok',
+                path=dicom_ds.path,
+                type='dataset',
+                **res_kwargs)
+            schedule_maintenance(ds, [dicom_ds.path])
+            for r in maintain_if_due(ds):
+                yield r
+
+        try:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                while True:
+                    queue.extend(watcher.poll())
+                    # keep the workers busy, but don't take on more than
+                    # they can handle right away
+                    while queue and len(in_flight) < jobs:
+                        tarball = queue.popleft()
+                        in_flight[pool.submit(get_tarball_key, tarball)] = \
+                            ('hash', tarball, None, None)
+
+                    if not in_flight:
+                        if once and not queue and not watcher.pending:
+                            break
+                        time.sleep(interval)
+                        continue
+
+                    done, _ = wait(list(in_flight), timeout=interval,
+                                   return_when=FIRST_COMPLETED)
+                    for future in done:
+                        stage, tarball, key, tmp_dir = in_flight.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            if stage == 'import':
+                                rmtree(tmp_dir)
+                            keys_in_flight.pop(key, None)
+                            yield get_status_dict(
+                                status='error',
+                                path=tarball,
+                                type='file',
+                                message=exc_str(e),
+                                **res_kwargs)
+                            continue
+
+                        if stage == 'hash':
+                            known_acq = tarball_index.get(result)
+                            if known_acq and \
+                                    op.exists(op.join(ds.path, known_acq)):
+                                yield get_status_dict(
+                                    status='notneeded',
+                                    path=op.join(ds.path, known_acq,
+                                                 'dicoms'),
+                                    type='dataset',
+                                    message=("%s was imported as acquisition "
+                                             "%s already", tarball,
+                                             known_acq),
+                                    **res_kwargs)
+                                continue
+                            if result in keys_in_flight:
+                                yield get_status_dict(
+                                    status='notneeded',
+                                    path=tarball,
+                                    type='file',
+                                    message=("same content as %s",
+                                             keys_in_flight[result]),
+                                    **res_kwargs)
+                                continue
+                            keys_in_flight[result] = tarball
+                            # stage 2
+                            tmp_dir = tempfile.mkdtemp(prefix='acq_',
+                                                       dir=tmp_base)
+                            in_flight[pool.submit(
+                                _import_into_tmp, tarball, tmp_dir, ds.path,
+                                not no_extract)] = \
+                                ('import', tarball, result, tmp_dir)
+                        elif stage == 'import':
+                            try:
+                                for r in finalize(tarball, key, tmp_dir,
+                                                  result):
+                                    yield r
+                            except Exception as e:
+                                # a broken tarball must not stop the watcher
+                                yield get_status_dict(
+                                    status='error',
+                                    path=tarball,
+                                    type='file',
+                                    message=exc_str(e),
+                                    **res_kwargs)
+                            finally:
+                                if op.lexists(tmp_dir):
+                                    rmtree(tmp_dir)
+                                keys_in_flight.pop(key, None)
+        except KeyboardInterrupt:
+            lgr.info("Stopped watching %s", path)
+        finally:
+            rmtree(tmp_base)
@@ -0,0 +1,132 @@
+"""Deferred, batched metadata aggregation of imported DICOM datasets
+
+Aggregating the metadata of a new acquisition into the study dataset gets
+more expensive, the more acquisitions the study has, since the study's
+aggregate store is rewritten each time. Instead, new DICOM datasets are
+recorded as pending aggregation and aggregated in a single batched step,
+once a configurable number of them is pending. Until then, their extracted
+DICOMs are kept, since metadata extraction needs them. Hence, dropping those
+is part of that step as well.
+
+While a dataset is pending aggregation, its DICOM metadata is read from the
+headers of its extracted files (see hirni-dicom2spec).
+"""
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from datalad.dochelpers import exc_str
+from datalad.utils import with_pathsep
+
+from datalad_hirni.support.path_queue import PathQueue
+
+lgr = logging.getLogger('datalad.hirni.aggregation')
+
+
+def _get_queue(ds):
+    return PathQueue(ds, 'aggregation')
+
+
+def schedule_aggregation(ds, paths):
+    """Record DICOM datasets to have their metadata aggregated into `ds`"""
+
+    _get_queue(ds).add(paths)
+
+
+def get_pending(ds):
+    """Get the paths of all datasets with pending aggregation
+
+    Returns
+    -------
+    list of str
+      absolute paths in order of scheduling, without duplicates
+    """
+
+    return _get_queue(ds).pending()
+
+
+def run_aggregation(ds, paths=None, jobs=None):
+    """Aggregate metadata of DICOM datasets into `ds` in a single step
+
+    Afterwards, extracted DICOMs of the datasets that were pending are
+    dropped.
+
+    Parameters
+    ----------
+    ds: Dataset
+      study dataset
+    paths: list of str, optional
+      datasets to aggregate. By default all pending ones.
+    jobs: int, optional
+      number of datasets to drop extracted DICOMs from in parallel. Defaults
+      to `datalad.hirni.aggregate.jobs`.
+
+    Yields
+    ------
+    dict
+      result records
+    """
+
+    # bound dataset method
+    import datalad_metalad.aggregate
+    from datalad_hirni.commands.import_dicoms import _drop_extracted
+
+    if jobs is None:
+        jobs = int(ds.config.get('datalad.hirni.aggregate.jobs', default=1))
+
+    pending = get_pending(ds)
+    if paths is None:
+        paths = pending
+    if not paths:
+        return
+
+    res_kwargs = dict(action='hirni aggregate', type='dataset', logger=lgr)
+    failed = False
+    # Note: use path with trailing slash to indicate we want metadata about
+    # the content of these subdatasets, not the subdatasets themselves.
+    for r in ds.meta_aggregate([with_pathsep(p) for p in paths],
+                               into='top',
+                               return_type='generator',
+                               result_renderer='disabled',
+                               on_failure='ignore'):
+        if r.get('status') not in ('ok', 'notneeded'):
+            failed = True
+            yield r
+    if failed:
+        # leave everything pending (and its content in place) to try again
+        return
+
+    to_drop = [p for p in paths if p in pending]
+    with ProcessPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        drops = [(p, pool.submit(_drop_extracted, p)) for p in to_drop]
+        for p, future in drops:
+            try:
+                future.result()
+            except Exception as e:
+                lgr.warning("Failed to drop extracted DICOMs in %s: %s",
+                            p, exc_str(e))
+    _get_queue(ds).remove(paths)
+
+    for p in paths:
+        yield dict(status='ok', path=p, **res_kwargs)
+
+
+def aggregate_if_due(ds, jobs=None):
+    """Run pending aggregation, if the configured threshold is reached
+
+    `datalad.hirni.aggregate.threshold` is the number of pending datasets
+    that triggers aggregation of all of them. With the default of 1, datasets
+    are aggregated right away. Set to 0 to never aggregate automatically.
+
+    Yields
+    ------
+    dict
+      result records
+    """
+
+    threshold = int(ds.config.get('datalad.hirni.aggregate.threshold',
+                                  default=1))
+    if threshold < 1 or len(get_pending(ds)) < threshold:
+        return
+    for r in run_aggregation(ds, jobs=jobs):
+        yield r
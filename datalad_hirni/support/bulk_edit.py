@@ -0,0 +1,184 @@
+"""Editing of many specification snippets in a single pass
+
+A `SnippetFilter` selects snippets, whose editable fields are then set and/or
+(un)approved by `edit_file`. Each specification file is read line by line
+and lines are pre-filtered on their raw text, so that snippets that can't
+match aren't decoded at all. Lines of snippets that didn't change are
+written back byte for byte and a file is only replaced (atomically), if
+anything changed.
+"""
+
+import fnmatch
+import json
+import logging
+import re
+
+from datalad_hirni.support.spec_catalog import encode_value
+from datalad_hirni.support.spec_helpers import (
+    _type_pattern,
+    atomic_write,
+    dump_snippet,
+)
+
+lgr = logging.getLogger('datalad.hirni.bulk_edit')
+
+
+def _is_glob(pattern):
+    return any(c in pattern for c in '*?[')
+
+
+def _get_value(snippet, key):
+    value = snippet.get(key)
+    return value['value'] if isinstance(value, dict) and 'value' in value \
+        else value
+
+
+class SnippetFilter(object):
+    """Selection of specification snippets
+
+    All given criteria need to be met.
+
+    Parameters
+    ----------
+    type: str, optional
+      snippet type or glob pattern of types, e.g. 'generic_*'
+    uid: str, optional
+      series UID or glob pattern of them
+    match: dict, optional
+      field name to value mapping; values are compared as encoded by
+      `spec_catalog.encode_value`, so that '401' matches 401
+    regex: dict, optional
+      field name to regular expression mapping, e.g.
+      {'description': '^func'}; searched for in the (string of the) value
+    unapproved: list of str, optional
+      names of fields that need to be present, but not approved
+    tags: list of str, optional
+      tags a snippet needs to have (all of them)
+    """
+
+    def __init__(self, type=None, uid=None, match=None, regex=None,
+                 unapproved=None, tags=None):
+        self.type = type
+        self.uid = uid
+        self.match = {k: encode_value(v) for k, v in (match or {}).items()}
+        self.regex = {k: re.compile(v) for k, v in (regex or {}).items()}
+        self.unapproved = unapproved or []
+        self.tags = tags or []
+
+    def prefilter(self, line):
+        """Whether the undecoded `line` might hold a matching snippet"""
+
+        if self.type is not None and not _is_glob(self.type):
+            found = _type_pattern.findall(line)
+            # a nested "type" key could match as well; only skip if none does
+            if found and not any(json.loads('"' + v + '"') == self.type
+                                 for v in found):
+                return False
+        if self.uid is not None and not _is_glob(self.uid) and \
+                '"{}"'.format(self.uid) not in line:
+            return False
+        return True
+
+    def __call__(self, snippet):
+        if self.type is not None and \
+                not fnmatch.fnmatchcase(snippet.get('type', ''), self.type):
+            return False
+        if self.uid is not None and \
+                not fnmatch.fnmatchcase(snippet.get('uid') or '', self.uid):
+            return False
+        for k, v in self.match.items():
+            if k not in snippet or encode_value(_get_value(snippet, k)) != v:
+                return False
+        for k, pattern in self.regex.items():
+            value = _get_value(snippet, k)
+            if value is None or not pattern.search(
+                    value if isinstance(value, str) else json.dumps(value)):
+                return False
+        for k in self.unapproved:
+            field = snippet.get(k)
+            if not isinstance(field, dict) or field.get('approved', False):
+                return False
+        tags = snippet.get('tags') or []
+        return all(t in tags for t in self.tags)
+
+
+def edit_snippet(snippet, values=None, approve=None, unapprove=None):
+    """Set and (un)approve editable fields of a snippet in place
+
+    Fields to be set, that don't exist yet, are added as unapproved.
+    Approving or unapproving a field that doesn't exist does nothing.
+
+    Returns
+    -------
+    bool
+      whether the snippet changed
+    """
+
+    changed = False
+    for k, v in (values or {}).items():
+        field = snippet.get(k)
+        if isinstance(field, dict) and 'value' in field:
+            if field['value'] != v:
+                field['value'] = v
+                changed = True
+        else:
+            snippet[k] = {'value': v, 'approved': False}
+            changed = True
+    for keys, approved in ((approve or [], True), (unapprove or [], False)):
+        for k in keys:
+            field = snippet.get(k)
+            if isinstance(field, dict) and 'value' in field and \
+                    field.get('approved', False) != approved:
+                field['approved'] = approved
+                changed = True
+    return changed
+
+
+def edit_file(path, snippet_filter, values=None, approve=None,
+              unapprove=None):
+    """Edit all snippets of a specification file selected by a filter
+
+    Parameters
+    ----------
+    path: str
+      specification file
+    snippet_filter: SnippetFilter
+    values: dict, optional
+      field name to value mapping to set
+    approve: list of str, optional
+      names of fields to approve
+    unapprove: list of str, optional
+      names of fields to unapprove
+
+    Returns
+    -------
+    tuple
+      number of matching and of changed snippets
+    """
+
+    matched = changed = 0
+    lines = []
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.strip():
+                lines.append(line)
+                continue
+            text = line.decode('utf-8')
+            if not snippet_filter.prefilter(text):
+                lines.append(line)
+                continue
+            snippet = json.loads(text)
+            if not snippet_filter(snippet):
+                lines.append(line)
+                continue
+            matched += 1
+            if edit_snippet(snippet, values=values, approve=approve,
+                            unapprove=unapprove):
+                changed += 1
+                line = dump_snippet(snippet)
+            lines.append(line)
+    if changed:
+        atomic_write(path, b''.join(lines))
+    lgr.debug("%d of %d matching snippet(s) changed in %s",
+              changed, matched, path)
+    return matched, changed
@@ -0,0 +1,232 @@
+"""Singularity containers kept running across procedure calls
+
+datalad-container executes a command in a container via the container's
+`cmdexec` format string, which by default is `singularity exec {img} {cmd}`.
+This starts (and verifies) the image from scratch for each call. Instead a
+pool starts a Singularity instance of a container once and lets subsequent
+calls execute in that instance, by overriding `cmdexec` with
+`singularity exec instance://<instance> {cmd}`. The override is passed via
+the environment (DATALAD_CONTAINERS_<NAME>_CMDEXEC), so it applies to
+`datalad containers-run` called from within procedures, too. Since
+`singularity exec` passes the caller's environment on, run substitutions
+still reach the command within the container.
+
+Options of the container's `singularity exec` call are split: those setting
+up the container (like --bind or --contain) are applied when starting the
+instance, those applying to each execution (like --cleanenv or --pwd) are
+kept in the override. A container with any other option isn't run as an
+instance. The dataset is bound into the instance explicitly, since an
+instance mounts the working directory of the process starting it, not the
+one of the procedures executing in it.
+"""
+
+import atexit
+import logging
+import os
+import re
+import shlex
+import shutil
+import subprocess
+
+lgr = logging.getLogger('datalad.hirni.container_pool')
+
+# cmdexec formats, that can be turned into an execution within an instance
+_singularity_exec = re.compile(
+    r'^singularity exec\s+(?P<options>.*?)\s*\{img\}\s+\{cmd\}$')
+
+# options of `singularity exec` setting up the container, which are applied
+# when starting an instance; flags and options taking a value
+_instance_flags = {
+    '-c', '--contain', '-C', '--containall', '--no-home', '-w', '--writable',
+    '--writable-tmpfs', '--nv', '--rocm', '-u', '--userns', '-n', '--net',
+    '--keep-privs', '--no-privs', '-f', '--fakeroot', '--no-init'}
+_instance_options = {
+    '-B', '--bind', '-H', '--home', '-o', '--overlay', '--mount',
+    '--no-mount', '--network', '--network-args', '--dns', '--hostname',
+    '--add-caps', '--drop-caps', '--security', '-S', '--scratch', '-W',
+    '--workdir', '--apply-cgroups'}
+# options applying to each execution within an instance
+_exec_flags = {'-e', '--cleanenv'}
+_exec_options = {'--pwd', '--env', '--env-file', '--app'}
+
+
+def _split_options(options):
+    """Split `singularity exec` options into those for starting an instance
+    and those for each execution within it
+
+    Returns
+    -------
+    (list, list) or None
+      None if an option can't be classified
+    """
+
+    try:
+        args = shlex.split(options)
+    except ValueError:
+        return None
+    instance, exec_ = [], []
+    while args:
+        arg = args.pop(0)
+        name = arg.split('=', 1)[0]
+        target = instance if name in _instance_flags | _instance_options \
+            else exec_ if name in _exec_flags | _exec_options \
+            else None
+        if target is None:
+            return None
+        target.append(arg)
+        if name in _instance_options | _exec_options and '=' not in arg:
+            if not args:
+                return None
+            target.append(args.pop(0))
+    if any('{' in arg for arg in instance):
+        # placeholders only datalad-container can fill in
+        return None
+    return instance, exec_
+
+
+def _get_env_var(name):
+    """Get the environment variable to override `name`'s cmdexec with
+
+    Returns
+    -------
+    str or None
+      None if `name` can't be expressed as an environment variable
+    """
+
+    if '_' in name or '.' in name or name != name.lower():
+        return None
+    return 'DATALAD_CONTAINERS_{}_CMDEXEC'.format(
+        name.upper().replace('-', '__'))
+
+
+class ContainerPool(object):
+    """Running Singularity instances of containers
+
+    Instances are stopped by `stop`, and at the latest when the process
+    exits.
+    """
+
+    def __init__(self):
+        # container path -> (instance name, env var, cmdexec override)
+        self._instances = dict()
+        atexit.register(self.stop)
+
+    @property
+    def env(self):
+        """Environment variables to patch in for using the instances"""
+        return {var: cmdexec
+                for instance, var, cmdexec in self._instances.values()}
+
+    def start(self, ds, names):
+        """Start instances of containers `names` known to dataset `ds`
+
+        Containers already running are left alone.
+
+        Parameters
+        ----------
+        ds: Dataset
+        names: list of str
+          container names as reported by `datalad containers-list -r`
+
+        Yields
+        ------
+        dict
+          result records
+        """
+
+        # bound dataset method
+        import datalad_container.containers_list
+        res_kwargs = dict(action='hirni warm container', type='file',
+                          logger=lgr)
+
+        if not shutil.which('singularity'):
+            yield dict(status='impossible',
+                       path=ds.path,
+                       message="singularity not found",
+                       **res_kwargs)
+            return
+
+        containers = {c['name']: c
+                      for c in ds.containers_list(recursive=True,
+                                                  return_type='generator',
+                                                  result_renderer='disabled')}
+        for name in names:
+            container = containers.get(name)
+            if container is None:
+                yield dict(status='impossible',
+                           path=ds.path,
+                           message=("unknown container %s", name),
+                           **res_kwargs)
+                continue
+            path = container['path']
+            if path in self._instances:
+                yield dict(status='notneeded', path=path, **res_kwargs)
+                continue
+            # the name local to the dataset defining the container is what
+            # datalad-container's config lookup uses
+            env_var = _get_env_var(name.split('/')[-1])
+            match = _singularity_exec.match(
+                container.get('cmdexec', 'singularity exec {img} {cmd}'))
+            if env_var is None or match is None:
+                yield dict(status='impossible',
+                           path=path,
+                           message=("can't run container %s as an instance",
+                                    name),
+                           **res_kwargs)
+                continue
+            options = _split_options(match.group('options'))
+            if options is None:
+                yield dict(status='impossible',
+                           path=path,
+                           message=("can't run container %s as an instance: "
+                                    "unknown singularity exec options '%s'",
+                                    name, match.group('options')),
+                           **res_kwargs)
+                continue
+
+            ds.get(path, return_type='list', result_renderer='disabled')
+            instance = 'hirni-{}-{}'.format(
+                re.sub(r'[^\w-]', '-', name), os.getpid())
+            instance_options, exec_options = options
+            cmd = ['singularity', 'instance', 'start'] + instance_options + \
+                ['--bind', ds.path, path, instance]
+            lgr.debug("Starting container instance: %s", cmd)
+            try:
+                subprocess.run(cmd, check=True, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+            except subprocess.CalledProcessError as e:
+                yield dict(status='error',
+                           path=path,
+                           message=("failed to start instance of %s: %s",
+                                    name, e.stderr.decode(errors='replace')),
+                           **res_kwargs)
+                continue
+            self._instances[path] = (
+                instance, env_var,
+                ' '.join(['singularity', 'exec'] +
+                         [shlex.quote(o) for o in exec_options] +
+                         ['instance://{}'.format(instance), '{cmd}']))
+            yield dict(status='ok', path=path,
+                       message=("started instance %s", instance),
+                       **res_kwargs)
+
+    def stop(self):
+        """Stop all instances"""
+
+        for path, (instance, var, cmdexec) in list(self._instances.items()):
+            lgr.debug("Stopping container instance %s", instance)
+            subprocess.run(['singularity', 'instance', 'stop', instance],
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            del self._instances[path]
+
+
+# pool of this process; a long-running process (like hirni-daemon) keeps
+# instances running across commands, if so configured
+_pool = None
+
+
+def get_container_pool():
+    global _pool
+    if _pool is None:
+        _pool = ContainerPool()
+    return _pool
@@ -0,0 +1,198 @@
+"""Long-running process executing hirni commands on behalf of clients
+
+Running a hirni command as a process of its own comes with the cost of
+starting python, importing datalad, discovering extensions, reading the
+configuration and instantiating datasets. The daemon pays that once and then
+executes commands submitted by `hirni-client` via a Unix socket. Commands are
+executed one at a time, since they operate on the same study dataset.
+"""
+
+import logging
+import os
+import os.path as op
+import socket
+import threading
+from os import makedirs
+
+from datalad.dochelpers import exc_str
+
+from datalad_hirni import command_suite
+from datalad_hirni.client import (
+    get_socket_path,
+    iter_messages,
+    send_message,
+)
+
+lgr = logging.getLogger('datalad.hirni.daemon')
+
+
+def get_command_map():
+    """Map names of hirni commands to their python API names
+
+    Commandline names are accepted with and without the 'hirni-' prefix.
+    """
+
+    commands = dict()
+    for mod, cls, cmdline_name, api_name in command_suite[1]:
+        if api_name == 'hirni_daemon':
+            continue
+        for name in (cmdline_name, api_name):
+            commands[name] = api_name
+            if name.startswith('hirni'):
+                commands[name[len('hirni') + 1:]] = api_name
+    return commands
+
+
+def _sanitize(res):
+    # loggers (and alike) can't be send over the wire
+    return {k: v for k, v in res.items() if k != 'logger'}
+
+
+class HirniDaemon(object):
+    """Serve hirni commands for a study dataset via a Unix socket
+
+    Parameters
+    ----------
+    ds: Dataset
+      study dataset commands are executed in, unless a client specifies a
+      dataset itself
+    socket_path: str, optional
+      defaults to a socket within the dataset's .git directory
+    """
+
+    def __init__(self, ds, socket_path=None):
+        self.ds = ds
+        self.socket_path = socket_path or get_socket_path(ds.path)
+        self.commands = get_command_map()
+        self.jobs = 0
+        # commands are executed one at a time
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _bind(self):
+        if op.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+            except socket.error:
+                # left behind by a daemon that didn't shut down cleanly
+                os.remove(self.socket_path)
+            else:
+                raise RuntimeError("hirni-daemon already running at {}"
+                                   "".format(self.socket_path))
+            finally:
+                probe.close()
+        elif not op.exists(op.dirname(self.socket_path)):
+            makedirs(op.dirname(self.socket_path))
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.socket_path)
+        sock.listen(5)
+        # wake up regularly to check whether to stop
+        sock.settimeout(0.5)
+        return sock
+
+    def serve(self):
+        """Serve clients until shut down by one of them"""
+
+        # bind dataset methods once for all commands
+        import datalad.api
+
+        sock = self._bind()
+        lgr.info("hirni-daemon listening at %s", self.socket_path)
+        threads = []
+        try:
+            while not self._stop.is_set():
+                try:
+                    conn, _ = sock.accept()
+                except socket.timeout:
+                    continue
+                conn.settimeout(None)
+                t = threading.Thread(target=self._handle, args=(conn,))
+                t.daemon = True
+                t.start()
+                threads.append(t)
+                threads = [t for t in threads if t.is_alive()]
+        finally:
+            sock.close()
+            if op.exists(self.socket_path):
+                os.remove(self.socket_path)
+        for t in threads:
+            t.join()
+
+    def shutdown(self):
+        self._stop.set()
+
+    def _handle(self, conn):
+        try:
+            for request in iter_messages(conn):
+                for res in self.run(request.get('command'),
+                                    request.get('kwargs', {}),
+                                    cwd=request.get('cwd'),
+                                    dataset=request.get('dataset')):
+                    send_message(conn, _sanitize(res))
+                # one request per connection
+                break
+        except Exception as e:
+            lgr.warning("Failed to serve hirni-client: %s", exc_str(e))
+        finally:
+            conn.close()
+
+    def run(self, command, kwargs, cwd=None, dataset=None):
+        """Execute a command and yield its results
+
+        The command is executed like it would be from the commandline within
+        `cwd`: Relative paths are resolved against `cwd` and a dataset given
+        as a path (`dataset` or one within `kwargs`) is the one the command
+        operates on.
+
+        Parameters
+        ----------
+        command: str
+        kwargs: dict
+          keyword arguments for the command
+        cwd: str, optional
+          client's working directory. Defaults to the served dataset.
+        dataset: str, optional
+          client's dataset, used unless `kwargs` specifies one. Defaults to
+          the served dataset.
+        """
+
+        res_kwargs = dict(action='hirni daemon', path=self.ds.path,
+                          type='dataset')
+        if command == 'ping':
+            yield dict(status='ok', message='pong', **res_kwargs)
+            return
+        if command == 'shutdown':
+            self.shutdown()
+            yield dict(status='ok', message='shutting down', **res_kwargs)
+            return
+        api_name = self.commands.get(command)
+        if api_name is None:
+            yield dict(status='impossible',
+                       message=("unknown command: %s", command),
+                       **res_kwargs)
+            return
+
+        import datalad.api
+        cwd = cwd or self.ds.path
+        kwargs = dict(kwargs)
+        # Note: Pass the dataset as a path (rather than a Dataset instance),
+        # the way the commandline does, so that paths are resolved the same.
+        kwargs.setdefault('dataset', dataset or self.ds.path)
+        kwargs.update(return_type='generator',
+                      result_renderer='disabled',
+                      on_failure='ignore')
+        with self._lock:
+            self.jobs += 1
+            lgr.debug("Running %s(%s) in %s", api_name, kwargs, cwd)
+            # The working directory is process-wide, but commands are
+            # executed one at a time.
+            prev_cwd = os.getcwd()
+            try:
+                os.chdir(cwd)
+                for res in getattr(datalad.api, api_name)(**kwargs):
+                    yield res
+            except Exception as e:
+                yield dict(status='error', message=exc_str(e), **res_kwargs)
+            finally:
+                os.chdir(prev_cwd)
@@ -0,0 +1,276 @@
+"""Access DICOM headers without the need for aggregated metadata
+
+Headers are read from a tarball without extracting it or from the files of a
+DICOM dataset.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import os.path as op
+import tarfile
+
+from datalad.support import json_py
+
+lgr = logging.getLogger('datalad.hirni.dicom_tarball')
+
+# location of DICOM series metadata within a DICOM dataset, that was imported
+# without extracting its tarball; relative to the dataset's root
+series_metadata_file = op.join('.datalad', 'hirni', 'dicomseries.json')
+
+
+def iter_tarball_members(tarball):
+    """Stream through the regular files of a tarball
+
+    The archive is read sequentially, so this works for compressed archives
+    as well without ever seeking backwards.
+
+    Parameters
+    ----------
+    tarball: str
+      path to the archive
+
+    Yields
+    ------
+    (TarInfo, bytes)
+      the member's info and its content
+    """
+
+    with tarfile.open(tarball, mode='r|*') as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            yield member, tar.extractfile(member).read()
+
+
+def read_dicom_header(content, name=None):
+    """Parse the DICOM header from a file's content up to the pixel data
+
+    Parameters
+    ----------
+    content: bytes or file-like
+      content of a (potential) DICOM file
+    name: str, optional
+      name of the file for logging purposes
+
+    Returns
+    -------
+    pydicom.dataset.Dataset or None
+      None, if `content` isn't a DICOM image
+    """
+
+    from datalad_neuroimaging.extractors.dicom import (
+        dcm,
+        DicomDir,
+        InvalidDicomError,
+    )
+
+    fileobj = io.BytesIO(content) if isinstance(content, bytes) else content
+    try:
+        d = dcm.read_file(fileobj, defer_size=1000, stop_before_pixels=True)
+    except InvalidDicomError:
+        lgr.debug('"%s" does not look like a DICOM file, skipped', name)
+        return None
+
+    if isinstance(d, DicomDir) or not hasattr(d, 'SeriesInstanceUID'):
+        lgr.debug("%s is no DICOM image, skipped", name)
+        return None
+    return d
+
+
+def get_first_dicom_header(tarball):
+    """Get the header of the first DICOM image within a tarball
+
+    The archive is streamed until the first DICOM image is found and only
+    its header is parsed.
+
+    Returns
+    -------
+    dict or None
+      header fields of the first DICOM image in archive order, None if there
+      is no DICOM image at all
+    """
+
+    from datalad_neuroimaging.extractors.dicom import _struct2dict
+
+    with tarfile.open(tarball, mode='r|*') as tar:
+        for member in tar:
+            if not member.isfile() or \
+                    op.basename(member.name).startswith('PSg'):
+                continue
+            header = read_dicom_header(tar.extractfile(member),
+                                       name=member.name)
+            if header is not None:
+                return _struct2dict(header)
+    return None
+
+
+# hash based git-annex backends, whose keys can be computed here; each comes
+# with a *E variant adding the file's extension to the key
+annex_hash_backends = ('MD5', 'SHA1', 'SHA256', 'SHA512')
+
+
+def get_key_extension(name, maxlen=4):
+    """Get the extension git-annex's *E backends add to the key of a file
+
+    Like git-annex, this is up to two trailing extensions of file `name`,
+    consisting of alphanumeric characters and no longer than `maxlen` (git
+    config annex.maxextensionlength) each.
+    """
+
+    extensions = []
+    for ext in reversed(op.basename(name).split('.')[1:]):
+        if len(ext) > maxlen:
+            break
+        if all(c.isalnum() for c in ext):
+            extensions.append(ext)
+    return ''.join('.' + ext for ext in reversed(extensions[:2]) if ext)
+
+
+def get_annex_key(content, name, backend='MD5E'):
+    """Compute the git-annex key for a file's content
+
+    Parameters
+    ----------
+    content: bytes
+    name: str
+      name of the file; *E backends add its extension to the key
+    backend: str
+      git-annex backend; one of `annex_hash_backends` or their *E variant
+    """
+
+    hash_name = backend[:-1] if backend.endswith('E') else backend
+    if hash_name not in annex_hash_backends:
+        raise ValueError("can't compute keys of git-annex backend {}"
+                         "".format(backend))
+    key = '{backend}-s{size}--{hash}'.format(
+        backend=backend,
+        size=len(content),
+        hash=hashlib.new(hash_name.lower(), content).hexdigest())
+    if hash_name != backend:
+        key += get_key_extension(name)
+    return key
+
+
+class SeriesCollector(object):
+    """Builds the per-series DICOM metadata from individual headers
+
+    The result matches the 'Series' list reported by datalad-neuroimaging's
+    DICOM metadata extractor, which is what hirni-dicom2spec consumes.
+    """
+
+    def __init__(self):
+        self._series = dict()
+
+    def add(self, header, path):
+        """Record the header of the DICOM file at `path`
+
+        `path` is relative to the archive's or the dataset's root.
+        """
+
+        from datalad_neuroimaging.extractors.dicom import (
+            _convert_value,
+            _struct2dict,
+        )
+
+        if op.basename(path).startswith('PSg'):
+            # see datalad-neuroimaging's extractor (gh-2210)
+            lgr.debug("Ignoring DICOM file %s", path)
+            return
+
+        uid = header.SeriesInstanceUID
+        if uid not in self._series:
+            # start with the metadata of the first DICOM in a series
+            series = _struct2dict(header)
+            series_dir = op.dirname(path)
+            series['SeriesDirectory'] = series_dir if series_dir else op.curdir
+        else:
+            series = self._series[uid]
+            # only keep what's identical across all images in the series
+            series = {k: series[k] for k in series
+                      if _convert_value(getattr(header, k, None)) == series[k]}
+        self._series[uid] = series
+
+    @property
+    def series(self):
+        return list(self._series.values())
+
+
+def scan_tarball(tarball, backend='MD5E'):
+    """Hash all members of a tarball and collect DICOM series metadata
+
+    Parameters
+    ----------
+    tarball: str
+      path to the archive
+    backend: str
+      git-annex backend to compute the members' keys for (see
+      `get_annex_key`)
+
+    Returns
+    -------
+    (list of tuple, list of dict)
+      (path, size, annex key) for every regular file in the archive and the
+      metadata of all DICOM series found in it
+    """
+
+    members = []
+    collector = SeriesCollector()
+    for member, content in iter_tarball_members(tarball):
+        members.append((member.name.lstrip('/'), member.size,
+                        get_annex_key(content, member.name, backend)))
+        header = read_dicom_header(content, name=member.name)
+        if header is not None:
+            collector.add(header, member.name)
+    return members, collector.series
+
+
+def scan_dicom_dataset(ds_path):
+    """Collect DICOM series metadata from the files of a DICOM dataset
+
+    Only headers of files whose content is present are read. The result
+    matches what datalad-neuroimaging's extractor reports for the dataset, and
+    doesn't need any metadata aggregation to happen first.
+
+    Returns
+    -------
+    list of dict
+    """
+
+    collector = SeriesCollector()
+    for root, dirs, files in os.walk(ds_path):
+        if root == ds_path:
+            dirs[:] = [d for d in dirs if d not in ('.git', '.datalad')]
+        dirs.sort()
+        for f in sorted(files):
+            path = op.join(root, f)
+            if not op.exists(path):
+                # annexed file without content
+                continue
+            with open(path, 'rb') as fileobj:
+                header = read_dicom_header(fileobj, name=path)
+            if header is not None:
+                collector.add(header, op.relpath(path, ds_path))
+    return collector.series
+
+
+def write_series_metadata(ds_path, series):
+    """Store DICOM series metadata within the DICOM dataset at `ds_path`"""
+
+    json_py.dump(series, op.join(ds_path, series_metadata_file))
+
+
+def read_series_metadata(ds_path):
+    """Read DICOM series metadata stored by `write_series_metadata`
+
+    Returns
+    -------
+    list of dict or None
+      None if the dataset at `ds_path` has no such record
+    """
+
+    fname = op.join(ds_path, series_metadata_file)
+    if not op.exists(fname):
+        return None
+    return json_py.load(fname)
@@ -1,5 +1,6 @@
 import logging
 import lzma
+import re
 from simplejson import loads as json_loads
 from os import environ
 
@@ -127,6 +128,29 @@ def load_stream(fname, compressed=False):
 # END datalad Snippet
 
 
+# Note: Copy of datalad_hirni.support.spec_helpers.load_stream_of_type, since
+# this heuristic needs to work without hirni being installed
+
+# matches any "type" key with a string value within a serialized snippet
+_type_pattern = re.compile(r'"type"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def load_stream_of_type(fname, type_):
+    """Load snippets of type `type_`, only decoding lines mentioning it"""
+
+    with open(fname, mode='r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            found = _type_pattern.findall(line)
+            if found and type_ not in [json_loads('"' + v + '"')
+                                       for v in found]:
+                continue
+            snippet = loads(line)
+            if snippet['type'] == type_:
+                yield snippet
+
+
 def create_key(template, outtype=('nii.gz',), annotation_classes=None):
     if template is None or not template:
         raise ValueError('Template must be a valid format string')
@@ -151,8 +175,8 @@ class SpecLoader(object):
         if self._spec is None:
             filename = environ.get('HIRNI_STUDY_SPEC')
             if filename:
-                self._spec = [d for d in load_stream(filename)
-                              if d['type'] == 'dicomseries']
+                self._spec = list(load_stream_of_type(filename,
+                                                      'dicomseries'))
             else:
                 # TODO: Just raise or try a default location first?
                 raise ValueError("No study specification provided. "
@@ -210,6 +234,170 @@ def infotoids(seqinfos, outdir):
             'subject': None}
 
 
+def get_bids_name(series_spec, subject):
+    """Get the path (without extension) a series is converted to
+
+    Parameters
+    ----------
+    series_spec: dict
+      valid 'dicomseries' specification snippet
+    subject: str
+      subject ID to use
+
+    Returns
+    -------
+    str
+      path relative to the BIDS dataset's root
+    """
+
+    dirname = filename = "sub-{}".format(subject)
+    # session
+    if has_specval(series_spec, 'bids-session'):
+        ses = get_specval(series_spec, 'bids-session')
+        dirname += "/ses-{}".format(ses)
+        filename += "_ses-{}".format(ses)
+
+    # data type
+    modality = get_specval(series_spec, 'bids-modality')
+    # make cannonical if possible
+    modality = modality_label_map.get(modality, modality)
+    # apply fixed mapping from modality -> data_type
+    data_type = datatype_labels_map[modality]
+
+    dirname += "/{}".format(data_type)
+
+    # TODO: Once special cases (like when to use '_mod-' prefix for modality
+    # are clear, integrate data type selection with spec_key list and
+    # thereby reduce code duplication further
+
+    if data_type == 'func':
+        # func/sub-<participant_label>[_ses-<session_label>]
+        # _task-<task_label>[_acq-<label>][_rec-<label>][_run-<index>][_echo-<index>]_<modality_label>.nii[.gz]
+
+        for spec_key in ['bids-task', 'bids-acquisition',
+                         'bids-reconstruction_algorithm', 'bids-run',
+                         'bids-echo']:
+            if has_specval(series_spec, spec_key):
+                filename += "_{}-{}".format(
+                        spec2bids_map[spec_key],
+                        get_specval(series_spec, spec_key))
+
+        filename += "_{}".format(modality)
+
+    if data_type == 'anat':
+        # anat/sub-<participant_label>[_ses-<session_label>]
+        # [_acq-<label>][_ce-<label>][_rec-<label>][_run-<index>][_mod-<label>]_<modality_label>.nii[.gz]
+
+        for spec_key in ['bids-acquisition',
+                         'bids-contrast_enhancement',
+                         'bids-reconstruction_algorithm',
+                         'bids-run']:
+            if has_specval(series_spec, spec_key):
+                filename += "_{}-{}".format(
+                        spec2bids_map[spec_key],
+                        get_specval(series_spec, spec_key))
+
+        # TODO: [_mod-<label>]  (modality if defaced, right?)
+        #       => simple bool 'defaced' in spec or is there more to it?
+
+        filename += "_{}".format(modality)
+
+    if data_type == 'dwi':
+        # dwi/sub-<participant_label>[_ses-<session_label>]
+        # [_acq-<label>][_run-<index>]_dwi.nii[.gz]
+
+        for spec_key in ['bids-acquisition',
+                         'bids-run']:
+            if has_specval(series_spec, spec_key):
+                filename += "_{}-{}".format(
+                        spec2bids_map[spec_key],
+                        get_specval(series_spec, spec_key))
+
+        # TODO: Double check: Is this always correct?
+        filename += "_dwi"
+
+    if data_type == 'swi':
+        # BIDS-Extension:
+        # https://docs.google.com/document/d/1kyw9mGgacNqeMbp4xZet3RnDhcMmf4_BmRgKaOkO2Sc
+        # swi/sub-<participant_label>[_ses-<session_label>]
+        #       [_acq-<label>][_rec-<label>]_part-<phase|mag>[_coil-<index>][_echo-<index>][_run-<index>]_GRE.nii[.gz]
+
+        for spec_key in ['bids-acquisition',
+                         'bids-reconstruction_algorithm',
+                         'bids-part',
+                         'bids-coil',
+                         'bids-echo',
+                         'bids-run',
+                         ]:
+            if has_specval(series_spec, spec_key):
+                filename += "_{}-{}".format(
+                        spec2bids_map[spec_key],
+                        get_specval(series_spec, spec_key))
+
+        filename += "_GRE"
+        
+    if data_type == 'fmap':
+        # Case 1: Phase difference image and at least one magnitude image
+        # sub-<participant_label>/[ses-<session_label>/]
+        # [_acq-<label>][_dir-<dir_label>][_run-<run_index>]_<modality_label>.nii[.gz]
+
+        # Note/TODO: fmap modalities:
+        # _phasediff
+        # _magnitude1
+        # _magnitude2
+        # _phase1
+        # _phase2
+        # _magnitude
+        # _fieldmap
+        # _epi
+
+        for spec_key in ['bids-acquisition',
+                         'bids-direction',
+                         'bids-run']:
+            if has_specval(series_spec, spec_key):
+                filename += "_{}-{}".format(
+                        spec2bids_map[spec_key],
+                        get_specval(series_spec, spec_key))
+
+        filename += "_{}".format(modality)
+
+    return dirname + '/' + filename
+
+
+def get_series_groups(series_specs, n_groups):
+    """Partition series into groups, that can be converted independently
+
+    Series converted to the same BIDS name are numbered by heudiconv and
+    therefore always end up in the same group. Otherwise groups are balanced
+    by their number of series.
+
+    Parameters
+    ----------
+    series_specs: list of dict
+      'dicomseries' specification snippets of an acquisition
+    n_groups: int
+      maximum number of groups
+
+    Returns
+    -------
+    list of list of str
+      series UIDs per group. Series not to be converted are left out.
+    """
+
+    by_name = dict()
+    for series_spec in series_specs:
+        if not validate_spec(series_spec):
+            continue
+        # subject is the same for all series of an acquisition
+        by_name.setdefault(get_bids_name(series_spec, None),
+                           []).append(series_spec['uid'])
+    groups = [[] for i in range(min(n_groups, len(by_name)))]
+    # biggest first, each onto the currently smallest group
+    for uids in sorted(by_name.values(), key=len, reverse=True):
+        min(groups, key=len).extend(uids)
+    return groups
+
+
 def infotodict(seqinfo):  # pragma: no cover
     """Heuristic evaluator for determining which runs belong where
 
@@ -219,11 +407,23 @@ def infotodict(seqinfo):  # pragma: no cover
     subject: participant id
     seqitem: run number during scanning
     subindex: sub index within group
+
+    If the environment variable HIRNI_SERIES_UIDS is set, only the series with
+    the (whitespace separated) UIDs listed therein are converted. This is used
+    to convert groups of series of an acquisition in parallel (see
+    `get_series_groups`).
     """
 
+    group = environ.get('HIRNI_SERIES_UIDS')
+    group = set(group.split()) if group else None
+
     info = dict()
     for idx, s in enumerate(seqinfo):
 
+        if group is not None and str(s.series_uid) not in group:
+            # converted as part of another group
+            continue
+
         # find in spec:
         candidates = [series for series in _spec.get_study_spec()
                       if str(s.series_uid) == series['uid']]
@@ -238,118 +438,7 @@ def infotodict(seqinfo):  # pragma: no cover
             lgr.debug("Series invalid (%s). Skip.", str(s.series_uid))
             continue
 
-        dirname = filename = "sub-{}".format(_spec.subject)
-        # session
-        if has_specval(series_spec, 'bids-session'):
-            ses = get_specval(series_spec, 'bids-session')
-            dirname += "/ses-{}".format(ses)
-            filename += "_ses-{}".format(ses)
-
-        # data type
-        modality = get_specval(series_spec, 'bids-modality')
-        # make cannonical if possible
-        modality = modality_label_map.get(modality, modality)
-        # apply fixed mapping from modality -> data_type
-        data_type = datatype_labels_map[modality]
-
-        dirname += "/{}".format(data_type)
-
-        # TODO: Once special cases (like when to use '_mod-' prefix for modality
-        # are clear, integrate data type selection with spec_key list and
-        # thereby reduce code duplication further
-
-        if data_type == 'func':
-            # func/sub-<participant_label>[_ses-<session_label>]
-            # _task-<task_label>[_acq-<label>][_rec-<label>][_run-<index>][_echo-<index>]_<modality_label>.nii[.gz]
-
-            for spec_key in ['bids-task', 'bids-acquisition',
-                             'bids-reconstruction_algorithm', 'bids-run',
-                             'bids-echo']:
-                if has_specval(series_spec, spec_key):
-                    filename += "_{}-{}".format(
-                            spec2bids_map[spec_key],
-                            get_specval(series_spec, spec_key))
-
-            filename += "_{}".format(modality)
-
-        if data_type == 'anat':
-            # anat/sub-<participant_label>[_ses-<session_label>]
-            # [_acq-<label>][_ce-<label>][_rec-<label>][_run-<index>][_mod-<label>]_<modality_label>.nii[.gz]
-
-            for spec_key in ['bids-acquisition',
-                             'bids-contrast_enhancement',
-                             'bids-reconstruction_algorithm',
-                             'bids-run']:
-                if has_specval(series_spec, spec_key):
-                    filename += "_{}-{}".format(
-                            spec2bids_map[spec_key],
-                            get_specval(series_spec, spec_key))
-
-            # TODO: [_mod-<label>]  (modality if defaced, right?)
-            #       => simple bool 'defaced' in spec or is there more to it?
-
-            filename += "_{}".format(modality)
-
-        if data_type == 'dwi':
-            # dwi/sub-<participant_label>[_ses-<session_label>]
-            # [_acq-<label>][_run-<index>]_dwi.nii[.gz]
-
-            for spec_key in ['bids-acquisition',
-                             'bids-run']:
-                if has_specval(series_spec, spec_key):
-                    filename += "_{}-{}".format(
-                            spec2bids_map[spec_key],
-                            get_specval(series_spec, spec_key))
-
-            # TODO: Double check: Is this always correct?
-            filename += "_dwi"
-
-        if data_type == 'swi':
-            # BIDS-Extension:
-            # https://docs.google.com/document/d/1kyw9mGgacNqeMbp4xZet3RnDhcMmf4_BmRgKaOkO2Sc
-            # swi/sub-<participant_label>[_ses-<session_label>]
-            #       [_acq-<label>][_rec-<label>]_part-<phase|mag>[_coil-<index>][_echo-<index>][_run-<index>]_GRE.nii[.gz]
-
-            for spec_key in ['bids-acquisition',
-                             'bids-reconstruction_algorithm',
-                             'bids-part',
-                             'bids-coil',
-                             'bids-echo',
-                             'bids-run',
-                             ]:
-                if has_specval(series_spec, spec_key):
-                    filename += "_{}-{}".format(
-                            spec2bids_map[spec_key],
-                            get_specval(series_spec, spec_key))
-
-            filename += "_GRE"
-            
-        if data_type == 'fmap':
-            # Case 1: Phase difference image and at least one magnitude image
-            # sub-<participant_label>/[ses-<session_label>/]
-            # [_acq-<label>][_dir-<dir_label>][_run-<run_index>]_<modality_label>.nii[.gz]
-
-            # Note/TODO: fmap modalities:
-            # _phasediff
-            # _magnitude1
-            # _magnitude2
-            # _phase1
-            # _phase2
-            # _magnitude
-            # _fieldmap
-            # _epi
-
-            for spec_key in ['bids-acquisition',
-                             'bids-direction',
-                             'bids-run']:
-                if has_specval(series_spec, spec_key):
-                    filename += "_{}-{}".format(
-                            spec2bids_map[spec_key],
-                            get_specval(series_spec, spec_key))
-
-            filename += "_{}".format(modality)
-
-        key = create_key(dirname + '/' + filename)
+        key = create_key(get_bids_name(series_spec, _spec.subject))
         if key not in info:
             info[key] = []
 
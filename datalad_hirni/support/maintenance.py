@@ -0,0 +1,142 @@
+"""Deferred git maintenance of (sub)datasets within a study dataset
+
+Imports used to run `git gc` in every new DICOM dataset right away. Instead,
+datasets in need of maintenance are recorded in a queue within the study
+dataset's .git directory and maintained in bulk later on - either
+automatically, once a configurable number of datasets is pending, or
+explicitly via hirni-maintenance.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from datalad.distribution.dataset import Dataset
+from datalad.dochelpers import exc_str
+
+from datalad_hirni.support.path_queue import PathQueue
+
+lgr = logging.getLogger('datalad.hirni.maintenance')
+
+
+def _get_queue(ds):
+    return PathQueue(ds, 'maintenance')
+
+
+def schedule_maintenance(ds, paths):
+    """Record datasets in need of maintenance
+
+    Parameters
+    ----------
+    ds: Dataset
+      study dataset keeping the queue
+    paths: list of str
+      paths of the datasets to be maintained
+    """
+
+    _get_queue(ds).add(paths)
+
+
+def get_pending(ds):
+    """Get the paths of all datasets with pending maintenance
+
+    Returns
+    -------
+    list of str
+      absolute paths in order of scheduling, without duplicates
+    """
+
+    return _get_queue(ds).pending()
+
+
+def _needs_gc(repo, max_loose, max_packs):
+    out, err = repo.cmd_call_wrapper.run(['git', 'count-objects', '-v'])
+    counts = dict(line.split(': ', 1) for line in out.splitlines() if line)
+    return int(counts.get('count', 0)) > max_loose or \
+        int(counts.get('packs', 0)) > max_packs
+
+
+def maintain(path, max_loose=0, max_packs=1):
+    """Run `git gc` in the dataset at `path`, if it has anything to pack
+
+    Returns
+    -------
+    bool
+      whether `git gc` was run
+    """
+
+    repo = Dataset(path).repo
+    if not _needs_gc(repo, max_loose, max_packs):
+        return False
+    repo.cmd_call_wrapper.run(['git', 'gc'])
+    return True
+
+
+def run_maintenance(ds, paths=None, jobs=None):
+    """Maintain datasets concurrently
+
+    Parameters
+    ----------
+    ds: Dataset
+      study dataset
+    paths: list of str, optional
+      datasets to maintain. By default all pending ones. Any of them is
+      removed from the queue, if maintained successfully.
+    jobs: int, optional
+      number of datasets to maintain in parallel. Defaults to
+      `datalad.hirni.maintenance.jobs`.
+
+    Yields
+    ------
+    dict
+      result records
+    """
+
+    cfg = ds.config
+    if jobs is None:
+        jobs = int(cfg.get('datalad.hirni.maintenance.jobs', default=1))
+    max_loose = int(cfg.get('datalad.hirni.maintenance.max-loose-objects',
+                            default=0))
+    max_packs = int(cfg.get('datalad.hirni.maintenance.max-packs',
+                            default=1))
+
+    if paths is None:
+        paths = get_pending(ds)
+
+    done = []
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        futures = [(p, pool.submit(maintain, p, max_loose, max_packs))
+                   for p in paths]
+        for p, future in futures:
+            res = dict(action='hirni maintenance',
+                       path=p,
+                       type='dataset',
+                       logger=lgr)
+            try:
+                res['status'] = 'ok' if future.result() else 'notneeded'
+                done.append(p)
+            except Exception as e:
+                res.update(status='error', message=exc_str(e))
+            yield res
+
+    _get_queue(ds).remove(done)
+
+
+def maintain_if_due(ds):
+    """Run pending maintenance, if the configured threshold is reached
+
+    `datalad.hirni.maintenance.threshold` is the number of pending datasets
+    that triggers maintenance of all of them. With the default of 1, datasets
+    are maintained right away. Set to 0 to never maintain automatically.
+
+    Yields
+    ------
+    dict
+      result records
+    """
+
+    threshold = int(ds.config.get('datalad.hirni.maintenance.threshold',
+                                  default=1))
+    if threshold < 1 or len(get_pending(ds)) < threshold:
+        return
+    for r in run_maintenance(ds):
+        yield r
@@ -0,0 +1,233 @@
+"""Manifests of the BIDS files converted from an acquisition
+
+After conversion, hirni-spec2bids can record the files an acquisition's
+procedures wrote within its subject (and session) directories, along with
+their size and a content hash. Manifests are JSON files within the BIDS
+dataset at .hirni/manifests/<path of the specification file>, so that they
+are versioned along with the files they describe.
+
+The files are those the procedures committed (see `select_files`). Since
+other acquisitions of the same subject convert into the same directories,
+the scans and sessions tables, which procedures of all of them write to, are
+not recorded. A file converted again to the same content isn't committed
+anew, hence files recorded before are kept, as long as they exist.
+
+Verifying the BIDS dataset against the manifests takes a stat call per file
+and hashing the files whose size still matches, which is done in parallel.
+No git or git-annex call is involved.
+
+The hash algorithm is xxHash (XXH64), if the `xxhash` package is installed,
+or BLAKE2b otherwise. Either is considerably faster than the checksums
+git-annex uses for its keys. A manifest records the algorithm it was created
+with.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import os.path as op
+from concurrent.futures import ProcessPoolExecutor
+
+from datalad_hirni.support.spec_helpers import atomic_write
+
+lgr = logging.getLogger('datalad.hirni.manifest')
+
+# directory of the manifests within the BIDS dataset
+manifest_dir = op.join('.hirni', 'manifests')
+
+_chunksize = 1024 * 1024
+
+
+def _new_hash(algorithm):
+    if algorithm == 'xxh64':
+        import xxhash
+        return xxhash.xxh64()
+    elif algorithm == 'blake2b':
+        return hashlib.blake2b(digest_size=16)
+    raise ValueError("unknown hash algorithm {}".format(algorithm))
+
+
+def get_hash_algorithm():
+    """Get the fastest hash algorithm available"""
+
+    try:
+        import xxhash
+        return 'xxh64'
+    except ImportError:
+        return 'blake2b'
+
+
+def hash_file(path, algorithm):
+    hash_ = _new_hash(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_chunksize), b''):
+            hash_.update(chunk)
+    return hash_.hexdigest()
+
+
+def get_manifest_path(ds_path, rel_spec_path):
+    """Get the path of the manifest of a specification file
+
+    Parameters
+    ----------
+    ds_path: str
+      BIDS dataset
+    rel_spec_path: str
+      path of the specification file relative to `ds_path`
+    """
+
+    return op.join(ds_path, manifest_dir, rel_spec_path)
+
+
+def find_manifests(ds_path):
+    """Get the paths of all manifests within the BIDS dataset at `ds_path`"""
+
+    top = op.join(ds_path, manifest_dir)
+    return sorted(op.join(root, f)
+                  for root, dirs, files in os.walk(top)
+                  for f in files if not f.startswith('.'))
+
+
+def _is_shared(path):
+    # tables procedures of all acquisitions of a subject write to
+    return op.basename(path).endswith(('_scans.tsv', '_sessions.tsv'))
+
+
+def select_files(files, dirs):
+    """Select the files to record in the manifest of an acquisition
+
+    Parameters
+    ----------
+    files: iterable of str
+      paths relative to the BIDS dataset, the acquisition's procedures wrote
+    dirs: iterable of str
+      the acquisition's subject (and session) directories relative to the
+      BIDS dataset, like 'sub-01/ses-1'
+
+    Returns
+    -------
+    list of str
+      the files within `dirs`, except hidden ones (no BIDS files) and the
+      scans and sessions tables
+    """
+
+    dirs = [d.rstrip(op.sep) + op.sep for d in dirs]
+    return sorted(
+        f for f in set(files)
+        if f.startswith(tuple(dirs)) and not _is_shared(f) and
+        not any(p.startswith('.') for p in f.split(op.sep)))
+
+
+def _read_files(path):
+    # files recorded in an existing manifest
+    if not op.exists(path):
+        return []
+    try:
+        with open(path) as f:
+            return list(json.load(f)['files'])
+    except (ValueError, KeyError, TypeError) as e:
+        lgr.warning("Ignoring unreadable manifest %s: %s", path, e)
+        return []
+
+
+def _stat_and_hash(path, algorithm):
+    # module-level, to be run in worker processes
+    try:
+        size = os.stat(path).st_size
+    except OSError:
+        # a dangling symlink to annexed content that isn't present
+        return None, None
+    return size, hash_file(path, algorithm)
+
+
+def write_manifest(ds_path, rel_spec_path, files, jobs=1):
+    """Record `files` in the manifest of a specification
+
+    Files recorded in the manifest already are kept, as long as they exist.
+
+    Parameters
+    ----------
+    ds_path: str
+      BIDS dataset
+    rel_spec_path: str
+      path of the specification file relative to `ds_path`
+    files: list of str
+      paths relative to `ds_path` to record (see `select_files`)
+    jobs: int
+      number of files to hash in parallel
+
+    Returns
+    -------
+    str
+      path of the manifest
+    """
+
+    algorithm = get_hash_algorithm()
+    path = get_manifest_path(ds_path, rel_spec_path)
+    files = sorted(f for f in set(files).union(_read_files(path))
+                   if op.lexists(op.join(ds_path, f)))
+    with ProcessPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        stats = pool.map(_stat_and_hash,
+                         [op.join(ds_path, f) for f in files],
+                         [algorithm] * len(files),
+                         chunksize=64)
+        manifest = dict(
+            algorithm=algorithm,
+            spec=rel_spec_path,
+            files={f: dict(size=size, hash=hash_)
+                   for f, (size, hash_) in zip(files, stats)})
+    atomic_write(path, json.dumps(manifest, indent=1,
+                                  sort_keys=True).encode('utf-8'))
+    return path
+
+
+def _verify_file(path, size, hash_, algorithm):
+    # module-level, to be run in worker processes
+    try:
+        st = os.stat(path)
+    except OSError:
+        # Note: an annexed file, whose content isn't present, is reported as
+        # missing as well, unless it wasn't present when recording either
+        return 'missing' if size is not None or not op.lexists(path) \
+            else 'ok'
+    if size is None:
+        # content wasn't present when recording; nothing to compare
+        return 'ok'
+    if st.st_size != size:
+        return 'modified'
+    return 'ok' if hash_file(path, algorithm) == hash_ else 'modified'
+
+
+def verify_manifest(ds_path, path, jobs=1):
+    """Check the files recorded in a manifest
+
+    Parameters
+    ----------
+    ds_path: str
+      BIDS dataset
+    path: str
+      path of the manifest
+    jobs: int
+      number of files to check in parallel
+
+    Returns
+    -------
+    dict
+      file path (relative to `ds_path`) -> 'ok', 'missing' or 'modified'
+    """
+
+    with open(path) as f:
+        manifest = json.load(f)
+    algorithm = manifest['algorithm']
+    # fail early, if the algorithm isn't available
+    _new_hash(algorithm)
+    files = sorted(manifest['files'])
+    with ProcessPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        return dict(zip(files, pool.map(
+            _verify_file,
+            [op.join(ds_path, f) for f in files],
+            [manifest['files'][f]['size'] for f in files],
+            [manifest['files'][f]['hash'] for f in files],
+            [algorithm] * len(files),
+            chunksize=64)))
@@ -0,0 +1,124 @@
+"""On-disk cache of DICOM series metadata
+
+The DICOM series metadata of a dataset only depends on the dataset's state,
+which is identified by its ID and refcommit. Hence it is cached by those, so
+that querying it again for an unchanged DICOM dataset - whether from another
+command, another run or another study dataset - doesn't require to dump and
+decode the aggregated metadata again.
+
+Entries are gzip-compressed JSON files. Whenever the cache exceeds its size
+limit, the least recently used entries are evicted.
+"""
+
+import gzip
+import json
+import logging
+import os
+import os.path as op
+import tempfile
+from os import makedirs
+
+lgr = logging.getLogger('datalad.hirni.metadata_cache')
+
+
+class SeriesCache(object):
+    """Cache of DICOM series metadata keyed by dataset ID and refcommit
+
+    Parameters
+    ----------
+    path: str
+      directory to store the cache in
+    max_size: int
+      maximum size of the cache in bytes. With 0 nothing is cached.
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+
+    def _get_file(self, dsid, refcommit):
+        return op.join(self.path, '{}-{}.json.gz'.format(dsid, refcommit))
+
+    def get(self, dsid, refcommit):
+        """Get cached series metadata
+
+        Returns
+        -------
+        list of dict or None
+          None if not in cache
+        """
+
+        if not self.max_size or not dsid or not refcommit:
+            return None
+        fname = self._get_file(dsid, refcommit)
+        try:
+            with gzip.open(fname, 'rt', encoding='utf-8') as f:
+                series = json.load(f)
+        except (OSError, IOError, ValueError, EOFError):
+            return None
+        # mark as recently used
+        try:
+            os.utime(fname, None)
+        except OSError:
+            pass
+        lgr.debug("Metadata cache hit for %s@%s", dsid, refcommit)
+        return series
+
+    def put(self, dsid, refcommit, series):
+        """Store series metadata and evict old entries, if needed"""
+
+        if not self.max_size or not dsid or not refcommit:
+            return
+        if not op.exists(self.path):
+            makedirs(self.path)
+        fd, tmp_path = tempfile.mkstemp(prefix='.', dir=self.path)
+        try:
+            with os.fdopen(fd, 'wb') as raw, \
+                    gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                f.write(json.dumps(series, separators=(',', ':'))
+                        .encode('utf-8'))
+            os.replace(tmp_path, self._get_file(dsid, refcommit))
+        except Exception:
+            if op.lexists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until below the size limit"""
+
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.json.gz') and entry.is_file():
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(e[1] for e in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # removed by a concurrent process
+                pass
+            total -= size
+
+
+def get_series_cache(ds):
+    """Get the series metadata cache as configured for dataset `ds`
+
+    The location defaults to 'hirni/metadata' within
+    `datalad.locations.cache` and can be set via
+    `datalad.hirni.metadata-cache.path`. The size limit in MB is
+    `datalad.hirni.metadata-cache.max-size` (default: 100); 0 disables
+    caching.
+    """
+
+    cfg = ds.config
+    path = cfg.get('datalad.hirni.metadata-cache.path', default=None)
+    if not path:
+        path = op.join(cfg.obtain('datalad.locations.cache'),
+                       'hirni', 'metadata')
+    max_size = float(cfg.get('datalad.hirni.metadata-cache.max-size',
+                             default=100))
+    return SeriesCache(path, int(max_size * 1024 * 1024))
@@ -0,0 +1,186 @@
+"""Export of throughput metrics of hirni commands
+
+Metrics are derived from the spans and counters recorded by a command's
+tracer (see `datalad_hirni.support.tracing`) and written to local files only:
+
+- a text file in Prometheus' exposition format with cumulative counters, to be
+  picked up by node_exporter's textfile collector
+  (`datalad.hirni.metrics.textfile`)
+- a JSON-lines log with one record per command call
+  (`datalad.hirni.metrics.log`)
+"""
+
+import json
+import logging
+import os
+import os.path as op
+import re
+import time
+from contextlib import contextmanager
+
+from datalad_hirni.support.spec_helpers import atomic_write
+
+lgr = logging.getLogger('datalad.hirni.metrics')
+
+# (metric name, label name, help) in order of output
+metric_families = [
+    ('hirni_command_runs_total', 'command', "Number of hirni command calls"),
+    ('hirni_command_seconds_total', 'command',
+     "Time spent in hirni commands"),
+    ('hirni_command_failures_total', 'command',
+     "Number of failed results of hirni commands"),
+    ('hirni_command_last_run_timestamp_seconds', 'command',
+     "Time of the last call of a hirni command"),
+    ('hirni_stage_runs_total', 'stage',
+     "Number of times a stage of a hirni command was run"),
+    ('hirni_stage_seconds_total', 'stage',
+     "Time spent in a stage of a hirni command"),
+    ('hirni_events_total', 'event',
+     "Number of things processed by hirni commands, like DICOM series "
+     "specified, procedures run or bytes imported"),
+]
+
+_sample_line = re.compile(r'^(\w+)\{\w+="((?:[^"\\]|\\.)*)"\} (\S+)$')
+
+
+def get_metrics_targets(cfg):
+    """Get the configured metrics files
+
+    Returns
+    -------
+    tuple
+      paths of the text file and the JSON-lines log; each None if not
+      configured
+    """
+
+    return tuple(
+        op.expanduser(p) if p else None
+        for p in (cfg.get('datalad.hirni.metrics.textfile', default=None),
+                  cfg.get('datalad.hirni.metrics.log', default=None)))
+
+
+def _get_samples(tracer, duration, failures):
+    name = tracer.command
+    samples = {
+        ('hirni_command_runs_total', name): 1,
+        ('hirni_command_seconds_total', name): duration,
+        ('hirni_command_failures_total', name): failures,
+    }
+    for stage, s in tracer.summary().items():
+        samples[('hirni_stage_runs_total', stage)] = s['count']
+        samples[('hirni_stage_seconds_total', stage)] = s['total']
+    for event, value in tracer.counters.items():
+        samples[('hirni_events_total', event)] = value
+    return samples
+
+
+def _read_textfile(path):
+    samples = dict()
+    if not op.exists(path):
+        return samples
+    with open(path) as f:
+        for line in f:
+            match = _sample_line.match(line.strip())
+            if match:
+                metric, label, value = match.groups()
+                samples[(metric, label.replace('\\"', '"')
+                         .replace('\\\\', '\\'))] = float(value)
+    return samples
+
+
+def _format_textfile(samples):
+    lines = []
+    for metric, label_name, help_ in metric_families:
+        family = sorted((label, value)
+                        for (m, label), value in samples.items()
+                        if m == metric)
+        if not family:
+            continue
+        lines.append('# HELP {} {}'.format(metric, help_))
+        lines.append('# TYPE {} {}'.format(
+            metric, 'gauge' if 'timestamp' in metric else 'counter'))
+        for label, value in family:
+            lines.append('{}{{{}="{}"}} {}'.format(
+                metric, label_name,
+                label.replace('\\', '\\\\').replace('"', '\\"'),
+                repr(float(value)) if isinstance(value, float) else value))
+    return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def _locked(path):
+    try:
+        import fcntl
+    except ImportError:
+        # no locking available; concurrent updates might get lost
+        yield
+        return
+    with open(path + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def update_textfile(path, samples):
+    """Add `samples` to the cumulative counters in the text file at `path`"""
+
+    if op.dirname(path) and not op.exists(op.dirname(path)):
+        os.makedirs(op.dirname(path))
+    with _locked(path):
+        current = _read_textfile(path)
+        for key, value in samples.items():
+            if key[0].endswith('_timestamp_seconds'):
+                current[key] = value
+            else:
+                current[key] = current.get(key, 0) + value
+        # node_exporter must never see a partially written file
+        atomic_write(path, _format_textfile(current).encode('utf-8'))
+
+
+def append_log(path, record):
+    """Append `record` to the JSON-lines log at `path`"""
+
+    if op.dirname(path) and not op.exists(op.dirname(path)):
+        os.makedirs(op.dirname(path))
+    line = json.dumps(record, sort_keys=True, separators=(',', ':')) + '\n'
+    # a single write of a line to a file opened for appending doesn't
+    # interleave with the records of concurrent processes
+    with open(path, 'a') as f:
+        f.write(line)
+
+
+def record_metrics(targets, tracer, duration, failures):
+    """Write the metrics of a finished command call
+
+    Parameters
+    ----------
+    targets: tuple
+      as returned by `get_metrics_targets`
+    tracer: Tracer
+      tracer of the command call
+    duration: float
+      seconds the command took
+    failures: int
+      number of failed results
+    """
+
+    textfile, log = targets
+    now = time.time()
+    try:
+        if textfile:
+            samples = _get_samples(tracer, duration, failures)
+            samples[('hirni_command_last_run_timestamp_seconds',
+                     tracer.command)] = now
+            update_textfile(textfile, samples)
+        if log:
+            append_log(log, dict(
+                time=now,
+                command=tracer.command,
+                duration=round(duration, 6),
+                failures=failures,
+                stages=tracer.summary(),
+                events=tracer.counters))
+    except (IOError, OSError) as e:
+        lgr.warning("Failed to record metrics: %s", e)
@@ -0,0 +1,89 @@
+"""Record of datasets with pending (deferred) work"""
+
+from contextlib import contextmanager
+import os.path as op
+from os import makedirs
+from os import remove
+
+from datalad_hirni.support.spec_helpers import atomic_write
+
+
+class PathQueue(object):
+    """Queue of dataset paths within a study dataset's .git directory
+
+    Paths are appended one per line. Every access to the queue holds an
+    exclusive lock (on a '.lock' file next to it), so concurrent processes
+    don't lose each other's entries, when one of them removes paths while
+    another one adds some.
+
+    Parameters
+    ----------
+    ds: Dataset
+      study dataset keeping the queue
+    name: str
+      name of the queue
+    """
+
+    def __init__(self, ds, name):
+        self.ds = ds
+        self.path = op.join(ds.path, '.git', 'datalad', 'hirni', name)
+
+    @contextmanager
+    def _locked(self):
+        if not op.exists(op.dirname(self.path)):
+            makedirs(op.dirname(self.path))
+        try:
+            import fcntl
+        except ImportError:
+            # no locking available; concurrent updates might get lost
+            yield
+            return
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self):
+        if not op.exists(self.path):
+            return []
+        pending = []
+        with open(self.path) as f:
+            for line in f:
+                p = op.join(self.ds.path, line.rstrip('\n'))
+                if line.strip() and p not in pending:
+                    pending.append(p)
+        return pending
+
+    def add(self, paths):
+        """Record `paths` as pending"""
+
+        with self._locked():
+            with open(self.path, 'a') as f:
+                for p in paths:
+                    f.write(op.relpath(p, self.ds.path) + '\n')
+
+    def pending(self):
+        """Get all pending paths
+
+        Returns
+        -------
+        list of str
+          absolute paths in order of scheduling, without duplicates
+        """
+
+        with self._locked():
+            return self._read()
+
+    def remove(self, done):
+        """Remove `done` from the pending paths"""
+
+        with self._locked():
+            remaining = [p for p in self._read() if p not in done]
+            if remaining:
+                atomic_write(self.path, ''.join(
+                    op.relpath(p, self.ds.path) + '\n'
+                    for p in remaining).encode('utf-8'))
+            elif op.exists(self.path):
+                remove(self.path)
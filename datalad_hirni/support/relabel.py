@@ -0,0 +1,252 @@
+"""Reuse of converted BIDS files under another subject label
+
+An anonymized conversion differs from the regular one mainly by the subject
+label. Instead of converting the same DICOMs again, the files of a subject
+(session) are copied from a BIDS dataset converted without anonymization,
+with the subject label replaced in file names and within text files (like
+scans.tsv or the IntendedFor fields of JSON sidecars).
+
+A copy must not reveal who the subject is. Hence, only kinds of files known
+to be scrubbed are copied:
+
+- JSON, TSV and text files (including bval/bvec): the label is replaced and
+  JSON members naming the patient or staff (like PatientName) are removed
+- NIfTI images (.nii, .nii.gz) without header extensions (which may hold
+  DICOM fields): the file name, comment and time stamp of the gzip header
+  are removed
+
+Afterwards, the label must not be found anywhere (ignoring case) in the new
+path, text or NIfTI header, unless it's a number: numeric labels (like 02)
+can't be told apart from numbers and times (like the acq_time 10:02:15) and
+are only replaced as part of 'sub-<label>'. Otherwise, or if there is a file
+of any other kind, nothing is copied at all. heudiconv's .heudiconv
+directory, which holds DICOM header information, is outside the subject
+directories and never copied.
+"""
+
+import json
+import logging
+import os
+import os.path as op
+import re
+import shutil
+import struct
+import tempfile
+import zlib
+from collections import OrderedDict
+
+lgr = logging.getLogger('datalad.hirni.relabel')
+
+# files whose content may reference the subject label
+text_extensions = ('.json', '.tsv', '.txt', '.bval', '.bvec')
+
+# JSON members (of sidecars) about persons; besides those starting with
+# 'Patient'
+identifying_fields = ('OtherPatientIDs', 'AccessionNumber', 'StudyID',
+                      'ReferringPhysicianName', 'PerformingPhysicianName',
+                      'OperatorsName', 'InstitutionAddress')
+
+# gzip header flags
+_FHCRC = 2
+_FEXTRA = 4
+_FNAME = 8
+_FCOMMENT = 16
+
+_chunksize = 1024 * 1024
+
+
+def get_label_pattern(subject):
+    """Get a regex matching BIDS subject label `subject` as a whole"""
+
+    return re.compile(r'(?<![A-Za-z0-9])sub-{}(?![A-Za-z0-9])'.format(
+        re.escape(subject)))
+
+
+def _get_bare_pattern(subject):
+    # the label on its own anywhere, as text and as bytes; None for numeric
+    # labels (see module docstring)
+    if subject.isdigit():
+        return None, None
+    pattern = r'(?<![A-Za-z0-9]){}(?![A-Za-z0-9])'.format(re.escape(subject))
+    return (re.compile(pattern, re.IGNORECASE),
+            re.compile(pattern.encode('utf-8'), re.IGNORECASE))
+
+
+def _remove_identifying_fields(value):
+    if isinstance(value, dict):
+        return OrderedDict(
+            (k, _remove_identifying_fields(v)) for k, v in value.items()
+            if not k.startswith('Patient') and k not in identifying_fields)
+    if isinstance(value, list):
+        return [_remove_identifying_fields(v) for v in value]
+    return value
+
+
+def _check_nifti_header(head, bare):
+    """Raise ValueError, if the start of a NIfTI file may identify someone"""
+
+    for endian in '<>':
+        size = struct.unpack(endian + 'i', head[:4])[0] \
+            if len(head) >= 4 else None
+        if size in (348, 540):
+            break
+    else:
+        raise ValueError("not a NIfTI-1 or NIfTI-2 image")
+    if len(head) < size:
+        raise ValueError("truncated NIfTI header")
+    if head[size:size + 1] not in (b'', b'\0'):
+        raise ValueError("NIfTI header extensions may hold DICOM fields")
+    if bare and bare.search(head[:size]):
+        raise ValueError("subject label found in a NIfTI header")
+
+
+def _copy_gzip(src, dst):
+    """Copy a gzip file without the header fields naming the original
+
+    Returns
+    -------
+    bytes
+      start of the decompressed content
+    """
+
+    with open(src, 'rb') as f, open(dst, 'wb') as out:
+        header = f.read(10)
+        if len(header) < 10 or header[:3] != b'\x1f\x8b\x08':
+            raise ValueError("not a gzip file")
+        flags = header[3]
+        if flags & _FEXTRA:
+            f.read(struct.unpack('<H', f.read(2))[0])
+        for flag in (_FNAME, _FCOMMENT):
+            if flags & flag:
+                while f.read(1) not in (b'\0', b''):
+                    pass
+        if flags & _FHCRC:
+            f.read(2)
+        # no flags and no time stamp; the compressed data and the trailer
+        # don't depend on the header and are copied as they are
+        out.write(header[:3] + b'\0' * 5 + header[8:])
+        # decompress all of it, since a further gzip member would come with
+        # a header of its own
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        head = b''
+        trailer = b''
+        for chunk in iter(lambda: f.read(_chunksize), b''):
+            out.write(chunk)
+            if decompressor.eof:
+                trailer += chunk
+                continue
+            data = decompressor.decompress(chunk)
+            if len(head) < 1024:
+                head += data[:1024]
+            trailer += decompressor.unused_data
+        if not decompressor.eof or len(trailer) != 8:
+            raise ValueError("not a single gzip member")
+    return head
+
+
+def _scrub_file(src, dst, pattern, replacement, bare):
+    """Copy file `src` to `dst` relabeled and scrubbed (see module docstring)
+
+    Raises
+    ------
+    ValueError
+      if it can't be scrubbed
+    """
+
+    name = op.basename(src)
+    if name.endswith(text_extensions):
+        with open(src, 'rb') as f:
+            content = pattern.sub(replacement, f.read().decode('utf-8'))
+        if name.endswith('.json'):
+            data = json.loads(content, object_pairs_hook=OrderedDict)
+            scrubbed = _remove_identifying_fields(data)
+            if scrubbed != data:
+                content = json.dumps(scrubbed, indent=2, ensure_ascii=False)
+        if bare[0] and bare[0].search(content):
+            raise ValueError("subject label found in a {} file".format(
+                op.splitext(name)[1]))
+        with open(dst, 'wb') as f:
+            f.write(content.encode('utf-8'))
+    elif name.endswith('.nii.gz'):
+        _check_nifti_header(_copy_gzip(src, dst), bare[1])
+    elif name.endswith('.nii'):
+        with open(src, 'rb') as f:
+            _check_nifti_header(f.read(1024), bare[1])
+        shutil.copyfile(src, dst)
+    else:
+        raise ValueError("no way to scrub {} files".format(
+            op.splitext(name)[1] or "extension-less"))
+
+
+def relabel_files(src_ds_path, dst_ds_path, subject, new_subject,
+                  session=None):
+    """Copy the files of a subject (session) relabeled to another dataset
+
+    All files are scrubbed first (see module docstring); unless all of them
+    could be, nothing is copied. Existing files in the destination are
+    replaced. Hidden files and directories are skipped.
+
+    Parameters
+    ----------
+    src_ds_path: str
+      BIDS dataset to copy from; the content of its files needs to be present
+    dst_ds_path: str
+      BIDS dataset to copy to
+    subject: str
+      subject label to copy the files of
+    new_subject: str
+      subject label to replace `subject` with
+    session: str, optional
+      limit to the files of this session
+
+    Returns
+    -------
+    list of str
+      paths of the copied files in `dst_ds_path`
+
+    Raises
+    ------
+    ValueError
+      if a file can't be scrubbed; the message doesn't reveal the label
+    """
+
+    pattern = get_label_pattern(subject)
+    bare = _get_bare_pattern(subject)
+    replacement = 'sub-{}'.format(new_subject)
+    top = op.join(src_ds_path, 'sub-{}'.format(subject))
+    if session:
+        top = op.join(top, 'ses-{}'.format(session))
+
+    staging_dir = op.join(dst_ds_path, '.git', 'datalad')
+    if not op.exists(staging_dir):
+        os.makedirs(staging_dir)
+    staging_dir = tempfile.mkdtemp(prefix='hirni_relabel_', dir=staging_dir)
+    try:
+        staged = []
+        for root, dirs, files in os.walk(top):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for f in files:
+                if f.startswith('.'):
+                    continue
+                src = op.join(root, f)
+                rel_path = pattern.sub(replacement,
+                                       op.relpath(src, src_ds_path))
+                if bare[0] and bare[0].search(rel_path):
+                    raise ValueError("subject label found in a file name")
+                tmp = op.join(staging_dir, str(len(staged)))
+                _scrub_file(src, tmp, pattern, replacement, bare)
+                staged.append((tmp, op.join(dst_ds_path, rel_path)))
+
+        copied = []
+        for tmp, dst in staged:
+            if not op.exists(op.dirname(dst)):
+                os.makedirs(op.dirname(dst))
+            if op.lexists(dst):
+                # never write through a symlink into an annex object
+                os.unlink(dst)
+            os.rename(tmp, dst)
+            copied.append(dst)
+    finally:
+        shutil.rmtree(staging_dir)
+    lgr.debug("Copied %d file(s)", len(copied))
+    return copied
@@ -0,0 +1,75 @@
+"""Run records of commits saving the changes of several procedure runs
+
+With --squash, spec2bids replays the commits procedures made in their
+sandboxes without saving them and saves all changes at once afterwards. That
+commit is a run record of the spec2bids call itself, so that `datalad rerun`
+can re-execute the conversion. The records of the replayed commits are kept
+in it as well, under 'hirni_procedures'.
+"""
+
+import json
+import re
+
+import logging
+lgr = logging.getLogger('datalad.hirni.run_records')
+
+_run_record_regex = re.compile(
+    r'\[DATALAD RUNCMD\] (.*?)\n*=== Do not change lines below ===\n(.*)\n'
+    r'\^\^\^ Do not change lines above \^\^\^',
+    re.DOTALL)
+
+
+def parse_commit_message(message):
+    """Get a record of a commit from its `message`
+
+    Returns
+    -------
+    dict
+      with the commit's 'message' (its subject) and, if it was done by
+      datalad-run, its 'run' record. Records kept in a sidecar file are
+      referenced by their ID only, so they don't end up in a commit message.
+    """
+
+    message = message.strip()
+    record = dict(message=message.splitlines()[0] if message else '')
+    match = _run_record_regex.match(message)
+    if match:
+        record['message'] = match.group(1).strip()
+        try:
+            record['run'] = json.loads(match.group(2))
+        except ValueError:
+            lgr.warning("Invalid run record in commit message: %s", message)
+    return record
+
+
+def format_run_record(ds, cmd, message, exit_code=0, **kwargs):
+    """Get the message of a commit recording that `cmd` was run
+
+    The format is the one of `datalad run`, so that `datalad rerun` can
+    re-execute `cmd` (in the root of `ds`).
+
+    Parameters
+    ----------
+    ds: Dataset
+    cmd: str
+      shell command; braces are taken literally
+    message: str
+    exit_code: int, optional
+    **kwargs
+      further members of the record
+    """
+
+    record = dict(kwargs,
+                  chain=[],
+                  cmd=cmd.replace('{', '{{').replace('}', '}}'),
+                  dsid=ds.id,
+                  exit=exit_code,
+                  extra_inputs=[],
+                  inputs=[],
+                  outputs=[],
+                  pwd='.')
+    return u"[DATALAD RUNCMD] {}\n\n=== Do not change lines below ===\n{}\n" \
+           u"^^^ Do not change lines above ^^^\n".format(
+               message,
+               json.dumps(record, indent=1, sort_keys=True,
+                          ensure_ascii=False))
@@ -0,0 +1,445 @@
+"""Isolated runs of conversion procedures
+
+Procedures running concurrently in the same BIDS dataset race for its git
+index (each datalad-run or containers-run call saves) and for files several
+of them write, like a subject's scans.tsv, participants.tsv or heudiconv's
+.heudiconv directory. Instead, each concurrent run gets a temporary clone of
+the dataset (a sandbox). The installed subdatasets are cloned as well and
+all clones share the annex object store of their original (via a symlink),
+so that neither present content nor content added by a procedure needs to be
+copied. Hence, a procedure run in a sandbox must not drop content.
+
+Once a run finished, the commits it made in its sandbox are replayed in the
+dataset by the calling process only, one after another: the files each
+commit changed are copied over and saved with the commit's message, so that
+the run records are kept. A file that was changed in the dataset meanwhile
+is merged, if it is
+
+- a TSV file: rows are united (those of participants.tsv, *_sessions.tsv and
+  *_scans.tsv by their first column)
+- a JSON file holding an object: members are united
+- a text file holding a Python dict literal (like heudiconv's *.auto.txt):
+  items are united, lists of the same key are joined
+
+Anything else, and rows or members with different values, is reported as a
+conflict, keeping the dataset's version. Changes to subdatasets (commits or
+modifications within them) aren't replayed, but reported as errors.
+
+Commits can also be replayed without saving them, to save the changes of
+several runs at once afterwards. A sandbox then needs to start from the
+changes replayed so far: they are committed in the sandbox right after
+cloning (that commit isn't replayed).
+"""
+
+import ast
+import json
+import logging
+import os
+import os.path as op
+import pprint
+import subprocess
+from collections import OrderedDict
+
+from datalad.interface.results import get_status_dict
+from datalad.utils import rmtree
+
+from datalad_hirni.support.spec_helpers import atomic_write
+
+lgr = logging.getLogger('datalad.hirni.sandbox')
+
+# git's mode of symlinks and of subdatasets (gitlinks)
+_link_mode = '120000'
+_gitlink_mode = '160000'
+
+
+def _git(path, *args):
+    return subprocess.check_output(('git',) + args, cwd=path)
+
+
+def _get_git_dir(path):
+    dot_git = op.join(path, '.git')
+    if op.isfile(dot_git):
+        with open(dot_git) as f:
+            line = f.readline()
+        if line.startswith('gitdir:'):
+            return op.normpath(op.join(path, line[len('gitdir:'):].strip()))
+    return dot_git
+
+
+def _share_annex_objects(origin, clone):
+    """Let the annex of repository `clone` use the object store of `origin`"""
+
+    annex_dir = op.join(_get_git_dir(clone), 'annex')
+    if not op.isdir(annex_dir) or \
+            not op.isdir(op.join(_get_git_dir(origin), 'annex')):
+        # no annex
+        return
+    objects = op.join(_get_git_dir(origin), 'annex', 'objects')
+    if not op.exists(objects):
+        os.makedirs(objects)
+    clone_objects = op.join(annex_dir, 'objects')
+    if op.lexists(clone_objects):
+        # a fresh clone has no content yet
+        rmtree(clone_objects)
+    os.symlink(objects, clone_objects)
+
+
+def create_sandbox(ds_path, path, unsaved=False):
+    """Clone the dataset at `ds_path` along with its installed subdatasets
+
+    Parameters
+    ----------
+    ds_path: str
+    path: str
+      (empty) directory to clone into
+    unsaved: bool, optional
+      whether to commit the changes not saved in the dataset (except those of
+      subdatasets) in the sandbox, so that a procedure starts from them
+
+    Returns
+    -------
+    Dataset
+    """
+
+    from datalad.api import install
+    from datalad.distribution.dataset import Dataset
+
+    ds = Dataset(ds_path)
+    install(path=path, source=ds_path, result_renderer='disabled')
+    _share_annex_objects(ds_path, path)
+    # superdatasets first, so that the mountpoints of nested ones exist
+    for sub in sorted(ds.subdatasets(fulfilled=True, recursive=True,
+                                     result_xfm='paths',
+                                     return_type='list',
+                                     result_renderer='disabled')):
+        sub_path = op.join(path, op.relpath(sub, ds_path))
+        install(path=sub_path, source=sub, result_renderer='disabled')
+        _share_annex_objects(sub, sub_path)
+    if unsaved:
+        for p, _, version in _get_uncommitted_changes(ds_path, []):
+            _write_worktree(op.join(path, p), version)
+        _git(path, 'add', '--all')
+        _git(path, 'commit', '-q', '--allow-empty',
+             '-m', "[HIRNI] Unsaved changes of the dataset")
+    return Dataset(path)
+
+
+def relocate_results(results, sandbox_path, ds_path):
+    """Make the paths in `results` of a sandbox run point into the dataset"""
+
+    for r in results:
+        for k in ('path', 'refds', 'parentds'):
+            p = r.get(k)
+            if isinstance(p, str) and \
+                    (p == sandbox_path or p.startswith(sandbox_path + op.sep)):
+                r[k] = ds_path + p[len(sandbox_path):]
+    return results
+
+
+def _merge_tsv(ours, theirs, keyed):
+    ours = ours.decode('utf-8').splitlines()
+    theirs = theirs.decode('utf-8').splitlines()
+    if not ours or not theirs or ours[0] != theirs[0]:
+        raise ValueError("different columns")
+    rows = OrderedDict()
+    for line in ours[1:] + theirs[1:]:
+        if not line.strip():
+            continue
+        key = line.split('\t', 1)[0] if keyed else line
+        if rows.setdefault(key, line) != line:
+            raise ValueError("different rows for {}".format(key))
+    return ('\n'.join([ours[0]] + list(rows.values())) + '\n').encode('utf-8')
+
+
+def _merge_json(ours, theirs):
+    ours = json.loads(ours.decode('utf-8'), object_pairs_hook=OrderedDict)
+    theirs = json.loads(theirs.decode('utf-8'), object_pairs_hook=OrderedDict)
+    if not isinstance(ours, dict) or not isinstance(theirs, dict):
+        raise ValueError("not a JSON object")
+    for k, v in theirs.items():
+        if ours.setdefault(k, v) != v:
+            raise ValueError("different values for {}".format(k))
+    return json.dumps(ours, indent=2, ensure_ascii=False).encode('utf-8')
+
+
+def _merge_literal(ours, theirs):
+    ours = ast.literal_eval(ours.decode('utf-8'))
+    theirs = ast.literal_eval(theirs.decode('utf-8'))
+    if not isinstance(ours, dict) or not isinstance(theirs, dict):
+        raise ValueError("not a dict")
+    for k, v in theirs.items():
+        if k not in ours:
+            ours[k] = v
+        elif isinstance(ours[k], list) and isinstance(v, list):
+            ours[k] = ours[k] + [i for i in v if i not in ours[k]]
+        elif ours[k] != v:
+            raise ValueError("different values for {}".format(k))
+    return pprint.pformat(ours).encode('utf-8')
+
+
+def merge_files(path, ours, theirs):
+    """Merge two versions of a file (see module docstring)
+
+    Parameters
+    ----------
+    path: str
+      path of the file; its name determines how to merge
+    ours: bytes
+    theirs: bytes
+
+    Returns
+    -------
+    bytes
+
+    Raises
+    ------
+    ValueError
+      if the versions can't be merged
+    """
+
+    name = op.basename(path)
+    try:
+        if name.endswith('.tsv'):
+            return _merge_tsv(
+                ours, theirs,
+                keyed=name == 'participants.tsv' or
+                name.endswith(('_scans.tsv', '_sessions.tsv')))
+        elif name.endswith('.json'):
+            return _merge_json(ours, theirs)
+        elif name.endswith('.txt'):
+            return _merge_literal(ours, theirs)
+    except (SyntaxError, UnicodeDecodeError) as e:
+        raise ValueError(str(e))
+    raise ValueError("no way to merge this kind of file")
+
+
+def _read_worktree(path):
+    """Get (mode, content) of a file in a work tree, or None if it's absent"""
+
+    if op.islink(path):
+        return _link_mode, os.fsencode(os.readlink(path))
+    if not op.isfile(path):
+        return None
+    with open(path, 'rb') as f:
+        content = f.read()
+    return '100755' if os.access(path, os.X_OK) else '100644', content
+
+
+def _read_blob(repo_path, mode, sha):
+    if set(mode) == {'0'}:
+        return None
+    return mode, _git(repo_path, 'cat-file', 'blob', sha)
+
+
+def _get_content(path, version):
+    """Get the content of a version of the file at `path` in the dataset"""
+
+    mode, content = version
+    if mode != _link_mode:
+        return content
+    # an annexed file; its object is in the store shared with the sandbox
+    with open(op.join(op.dirname(path), os.fsdecode(content)), 'rb') as f:
+        return f.read()
+
+
+def _write_worktree(path, version):
+    if op.lexists(path):
+        os.unlink(path)
+    if version is None:
+        return
+    mode, content = version
+    if mode == _link_mode:
+        if not op.exists(op.dirname(path)):
+            os.makedirs(op.dirname(path))
+        os.symlink(os.fsdecode(content), path)
+        return
+    atomic_write(path, content)
+    if mode == '100755':
+        os.chmod(path, os.stat(path).st_mode | 0o111)
+
+
+def _get_commit_changes(sandbox_path, commit, subdatasets):
+    """Get (path, previous version, new version) per file `commit` changed
+
+    Paths of changed subdatasets are appended to `subdatasets` instead.
+    """
+
+    out = _git(sandbox_path, 'diff-tree', '-r', '-z', '--no-renames',
+               commit + '^', commit).decode('utf-8')
+    items = out.split('\0')
+    changes = []
+    for meta, path in zip(items[0::2], items[1::2]):
+        old_mode, new_mode, old_sha, new_sha, _ = meta.lstrip(':').split()
+        if _gitlink_mode in (old_mode, new_mode):
+            subdatasets.append(path)
+            continue
+        changes.append((path,
+                        _read_blob(sandbox_path, old_mode, old_sha),
+                        _read_blob(sandbox_path, new_mode, new_sha)))
+    return changes
+
+
+def _get_uncommitted_changes(sandbox_path, subdatasets):
+    """Get (path, committed version, version in work tree) per changed file
+
+    Paths of modified or new subdatasets are appended to `subdatasets`
+    instead.
+    """
+
+    out = _git(sandbox_path, 'status', '--porcelain', '-z',
+               '--untracked-files=all', '--ignore-submodules=none'
+               ).decode('utf-8')
+    changes = []
+    for entry in out.split('\0'):
+        if len(entry) < 4 or entry[2] != ' ':
+            # empty or the source of a rename
+            continue
+        path = entry[3:].rstrip('/')
+        if op.lexists(op.join(sandbox_path, path, '.git')):
+            subdatasets.append(path)
+            continue
+        tree = _git(sandbox_path, 'ls-tree', '-z', 'HEAD', '--', path
+                    ).decode('utf-8').rstrip('\0')
+        committed = None
+        if tree:
+            mode, _, sha = tree.split('\t', 1)[0].split()
+            committed = _read_blob(sandbox_path, mode, sha)
+        changes.append((path, committed,
+                        _read_worktree(op.join(sandbox_path, path))))
+    return changes
+
+
+def _apply_changes(ds, changes, applied):
+    """Apply changes made in a sandbox to the work tree of `ds`
+
+    Yields conflict results; the paths of applied changes are appended to
+    `applied`.
+    """
+
+    for path, previous, new in changes:
+        target = op.join(ds.path, path)
+        current = _read_worktree(target)
+        if current == new:
+            continue
+        if current != previous:
+            # changed in the dataset, too
+            merged = None
+            if current is not None and new is not None:
+                try:
+                    merged = (
+                        '100644' if current[0] == _link_mode else current[0],
+                        merge_files(path, _get_content(target, current),
+                                    _get_content(target, new)))
+                except (IOError, OSError, ValueError) as e:
+                    lgr.debug("Can't merge %s: %s", path, e)
+            if merged is None:
+                yield get_status_dict(
+                    path=target,
+                    type='file',
+                    status='error',
+                    message="changed by a concurrent procedure, too; kept "
+                            "the dataset's version",
+                    action='hirni merge',
+                    logger=lgr)
+                continue
+            new = merged
+        _write_worktree(target, new)
+        applied.append(target)
+
+
+def _report_subdatasets(ds, subdatasets):
+    for path in subdatasets:
+        yield get_status_dict(
+            path=op.join(ds.path, path),
+            type='dataset',
+            status='error',
+            message="changed by the procedure in its sandbox; changes of "
+                    "subdatasets aren't replayed",
+            action='hirni merge',
+            logger=lgr)
+
+
+def record_annexed_content(ds, paths):
+    """Record that `ds` has the content of files replayed from a sandbox
+
+    Annexed files are replayed as symlinks into the shared object store, so
+    git-annex doesn't know about their content yet. The files need to be
+    saved already.
+    """
+
+    links = [p for p in paths
+             if op.islink(p) and op.exists(p) and
+             '/annex/objects/' in os.readlink(p)]
+    if links and hasattr(ds.repo, 'fsck'):
+        ds.repo.fsck(paths=links, fast=True)
+
+
+def merge_sandbox(ds, sandbox_path, base, save=True):
+    """Replay what a procedure did in a sandbox in dataset `ds`
+
+    Each commit made in the sandbox since `base` is replayed by a save with
+    the same message. Changes the procedure didn't commit are copied, but
+    not saved, just like they would have been left in the dataset. Changes
+    of subdatasets are reported as errors. The sandbox is removed
+    afterwards.
+
+    Parameters
+    ----------
+    ds: Dataset
+    sandbox_path: str
+      sandbox of `ds` (see `create_sandbox`)
+    base: str
+      commit the procedure started from
+    save: bool, optional
+      if False, the changes of the commits are copied, but not saved. The
+      caller is to save them (and call `record_annexed_content`).
+
+    Yields
+    ------
+    dict
+      results of the saves and of conflicts. A 'hirni merge' result per
+      replayed commit lists the files it changed in the dataset (relative
+      to it) under 'files' and the commit's message under
+      'commit_message'.
+    """
+
+    try:
+        commits = _git(sandbox_path, 'rev-list', '--reverse',
+                       '--first-parent', '{}..HEAD'.format(base)
+                       ).decode('utf-8').split()
+        for commit in commits:
+            message = _git(sandbox_path, 'log', '-1', '--format=%B', commit
+                           ).decode('utf-8').strip()
+            applied = []
+            subdatasets = []
+            for r in _apply_changes(
+                    ds, _get_commit_changes(sandbox_path, commit, subdatasets),
+                    applied):
+                yield r
+            for r in _report_subdatasets(ds, subdatasets):
+                yield r
+            if not applied:
+                continue
+            if save:
+                for r in ds.save(applied, message=message,
+                                 return_type='generator',
+                                 result_renderer='disabled'):
+                    yield r
+                record_annexed_content(ds, applied)
+            yield get_status_dict(
+                path=ds.path,
+                type='dataset',
+                status='ok',
+                message=("replayed commit %s", commit),
+                action='hirni merge',
+                files=sorted(op.relpath(p, ds.path) for p in applied),
+                commit_message=message,
+                logger=lgr)
+        subdatasets = []
+        for r in _apply_changes(
+                ds, _get_uncommitted_changes(sandbox_path, subdatasets), []):
+            yield r
+        for r in _report_subdatasets(ds, subdatasets):
+            yield r
+    finally:
+        rmtree(sandbox_path)
@@ -0,0 +1,248 @@
+"""Concurrent execution of conversion procedures in dependency order
+
+Without anything else to go by, the procedures of a specification are run in
+the order of its snippets. The scheduler instead derives which procedure
+depends on which from
+
+- the paths procedures declare as their 'inputs' and 'outputs' in the
+  specification: a procedure depends on an earlier one, if it reads or writes
+  what the earlier one writes, or writes what the earlier one reads.
+- the order of snippet types (`datalad.hirni.spec2bids.type-order`), for
+  procedures that don't declare their paths: within an acquisition, they
+  depend on the procedures of snippets of an earlier type.
+- the subject directory (sub-<label>) procedures write into: those that
+  don't declare their paths are assumed to write anything within the one of
+  their snippet's subject, so they run one after another with any other
+  procedure writing into that subject directory, even for different
+  acquisitions. Procedures that both declare their paths depend on those
+  only; files they share, like the subject's scans.tsv, are merged (see
+  `datalad_hirni.support.sandbox`).
+
+Procedures of the same snippet always run in the given order. Independent
+procedures are run concurrently.
+"""
+
+import fnmatch
+import logging
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+
+from datalad_hirni.support.spec_helpers import (
+    get_specval,
+    has_specval,
+)
+
+lgr = logging.getLogger('datalad.hirni.scheduler')
+
+# snippet types whose procedures run first (in that order), if not configured
+default_type_order = ['dicomseries:all', 'dicomseries']
+
+
+def get_type_rank(type_, order):
+    """Get the rank of snippet type `type_` within `order`
+
+    Parameters
+    ----------
+    type_: str
+    order: list of str
+      type patterns (as understood by fnmatch)
+
+    Returns
+    -------
+    int
+      index of the first matching pattern; types not matching any come last
+    """
+
+    for i, pattern in enumerate(order):
+        if fnmatch.fnmatchcase(type_, pattern):
+            return i
+    return len(order)
+
+
+def _get_paths(proc, key, replacements):
+    if not has_specval(proc, key):
+        return []
+    paths = get_specval(proc, key)
+    if not isinstance(paths, list):
+        paths = [paths]
+    formatted = []
+    for p in paths:
+        try:
+            p = p.format(**replacements)
+        except (KeyError, IndexError, ValueError):
+            # not a valid format string for the snippet; take it literally
+            pass
+        formatted.append(p.rstrip('/'))
+    return formatted
+
+
+def _overlap(paths, other_paths):
+    """Whether any (glob of a) path is, contains or is contained in another"""
+
+    for a in paths:
+        for b in other_paths:
+            if a == b or \
+                    fnmatch.fnmatchcase(a, b) or fnmatch.fnmatchcase(b, a) or \
+                    a.startswith(b + '/') or b.startswith(a + '/'):
+                return True
+    return False
+
+
+class ProcedureTask(object):
+    """A single procedure call of a specification snippet
+
+    Parameters
+    ----------
+    spec_path: str
+      specification file the snippet is in
+    snippet: dict
+    proc: dict
+      the procedure's specification
+    proc_name: str
+    env: dict
+      environment to run the procedure with
+    replacements: dict
+      substitutions for the declared paths
+    rank: int
+      rank of the snippet's type (see `get_type_rank`)
+    groups: list of list, optional
+      series UIDs to run the procedure for in parallel
+      (see `hirni_heuristic.get_series_groups`)
+    """
+
+    def __init__(self, spec_path, snippet, proc, proc_name, env,
+                 replacements, rank, groups=None):
+        self.spec_path = spec_path
+        self.snippet = snippet
+        self.proc_name = proc_name
+        self.env = env
+        self.rank = rank
+        self.groups = groups
+        self.declared = 'inputs' in proc or 'outputs' in proc
+        self.inputs = _get_paths(proc, 'inputs', replacements)
+        self.outputs = _get_paths(proc, 'outputs', replacements)
+        # subject directories written into
+        subject = replacements.get('bids-subject')
+        if self.declared:
+            self.trees = {p.split('/', 1)[0] for p in self.outputs
+                          if p.startswith('sub-')}
+        else:
+            self.trees = {'sub-{}'.format(subject)} if subject else set()
+        # indices of the tasks to run before
+        self.deps = set()
+
+    def depends_on(self, other):
+        """Whether this task needs to run after `other`, an earlier one"""
+
+        if self.snippet is other.snippet:
+            return True
+        if self.declared and other.declared:
+            return _overlap(other.outputs, self.inputs + self.outputs) or \
+                _overlap(other.inputs, self.outputs)
+        # the undeclared one may write anything within its subject directory
+        if _overlap(self.trees, other.trees):
+            return True
+        return self.spec_path == other.spec_path and other.rank < self.rank
+
+
+def add_dependencies(tasks):
+    """Set the `deps` of each task in the list `tasks`
+
+    Dependencies point backwards only, so that running the tasks in list order
+    always satisfies them.
+    """
+
+    for i, task in enumerate(tasks):
+        task.deps = {j for j in range(i) if task.depends_on(tasks[j])}
+
+
+def run_tasks(tasks, jobs, worker, ds_path, merge=None):
+    """Run `tasks` concurrently in dependency order
+
+    A task whose dependency failed is skipped. Tasks depending on a task are
+    started only after `merge` was called for all of its runs.
+
+    Parameters
+    ----------
+    tasks: list of ProcedureTask
+      with dependencies set (see `add_dependencies`)
+    jobs: int
+      number of procedures to run in parallel
+    worker: callable
+      module-level function to be called in a worker process with `ds_path`,
+      a procedure name and an environment, returning the results of the
+      procedure run
+    ds_path: str
+      dataset to run procedures in
+    merge: callable, optional
+      called in this process with what `worker` returned for a run, returning
+      the results of that run instead. Used to bring the outcome of a run in
+      a sandbox into the dataset (see `datalad_hirni.support.sandbox`).
+
+    Yields
+    ------
+    tuple
+      (task, results) in order of completion; results is None for a skipped
+      task
+    """
+
+    pending = list(range(len(tasks)))
+    done = set()
+    failed = set()
+    # future -> index of task
+    running = dict()
+    # index of task -> results of its finished units (groups) and the number
+    # of units still running
+    results = dict()
+    remaining = dict()
+
+    with ProcessPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        while pending or running:
+            for i in list(pending):
+                task = tasks[i]
+                if not task.deps <= done | failed:
+                    continue
+                pending.remove(i)
+                if task.deps & failed:
+                    failed.add(i)
+                    yield task, None
+                    continue
+                envs = [dict(task.env, HIRNI_SERIES_UIDS=' '.join(uids))
+                        for uids in task.groups] \
+                    if task.groups and len(task.groups) > 1 else [task.env]
+                lgr.debug("Starting procedure %s of %s",
+                          task.proc_name, task.spec_path)
+                results[i] = []
+                remaining[i] = len(envs)
+                for env in envs:
+                    running[pool.submit(worker, ds_path, task.proc_name,
+                                        env)] = i
+            if not running:
+                # only skipped tasks were ready; look again
+                continue
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                i = running.pop(future)
+                try:
+                    run_results = future.result()
+                    if merge is not None:
+                        run_results = merge(run_results)
+                    results[i].extend(run_results)
+                except Exception as e:
+                    results[i].append(dict(
+                        action=tasks[i].proc_name,
+                        path=ds_path,
+                        type='dataset',
+                        status='error',
+                        message=str(e)))
+                remaining[i] -= 1
+                if remaining[i]:
+                    continue
+                task_results = results.pop(i)
+                if all(r.get('status') in ('ok', 'notneeded')
+                       for r in task_results):
+                    done.add(i)
+                else:
+                    failed.add(i)
+                yield tasks[i], task_results
@@ -0,0 +1,280 @@
+"""Study-wide catalog of specification snippets in SQLite
+
+All specification files of a study dataset are mirrored into a local SQLite
+database in the dataset's .git directory. A file is only re-ingested, if its
+content hash changed. Editable fields (dicts with a 'value' and an 'approved'
+key) and tags are indexed, so that queries across the entire study don't need
+to parse any specification file.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import os.path as op
+import posixpath
+import sqlite3
+from glob import glob
+from os import makedirs
+
+from datalad.support.json_py import loads
+
+lgr = logging.getLogger('datalad.hirni.spec_catalog')
+
+# version of the database schema; catalogs of another version are recreated
+_SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE files (
+    path TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE snippets (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    type TEXT,
+    uid TEXT,
+    location TEXT,
+    snippet TEXT NOT NULL
+);
+CREATE TABLE fields (
+    snippet INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    approved INTEGER NOT NULL
+);
+CREATE TABLE tags (
+    snippet INTEGER NOT NULL,
+    tag TEXT NOT NULL
+);
+CREATE INDEX snippets_path ON snippets (path);
+CREATE INDEX snippets_type ON snippets (type);
+CREATE INDEX snippets_uid ON snippets (uid);
+CREATE INDEX fields_snippet ON fields (snippet);
+CREATE INDEX fields_value ON fields (key, value);
+CREATE INDEX fields_approved ON fields (key, approved);
+CREATE INDEX tags_snippet ON tags (snippet);
+CREATE INDEX tags_tag ON tags (tag);
+"""
+
+
+def encode_value(value):
+    """Turn a field's value into what is stored (and compared) in the catalog
+
+    Strings are stored as is, None as NULL and anything else as JSON. Hence,
+    a query for '401' matches a value of 401.
+    """
+
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, sort_keys=True)
+
+
+def _hash_file(path, chunksize=1024 * 1024):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunksize), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def find_spec_files(ds):
+    """Find all specification files of a study dataset
+
+    These are the ones at the root of the dataset and at the root of each
+    acquisition, named according to `datalad.hirni.studyspec.filename`.
+
+    Returns
+    -------
+    list of str
+      absolute paths
+    """
+
+    filename = ds.config.get("datalad.hirni.studyspec.filename",
+                             "studyspec.json")
+    return sorted(p for p in [op.join(ds.path, filename)] +
+                  glob(op.join(ds.path, '*', filename))
+                  if op.isfile(p))
+
+
+class SpecCatalog(object):
+    """SQLite mirror of all specification files of a study dataset
+
+    Parameters
+    ----------
+    ds: Dataset
+      study dataset
+    """
+
+    def __init__(self, ds):
+        self.ds = ds
+        self.db_path = op.join(ds.path, '.git', 'datalad', 'hirni',
+                               'speccatalog.sqlite')
+        self._db = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            if not op.exists(op.dirname(self.db_path)):
+                makedirs(op.dirname(self.db_path))
+            self._db = sqlite3.connect(self.db_path)
+            version = self._db.execute("PRAGMA user_version").fetchone()[0]
+            if version != _SCHEMA_VERSION:
+                lgr.debug("(Re-)creating spec catalog at %s", self.db_path)
+                self._db.close()
+                os.remove(self.db_path)
+                self._db = sqlite3.connect(self.db_path)
+                with self._db:
+                    self._db.executescript(_SCHEMA)
+                    self._db.execute(
+                        "PRAGMA user_version = {}".format(_SCHEMA_VERSION))
+        return self._db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _relpath(self, path):
+        return posixpath.join(*op.relpath(path, self.ds.path).split(op.sep))
+
+    def _ingest(self, rel_path, path, hash_, mtime, size):
+        db = self.db
+        self._remove(rel_path)
+        with open(path) as f:
+            for line_no, line in enumerate(f):
+                if not line.strip():
+                    continue
+                snippet = loads(line)
+                cursor = db.execute(
+                    "INSERT INTO snippets (path, line, type, uid, location, "
+                    "snippet) VALUES (?, ?, ?, ?, ?, ?)",
+                    (rel_path, line_no, snippet.get('type'),
+                     snippet.get('uid'), snippet.get('location'),
+                     line.strip()))
+                snippet_id = cursor.lastrowid
+                db.executemany(
+                    "INSERT INTO fields (snippet, key, value, approved) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(snippet_id, k, encode_value(v['value']),
+                      bool(v.get('approved', False)))
+                     for k, v in snippet.items()
+                     if isinstance(v, dict) and 'value' in v])
+                db.executemany(
+                    "INSERT INTO tags (snippet, tag) VALUES (?, ?)",
+                    [(snippet_id, encode_value(t))
+                     for t in snippet.get('tags') or []])
+        db.execute(
+            "INSERT INTO files (path, hash, mtime, size) VALUES (?, ?, ?, ?)",
+            (rel_path, hash_, mtime, size))
+
+    def _remove(self, rel_path):
+        db = self.db
+        for table in ('fields', 'tags'):
+            db.execute(
+                "DELETE FROM {} WHERE snippet IN "
+                "(SELECT id FROM snippets WHERE path = ?)".format(table),
+                (rel_path,))
+        db.execute("DELETE FROM snippets WHERE path = ?", (rel_path,))
+        db.execute("DELETE FROM files WHERE path = ?", (rel_path,))
+
+    def update(self, paths=None):
+        """Bring the catalog up-to-date with the specification files
+
+        Parameters
+        ----------
+        paths: list of str, optional
+          specification files to update. By default all of them, in which
+          case files that vanished are removed from the catalog as well.
+
+        Yields
+        ------
+        tuple
+          (path, status) for each file, where status is one of 'added',
+          'updated', 'unchanged' or 'removed'
+        """
+
+        db = self.db
+        known = {p: (h, m, s) for p, h, m, s in
+                 db.execute("SELECT path, hash, mtime, size FROM files")}
+        full = paths is None
+        if full:
+            paths = find_spec_files(self.ds)
+        seen = set()
+        for path in paths:
+            rel_path = self._relpath(path)
+            seen.add(rel_path)
+            st = os.stat(path)
+            mtime, size = st.st_mtime_ns, st.st_size
+            record = known.get(rel_path)
+            if record and record[1:] == (mtime, size):
+                yield path, 'unchanged'
+                continue
+            hash_ = _hash_file(path)
+            with db:
+                if record and record[0] == hash_:
+                    # touched, but not changed
+                    db.execute("UPDATE files SET mtime = ?, size = ? "
+                               "WHERE path = ?", (mtime, size, rel_path))
+                    status = 'unchanged'
+                else:
+                    lgr.debug("Ingesting %s into spec catalog", path)
+                    self._ingest(rel_path, path, hash_, mtime, size)
+                    status = 'updated' if record else 'added'
+            yield path, status
+        if full:
+            with db:
+                for rel_path in set(known).difference(seen):
+                    self._remove(rel_path)
+                    yield op.join(self.ds.path, rel_path), 'removed'
+
+    def query(self, type=None, match=None, unapproved=None, tags=None):
+        """Query snippets across all cataloged specification files
+
+        Parameters
+        ----------
+        type: str, optional
+          snippet type, e.g. 'dicomseries'
+        match: dict, optional
+          field name to value mapping, e.g. {'bids-modality': 'bold'}. Values
+          are compared as encoded by `encode_value`.
+        unapproved: list of str, optional
+          names of fields that need to be present, but not approved
+        tags: list of str, optional
+          tags a snippet needs to have (all of them)
+
+        Yields
+        ------
+        tuple
+          (path of the specification file relative to the dataset, snippet)
+        """
+
+        conditions = []
+        args = []
+        if type is not None:
+            conditions.append("s.type = ?")
+            args.append(type)
+        for k, v in (match or {}).items():
+            conditions.append(
+                "EXISTS (SELECT 1 FROM fields f WHERE f.snippet = s.id "
+                "AND f.key = ? AND f.value = ?)")
+            args.extend([k, encode_value(v)])
+        for k in unapproved or []:
+            conditions.append(
+                "EXISTS (SELECT 1 FROM fields f WHERE f.snippet = s.id "
+                "AND f.key = ? AND f.approved = 0)")
+            args.append(k)
+        for t in tags or []:
+            conditions.append(
+                "EXISTS (SELECT 1 FROM tags t WHERE t.snippet = s.id "
+                "AND t.tag = ?)")
+            args.append(t)
+        sql = "SELECT s.path, s.snippet FROM snippets s"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY s.path, s.line"
+        for path, snippet in self.db.execute(sql, args):
+            yield path, loads(snippet)
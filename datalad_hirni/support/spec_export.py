@@ -0,0 +1,218 @@
+"""Export of specification snippets into Parquet files
+
+Every specification file is exported into a Parquet file of its own, at the
+same relative path below the target directory (with the extension replaced
+by '.parquet'). All files share the same schema, so that they can be read as
+a single table, like::
+
+  pandas.read_parquet(target)
+  SELECT * FROM read_parquet('target/**/*.parquet')
+
+A snippet becomes a row. Automatically managed fields (like 'type' or 'uid')
+become a column each. All other fields, which differ from acquisition to
+acquisition, are in the column 'fields', mapping a field's name to its
+'value' and whether it's 'approved' (null for fields that aren't editable).
+Values are stored as encoded by `spec_catalog.encode_value`, so all values
+are strings.
+
+Files are exported in batches of rows, so that memory use doesn't depend on
+the size of a specification file. The size and modification time of each
+exported specification file are recorded in the target directory (in
+'_state.json', which is ignored by Parquet readers), so that refreshing an
+export only rewrites the Parquet files of changed specification files.
+"""
+
+import json
+import logging
+import os
+import os.path as op
+
+from datalad_hirni.support.spec_catalog import encode_value
+from datalad_hirni.support.spec_helpers import atomic_write
+
+lgr = logging.getLogger('datalad.hirni.spec_export')
+
+# number of snippets converted into Arrow at a time
+batch_size = 10000
+
+_state_file = '_state.json'
+
+# version of the layout of exported files; exports of another version are
+# redone
+_version = 2
+
+# columns of every exported file, in order, besides 'fields'
+_fixed_columns = ['path', 'line', 'type', 'location', 'uid', 'dataset-id',
+                  'dataset-refcommit', 'tags', 'procedures']
+
+
+def _is_editable(value):
+    return isinstance(value, dict) and 'value' in value
+
+
+def _iter_snippets(path):
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f):
+            if line.strip():
+                yield line_no, json.loads(line)
+
+
+def get_schema():
+    """Get the Arrow schema of every exported file"""
+
+    import pyarrow as pa
+
+    fields = [pa.field('path', pa.string()),
+              pa.field('line', pa.int64())]
+    fields.extend(pa.field(k, pa.list_(pa.string())) if k == 'tags'
+                  else pa.field(k, pa.string())
+                  for k in _fixed_columns[2:])
+    fields.append(pa.field('fields', pa.map_(
+        pa.string(),
+        pa.struct([pa.field('value', pa.string()),
+                   pa.field('approved', pa.bool_())]))))
+    return pa.schema(fields)
+
+
+def _to_columns(rel_path, snippets, schema):
+    columns = {name: [] for name in schema.names}
+    for line_no, snippet in snippets:
+        row = dict(path=rel_path, line=line_no, fields=[])
+        for k, v in snippet.items():
+            if k == 'tags':
+                row[k] = [encode_value(t) for t in v or []]
+            elif k in _fixed_columns:
+                row[k] = encode_value(v)
+            elif _is_editable(v):
+                row['fields'].append((k, dict(
+                    value=encode_value(v['value']),
+                    approved=bool(v.get('approved', False)))))
+            else:
+                row['fields'].append((k, dict(value=encode_value(v),
+                                              approved=None)))
+        for name, values in columns.items():
+            values.append(row.get(name))
+    return columns
+
+
+def export_file(path, rel_path, target):
+    """Export the snippets of a specification file into a Parquet file
+
+    Parameters
+    ----------
+    path: str
+      specification file
+    rel_path: str
+      path of the specification file to record in the 'path' column
+    target: str
+      Parquet file to (over)write
+
+    Returns
+    -------
+    int
+      number of exported snippets
+    """
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = get_schema()
+    if not op.exists(op.dirname(target)):
+        os.makedirs(op.dirname(target))
+    tmp_target = op.join(op.dirname(target),
+                         '.' + op.basename(target) + '.tmp')
+    n = 0
+    try:
+        writer = pq.ParquetWriter(tmp_target, schema)
+        try:
+            batch = []
+            for snippet in _iter_snippets(path):
+                batch.append(snippet)
+                if len(batch) >= batch_size:
+                    writer.write_table(pa.Table.from_pydict(
+                        _to_columns(rel_path, batch, schema), schema=schema))
+                    n += len(batch)
+                    batch = []
+            if batch or not n:
+                writer.write_table(pa.Table.from_pydict(
+                    _to_columns(rel_path, batch, schema), schema=schema))
+                n += len(batch)
+        finally:
+            writer.close()
+        os.replace(tmp_target, target)
+    except Exception:
+        if op.lexists(tmp_target):
+            os.remove(tmp_target)
+        raise
+    return n
+
+
+def get_target(target_dir, rel_path):
+    """Get the Parquet file to export a specification file into"""
+
+    return op.join(target_dir, op.splitext(rel_path)[0] + '.parquet')
+
+
+def export_specs(ds_path, spec_paths, target_dir, full=True):
+    """Bring an export up-to-date with the specification files
+
+    Parameters
+    ----------
+    ds_path: str
+      study dataset
+    spec_paths: list of str
+      specification files to export
+    target_dir: str
+      directory to export into
+    full: bool
+      whether `spec_paths` are all specification files of the dataset, in
+      which case the exports of vanished files are removed
+
+    Yields
+    ------
+    tuple
+      (path, status, number of snippets) for each specification file, where
+      status is one of 'added', 'updated', 'unchanged' or 'removed' and the
+      number is None, unless the file was (re-)exported
+    """
+
+    state_path = op.join(target_dir, _state_file)
+    state = dict()
+    if op.exists(state_path):
+        with open(state_path) as f:
+            recorded = json.load(f)
+        if recorded.get('version') == _version:
+            state = recorded['files']
+        else:
+            # exported in another layout; redo all of them
+            state = {rel_path: None for rel_path in
+                     recorded.get('files', recorded)}
+
+    seen = set()
+    try:
+        for path in spec_paths:
+            rel_path = op.relpath(path, ds_path)
+            seen.add(rel_path)
+            st = os.stat(path)
+            record = [st.st_mtime_ns, st.st_size]
+            target = get_target(target_dir, rel_path)
+            if state.get(rel_path) == record and op.exists(target):
+                yield path, 'unchanged', None
+                continue
+            lgr.debug("Exporting %s to %s", path, target)
+            n = export_file(path, rel_path, target)
+            status = 'updated' if rel_path in state else 'added'
+            state[rel_path] = record
+            yield path, status, n
+        if full:
+            for rel_path in sorted(set(state).difference(seen)):
+                target = get_target(target_dir, rel_path)
+                if op.exists(target):
+                    os.remove(target)
+                del state[rel_path]
+                yield op.join(ds_path, rel_path), 'removed', None
+    finally:
+        # record what was exported so far, even if interrupted
+        atomic_write(state_path, json.dumps(
+            dict(version=_version, files=state),
+            indent=1, sort_keys=True).encode('utf-8'))
@@ -1,3 +1,10 @@
+import json
+import os
+import os.path as op
+import re
+import stat
+import tempfile
+
 # move spec functions here (from heuristic for ex)
 
 # TODO: Probably we need some proper SpecHandler class or sth, where this needs
@@ -35,3 +42,173 @@ def get_specval(spec, key):
 
 def has_specval(spec, key):
     return key in spec and 'value' in spec[key] and spec[key]['value']
+
+
+# types to come first in a spec file (in that order)
+_type_order = {'dicomseries:all': 0, 'dicomseries': 1}
+
+
+def canonical_sort_key(spec):
+    """Helper to provide the canonical order of snippets in a spec file
+
+    Snippets are ordered by type, then by their 'id' value (numerically, if
+    it's a number) and finally by what identifies a snippet of that type.
+    A 'dicomseries:all' snippet comes first and 'dicomseries' snippets next,
+    since the order determines the order of execution of procedures. All
+    commands writing spec files use this order, so that they don't reorder
+    each other's files.
+
+    Parameters
+    ----------
+    spec: dict
+      study specification dictionary
+
+    Returns
+    -------
+    tuple
+    """
+
+    id_ = spec.get('id', {})
+    id_ = id_.get('value') if isinstance(id_, dict) else id_
+    if id_ is None:
+        id_key = (2, 0, '')
+    elif isinstance(id_, (int, float)) and not isinstance(id_, bool):
+        id_key = (0, id_, '')
+    else:
+        id_key = (1, 0, str(id_))
+    locator = spec.get('uid') if spec['type'] == 'dicomseries' \
+        else spec.get('location')
+    type_key = _type_order.get(spec['type'], len(_type_order))
+    return type_key, spec['type'], id_key, locator or ''
+
+
+def dump_snippet(snippet):
+    """Serialize a snippet into a line of a specification file
+
+    Matches datalad.support.json_py.dump2stream.
+    """
+
+    return json.dumps(snippet, sort_keys=True, separators=(',', ':'),
+                      ensure_ascii=False).encode('utf-8') + b'\n'
+
+
+def atomic_write(path, content):
+    """Replace the content of `path` without ever leaving a partial file
+
+    `content` is written to a temporary file next to `path`, which is then
+    renamed into place. The permissions of an existing file are kept.
+    """
+
+    dirname = op.dirname(path)
+    if dirname and not op.exists(dirname):
+        os.makedirs(dirname)
+    if op.exists(path):
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    else:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + op.basename(path) + '.',
+                                    dir=dirname or None)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except Exception:
+        if op.lexists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_spec(spec, path):
+    """Write a specification to a file with minimal changes
+
+    Snippets are written in canonical order (see `canonical_sort_key`). Lines
+    of snippets that didn't change are kept byte for byte, even if they were
+    serialized differently, so that a diff shows the changed snippets only.
+    The file is replaced atomically and not touched at all, if nothing
+    changed.
+
+    Parameters
+    ----------
+    spec: list of dict
+      the entire specification
+    path: str
+      path to the specification file
+
+    Returns
+    -------
+    bool
+      whether the file was (re-)written
+    """
+
+    old_content = b''
+    old_lines = dict()
+    if op.exists(path):
+        with open(path, 'rb') as f:
+            old_content = f.read()
+        for line in old_content.splitlines(True):
+            if line.strip():
+                normalized = dump_snippet(json.loads(line.decode('utf-8')))
+                old_lines.setdefault(normalized, line if line.endswith(b'\n')
+                                     else line + b'\n')
+
+    lines = []
+    for snippet in sorted(spec, key=canonical_sort_key):
+        line = dump_snippet(snippet)
+        lines.append(old_lines.get(line, line))
+    content = b''.join(lines)
+    if content == old_content:
+        return False
+    atomic_write(path, content)
+    return True
+
+
+# matches any "type" key with a string value within a serialized snippet
+_type_pattern = re.compile(r'"type"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def _matches_type(type_, value, prefix):
+    return value.startswith(type_) if prefix else value == type_
+
+
+def load_stream_of_type(fname, type_, prefix=False):
+    """Load snippets of a given type from a specification file
+
+    Lines are pre-filtered by scanning them for a matching "type" key, before
+    they are decoded. Only lines passing this scan are fully parsed and then
+    checked again. Hence, the bulk of snippets of other types is never
+    decoded at all.
+
+    Parameters
+    ----------
+    fname: str
+      path to the specification file
+    type_: str
+      type of snippets to load
+    prefix: bool
+      if True, load all snippets whose type starts with `type_` (so that
+      'dicomseries' matches 'dicomseries:all' as well)
+
+    Yields
+    ------
+    dict
+    """
+
+    with open(fname, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            found = _type_pattern.findall(line)
+            # Note: A nested "type" key could match, too. Therefore only skip
+            # if no occurrence matches and verify after parsing.
+            if found and not any(
+                    _matches_type(type_, json.loads('"' + v + '"'), prefix)
+                    for v in found):
+                continue
+            snippet = json.loads(line)
+            if _matches_type(type_, snippet['type'], prefix):
+                yield snippet
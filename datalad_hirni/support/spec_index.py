@@ -0,0 +1,259 @@
+"""Byte-offset index for specification files
+
+A specification file is a JSON stream with one snippet per line. In order to
+read or replace a single snippet, the entire file would need to be parsed.
+This sidecar index maps a snippet's key to the byte offset and length of its
+line, its position within the specification and a hash of that line. It
+lives in the dataset's .git directory and is rebuilt automatically, whenever
+the specification file changed in a way the index doesn't know about.
+
+spec4anything uses it to look up and replace snippets (--replace), dicom2spec
+to look up the existing snippets of DICOM series by their UID.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import os.path as op
+from os import makedirs
+
+from datalad.support.json_py import loads
+from datalad.utils import get_dataset_root
+
+from datalad_hirni.support.spec_helpers import (
+    atomic_write,
+    dump_snippet,
+)
+
+lgr = logging.getLogger('datalad.hirni.spec_index')
+
+# version of the index format; indices of another version are rebuilt
+_INDEX_VERSION = 2
+
+
+def get_snippet_key(snippet):
+    """Get the key identifying a snippet within a specification
+
+    This is (type, uid, id) for DICOM series and (type, location, id) for
+    anything else, where id is the snippet's 'id' value (if any).
+
+    Returns
+    -------
+    str
+      JSON representation of the key (usable as a dict key)
+    """
+
+    locator = snippet.get('uid') if snippet['type'] == 'dicomseries' \
+        else snippet.get('location')
+    id_ = snippet.get('id')
+    if isinstance(id_, dict):
+        id_ = id_.get('value')
+    return json.dumps([snippet['type'], locator, id_])
+
+
+def _hash(content):
+    return hashlib.sha1(content).hexdigest()
+
+
+class SpecIndex(object):
+    """Sidecar index of a specification file
+
+    Parameters
+    ----------
+    spec_path: str
+      path to the specification file. It needs to be located within a
+      dataset.
+    """
+
+    def __init__(self, spec_path):
+        self.spec_path = op.abspath(spec_path)
+        root = get_dataset_root(op.dirname(self.spec_path))
+        if root is None:
+            raise ValueError("{} is not within a dataset".format(spec_path))
+        rel_path = op.relpath(self.spec_path, root)
+        self.index_path = op.join(
+            root, '.git', 'datalad', 'hirni', 'specindex',
+            hashlib.md5(rel_path.encode('utf-8')).hexdigest() + '.json')
+        self._index = None
+        self._locators = None
+
+    def _stat(self):
+        st = os.stat(self.spec_path)
+        return st.st_mtime_ns, st.st_size
+
+    def build(self):
+        """(Re-)build the index from the specification file"""
+
+        entries = dict()
+        offset = 0
+        position = 0
+        with open(self.spec_path, 'rb') as f:
+            content = f.read()
+        for line in content.splitlines(True):
+            if line.strip():
+                key = get_snippet_key(loads(line.decode('utf-8')))
+                if key in entries:
+                    # only the first occurrence is addressable (as
+                    # spec4anything --replace does)
+                    lgr.debug("Duplicate snippet key in %s: %s",
+                              self.spec_path, key)
+                else:
+                    entries[key] = [offset, len(line), _hash(line), position]
+                position += 1
+            offset += len(line)
+        mtime, size = self._stat()
+        self._index = dict(version=_INDEX_VERSION,
+                           mtime=mtime,
+                           size=size,
+                           hash=_hash(content),
+                           entries=entries)
+        self._store()
+        return self._index
+
+    def _store(self):
+        if not op.exists(op.dirname(self.index_path)):
+            makedirs(op.dirname(self.index_path))
+        with open(self.index_path, 'w') as f:
+            json.dump(self._index, f)
+
+    @property
+    def index(self):
+        """The up-to-date index; rebuilt if the spec changed"""
+
+        if self._index is None and op.exists(self.index_path):
+            with open(self.index_path) as f:
+                self._index = json.load(f)
+        idx = self._index
+        if idx is None or idx.get('version') != _INDEX_VERSION:
+            return self.build()
+        mtime, size = self._stat()
+        if (mtime, size) != (idx['mtime'], idx['size']):
+            # the file was touched, but maybe it wasn't changed:
+            with open(self.spec_path, 'rb') as f:
+                if size != idx['size'] or _hash(f.read()) != idx['hash']:
+                    return self.build()
+            idx['mtime'] = mtime
+            self._store()
+        return idx
+
+    def keys(self):
+        return list(self.index['entries'].keys())
+
+    def find(self, type_, locator):
+        """Get the key of the first snippet of a type at a locator
+
+        This disregards the snippet's 'id', like dicom2spec does when looking
+        up the snippet of a DICOM series by its UID.
+
+        Parameters
+        ----------
+        type_: str
+          snippet type
+        locator: str
+          UID for DICOM series, location for anything else
+
+        Returns
+        -------
+        str or None
+        """
+
+        idx = self.index
+        if self._locators is None or self._locators[0] is not idx:
+            locators = dict()
+            for key, entry in sorted(idx['entries'].items(),
+                                     key=lambda i: i[1][0]):
+                t, loc, id_ = json.loads(key)
+                locators.setdefault((t, loc), key)
+            self._locators = (idx, locators)
+        return self._locators[1].get((type_, locator))
+
+    def position(self, key):
+        """Get the position of the snippet with key `key`
+
+        This is the index of the snippet in the list of all snippets as read
+        by `datalad.support.json_py.load_stream`, or None if there's no such
+        snippet.
+        """
+
+        entry = self.index['entries'].get(key)
+        return None if entry is None else entry[3]
+
+    def _read_line(self, key):
+        entry = self.index['entries'].get(key)
+        if entry is None:
+            return None, None
+        offset, length, line_hash, position = entry
+        with open(self.spec_path, 'rb') as f:
+            f.seek(offset)
+            line = f.read(length)
+        if _hash(line) != line_hash:
+            # shouldn't happen, since the index was validated against the
+            # file, but don't trust it blindly
+            lgr.debug("Outdated index for %s", self.spec_path)
+            self.build()
+            return self._read_line(key)
+        return entry, line
+
+    def get(self, key):
+        """Get the snippet with key `key`
+
+        Parameters
+        ----------
+        key: str
+          as returned by `get_snippet_key`
+
+        Returns
+        -------
+        dict or None
+        """
+
+        entry, line = self._read_line(key)
+        return None if line is None else loads(line.decode('utf-8'))
+
+    def replace(self, snippet):
+        """Replace the snippet with the same key as `snippet`
+
+        Nothing but the respective line is re-serialized; the remainder of
+        the file is copied over as is.
+
+        Raises
+        ------
+        KeyError
+          if there's no snippet with that key
+        """
+
+        key = get_snippet_key(snippet)
+        entry, line = self._read_line(key)
+        if line is None:
+            raise KeyError(key)
+        offset, length, line_hash, position = entry
+        new_line = dump_snippet(snippet)
+        with open(self.spec_path, 'rb') as f:
+            content = f.read()
+        content = content[:offset] + new_line + content[offset + length:]
+        atomic_write(self.spec_path, content)
+
+        # update the index instead of rebuilding it
+        delta = len(new_line) - length
+        idx = self._index
+        for e in idx['entries'].values():
+            if e[0] > offset:
+                e[0] += delta
+        idx['entries'][key] = [offset, len(new_line), _hash(new_line),
+                               position]
+        idx['mtime'], idx['size'] = self._stat()
+        idx['hash'] = _hash(content)
+        self._store()
+
+
+def get_snippet(spec_path, key):
+    """Read a single snippet from a specification file by its key"""
+
+    return SpecIndex(spec_path).get(key)
+
+
+def replace_snippet(spec_path, snippet):
+    """Replace a single snippet within a specification file"""
+
+    SpecIndex(spec_path).replace(snippet)
@@ -0,0 +1,217 @@
+"""Schema of specification snippets and a validator compiled from it
+
+The schema describes, which fields a snippet of a given type requires, and
+how the automatically managed (non-editable) fields look like. Any other
+field is an editable one, i.e. a dict with a 'value' and an 'approved' key.
+
+The schema is compiled into a list of checks per snippet type once, so that
+validating many snippets doesn't need to interpret the schema over and over.
+"""
+
+import fnmatch
+import json
+
+# how values of automatically managed fields look like
+managed_fields = {
+    'type': 'string',
+    'location': 'string',
+    'uid': 'string',
+    'dataset-id': 'string or null',
+    'dataset-refcommit': 'string or null',
+    'tags': 'list of strings',
+    'procedures': 'procedures',
+}
+
+# required fields per snippet type; keys are glob patterns matching the type
+snippet_schema = {
+    'dicomseries:all': {
+        'required': ['type', 'location'],
+    },
+    'dicomseries': {
+        'required': ['type', 'location', 'uid', 'dataset-id',
+                     'dataset-refcommit'],
+    },
+    'generic_*': {
+        'required': ['type', 'location'],
+    },
+}
+
+
+def _is_editable(value):
+    return isinstance(value, dict) and 'value' in value and \
+        isinstance(value.get('approved', False), bool) and \
+        set(value).issubset({'value', 'approved'})
+
+
+def _check_string(key, value):
+    if not isinstance(value, str):
+        return "'{}' is not a string".format(key)
+
+
+def _check_string_or_null(key, value):
+    if value is not None and not isinstance(value, str):
+        return "'{}' is neither a string nor null".format(key)
+
+
+def _check_list_of_strings(key, value):
+    if not isinstance(value, list) or \
+            not all(isinstance(v, str) for v in value):
+        return "'{}' is not a list of strings".format(key)
+
+
+def _check_procedures(key, value):
+    # an editable field not yet filled in, a single procedure or a list of
+    # them
+    if _is_editable(value):
+        return
+    for proc in value if isinstance(value, list) else [value]:
+        if not isinstance(proc, dict):
+            return "'{}' contains a procedure that is not a dict".format(key)
+        if 'procedure-name' not in proc:
+            return "'{}' contains a procedure without 'procedure-name'" \
+                   "".format(key)
+        invalid = sorted(k for k, v in proc.items() if not _is_editable(v))
+        if invalid:
+            return "'{}' contains a procedure with invalid field(s) {}" \
+                   "".format(key, ", ".join(invalid))
+
+
+def _check_editable(key, value):
+    if not _is_editable(value):
+        return "'{}' is not an editable field (a dict with 'value' and " \
+               "'approved')".format(key)
+
+
+_value_checks = {
+    'string': _check_string,
+    'string or null': _check_string_or_null,
+    'list of strings': _check_list_of_strings,
+    'procedures': _check_procedures,
+}
+
+
+class SpecValidator(object):
+    """Validator compiled from a snippet schema
+
+    Parameters
+    ----------
+    schema: dict
+      maps type patterns to a dict with a list of 'required' fields
+    managed: dict
+      maps names of automatically managed fields to the kind of value they
+      hold
+    """
+
+    def __init__(self, schema=None, managed=None):
+        schema = snippet_schema if schema is None else schema
+        managed = managed_fields if managed is None else managed
+        self._field_checks = {k: _value_checks[v] for k, v in managed.items()}
+        # exact type names are looked up directly, patterns in order
+        self._exact = dict()
+        self._patterns = []
+        for pattern, spec in schema.items():
+            required = tuple(spec.get('required', []))
+            if any(c in pattern for c in '*?['):
+                self._patterns.append((pattern, required))
+            else:
+                self._exact[pattern] = required
+        self._required = dict()
+
+    def _get_required(self, type_):
+        # cache lookups by type, so patterns are matched once per type
+        try:
+            return self._required[type_]
+        except KeyError:
+            required = self._exact.get(type_)
+            if required is None:
+                for pattern, req in self._patterns:
+                    if fnmatch.fnmatchcase(type_, pattern):
+                        required = req
+                        break
+            self._required[type_] = required
+            return required
+
+    def validate(self, snippet):
+        """Validate a single snippet
+
+        Returns
+        -------
+        list of str
+          problems found; empty if the snippet is valid
+        """
+
+        if not isinstance(snippet, dict):
+            return ["snippet is not a dict"]
+        type_ = snippet.get('type')
+        if not isinstance(type_, str):
+            return ["snippet has no valid 'type'"]
+        required = self._get_required(type_)
+        if required is None:
+            return ["unknown snippet type '{}'".format(type_)]
+
+        problems = ["missing required field '{}'".format(k)
+                    for k in required if k not in snippet]
+        field_checks = self._field_checks
+        for k, v in snippet.items():
+            problem = field_checks.get(k, _check_editable)(k, v)
+            if problem:
+                problems.append(problem)
+        return problems
+
+    def validate_stream(self, lines):
+        """Validate lines of a specification file
+
+        Parameters
+        ----------
+        lines: iterable of str
+
+        Returns
+        -------
+        list of tuple
+          (line number, problem) for all problems found
+        """
+
+        problems = []
+        for line_no, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                snippet = json.loads(line)
+            except ValueError as e:
+                problems.append((line_no, "invalid JSON: {}".format(e)))
+                continue
+            problems.extend((line_no, p) for p in self.validate(snippet))
+        return problems
+
+    def validate_file(self, path):
+        """Validate an entire specification file
+
+        Returns
+        -------
+        list of tuple
+          (line number, problem) for all problems found
+        """
+
+        with open(path) as f:
+            return self.validate_stream(f)
+
+
+_validator = None
+
+
+def get_validator():
+    """Get the validator for the default schema (compiled on first use)"""
+
+    global _validator
+    if _validator is None:
+        _validator = SpecValidator()
+    return _validator
+
+
+def validate_file(path):
+    """Validate a specification file against the default schema
+
+    Convenience function to be used with process pools.
+    """
+
+    return get_validator().validate_file(path)
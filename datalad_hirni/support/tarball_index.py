@@ -0,0 +1,73 @@
+"""Study-level record of imported DICOM tarballs by their content"""
+
+import hashlib
+import json
+import logging
+import os.path as op
+from os import makedirs
+
+from datalad.support import json_py
+
+lgr = logging.getLogger('datalad.hirni.tarball_index')
+
+# location of the index relative to the study dataset's root
+index_file = op.join('.datalad', 'hirni', 'tarballs.json')
+
+
+def get_tarball_key(path, chunksize=1024 * 1024):
+    """Compute the git-annex key (MD5 backend) of a local file
+
+    The file is read in chunks, so this works for tarballs of any size.
+    """
+
+    md5 = hashlib.md5()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunksize), b''):
+            md5.update(chunk)
+            size += len(chunk)
+    return 'MD5-s{size}--{md5}'.format(size=size, md5=md5.hexdigest())
+
+
+class TarballIndex(object):
+    """Maps the content (annex key) of imported tarballs to acquisitions
+
+    The index is a JSON stream within the study dataset and is committed
+    alongside the acquisitions it refers to. New records are appended, so
+    the latest record for a key wins.
+    """
+
+    def __init__(self, ds):
+        self.path = op.join(ds.path, index_file)
+        self._index = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = {r['key']: r['acquisition']
+                           for r in json_py.load_stream(self.path)} \
+                if op.exists(self.path) else dict()
+        return self._index
+
+    def get(self, key):
+        """Get the acquisition a tarball was imported as
+
+        Returns
+        -------
+        str or None
+          acquisition ID (path relative to the study dataset) or None if no
+          tarball with that content was imported yet
+        """
+        return self.index.get(key)
+
+    def add(self, key, acquisition):
+        """Record that tarball `key` was imported as `acquisition`"""
+
+        if not op.exists(op.dirname(self.path)):
+            makedirs(op.dirname(self.path))
+        index = self.index
+        with open(self.path, 'a') as f:
+            f.write(json.dumps({'key': key, 'acquisition': acquisition},
+                               sort_keys=True, separators=(',', ':')))
+            f.write('\n')
+        index[key] = acquisition
@@ -0,0 +1,257 @@
+"""Timing of named spans within hirni commands
+
+Commands are decorated with `traced`, while the steps within them (and the
+helpers they call) are wrapped into `span`s, like::
+
+  with span('import.extract'):
+      ...
+
+Tracing is off by default and spans cost next to nothing then. It is enabled
+by setting `datalad.hirni.trace` to the path of a JSON file. This trace file
+is in Chrome's trace event format (to be viewed in chrome://tracing or
+https://ui.perfetto.dev) and additionally holds a summary of the time spent
+per span name and, if `datalad.hirni.trace.profile` is set, cProfile
+statistics of the command. The span summary is also attached to the final
+result record of the command (as 'spans').
+
+A hirni command called by another one (like hirni-dicom2spec by
+hirni-import-dcm) doesn't start a trace of its own, but is recorded as a
+span of the calling command's trace.
+
+Besides spans, commands `count` what they processed (like DICOM series or
+imported bytes). Both are exported as metrics, if configured (see
+`datalad_hirni.support.metrics`).
+"""
+
+import json
+import logging
+import os
+import os.path as op
+import time
+from contextlib import contextmanager
+
+import wrapt
+
+lgr = logging.getLogger('datalad.hirni.tracing')
+
+# the trace of the currently running (outermost) hirni command, if enabled
+_active = None
+
+# number of functions to report cProfile statistics for
+profile_limit = 100
+
+
+class Tracer(object):
+    """Record of the spans of a single command call
+
+    Parameters
+    ----------
+    command: str
+      name of the traced command
+    profile: bool
+      whether to run cProfile alongside
+    """
+
+    def __init__(self, command, profile=False):
+        self.command = command
+        self.events = []
+        self.counters = dict()
+        self._depth = 0
+        self._start = time.time()
+        self._profiler = None
+        if profile:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    @contextmanager
+    def span(self, name, **info):
+        start = time.time()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            event = dict(name=name,
+                         start=start - self._start,
+                         duration=time.time() - start,
+                         depth=self._depth)
+            if info:
+                event['info'] = info
+            self.events.append(event)
+
+    def summary(self):
+        """Get count and total duration (in seconds) per span name"""
+
+        summary = dict()
+        for e in self.events:
+            s = summary.setdefault(e['name'], dict(count=0, total=0.))
+            s['count'] += 1
+            s['total'] += e['duration']
+        for s in summary.values():
+            s['total'] = round(s['total'], 6)
+        return summary
+
+    def stop(self):
+        """Stop profiling
+
+        Returns
+        -------
+        list of dict
+          cProfile statistics of the most expensive functions (by cumulative
+          time), or None if not profiled
+        """
+
+        if self._profiler is None:
+            return None
+        import pstats
+        self._profiler.disable()
+        stats = pstats.Stats(self._profiler).stats
+        profile = [dict(function='{}:{}({})'.format(*func),
+                        ncalls=nc,
+                        primitive_calls=cc,
+                        tottime=round(tt, 6),
+                        cumtime=round(ct, 6))
+                   for func, (cc, nc, tt, ct, callers) in stats.items()]
+        profile.sort(key=lambda p: p['cumtime'], reverse=True)
+        return profile[:profile_limit]
+
+    def write(self, path, profile=None):
+        """Write the trace in Chrome's trace event format to `path`"""
+
+        pid = os.getpid()
+        trace = dict(
+            traceEvents=[
+                dict(name=e['name'],
+                     ph='X',
+                     # microseconds
+                     ts=int(e['start'] * 1e6),
+                     dur=int(e['duration'] * 1e6),
+                     pid=pid,
+                     tid=0,
+                     args=e.get('info', {}))
+                for e in sorted(self.events, key=lambda e: e['start'])],
+            displayTimeUnit='ms',
+            command=self.command,
+            started=self._start,
+            duration=round(time.time() - self._start, 6),
+            spans=self.summary(),
+        )
+        if profile is not None:
+            trace['profile'] = profile
+        if self.counters:
+            trace['counters'] = self.counters
+        if op.dirname(path) and not op.exists(op.dirname(path)):
+            os.makedirs(op.dirname(path))
+        with open(path, 'w') as f:
+            json.dump(trace, f, indent=1)
+
+
+@contextmanager
+def span(name, **info):
+    """Time the enclosed block as span `name` of the active trace, if any
+
+    Additional keyword arguments are recorded along with the span.
+    """
+
+    if _active is None:
+        yield
+    else:
+        with _active.span(name, **info):
+            yield
+
+
+def count(name, value=1):
+    """Add `value` to counter `name` of the active trace, if any"""
+
+    if _active is not None:
+        _active.counters[name] = _active.counters.get(name, 0) + value
+
+
+def _get_config(dataset):
+    from datalad.distribution.dataset import Dataset
+    from datalad.distribution.dataset import require_dataset
+    from datalad.support.exceptions import NoDatasetArgumentFound
+    if isinstance(dataset, Dataset):
+        return dataset.config
+    try:
+        return require_dataset(dataset, check_installed=True).config
+    except (NoDatasetArgumentFound, ValueError):
+        import datalad
+        return datalad.cfg
+
+
+def traced(name):
+    """Decorator for a command's `__call__` to trace its execution
+
+    To be placed right beneath `eval_results`. Its `dataset` argument is used
+    to read the configuration from. Besides writing a trace file, this records
+    the command's metrics, if configured.
+
+    Parameters
+    ----------
+    name: str
+      name of the command; prefix of its spans
+    """
+
+    @wrapt.decorator
+    def trace_func(wrapped, instance, args, kwargs):
+        global _active
+
+        if _active is not None:
+            # called by another traced command
+            with _active.span(name):
+                for r in wrapped(*args, **kwargs):
+                    yield r
+            return
+
+        from datalad_hirni.support.metrics import (
+            get_metrics_targets,
+            record_metrics,
+        )
+
+        cfg = _get_config(kwargs.get('dataset', None))
+        path = cfg.get('datalad.hirni.trace', default=None)
+        metrics = get_metrics_targets(cfg)
+        if not path and not any(metrics):
+            for r in wrapped(*args, **kwargs):
+                yield r
+            return
+
+        tracer = Tracer(name,
+                        profile=bool(path) and cfg.getbool(
+                            'datalad.hirni', 'trace.profile', default=False))
+        _active = tracer
+        failures = 0
+        try:
+            # hold back a result, to be able to attach the span summary
+            # to the last one
+            last = None
+            for r in wrapped(*args, **kwargs):
+                if r.get('status', None) in ('impossible', 'error'):
+                    failures += 1
+                if last is not None:
+                    yield last
+                last = r
+        finally:
+            _active = None
+            duration = time.time() - tracer._start
+            profile = tracer.stop()
+            if any(metrics):
+                record_metrics(metrics, tracer, duration, failures)
+            if path:
+                path = op.expanduser(path.format(command=name,
+                                                 pid=os.getpid(),
+                                                 time=int(tracer._start)))
+                try:
+                    tracer.write(path, profile=profile)
+                except (IOError, OSError) as e:
+                    lgr.warning("Failed to write trace file %s: %s", path, e)
+                else:
+                    lgr.info("Wrote trace of %s to %s", name, path)
+        if last is not None and path:
+            last['spans'] = tracer.summary()
+        if last is not None:
+            yield last
+
+    return trace_func
@@ -0,0 +1,93 @@
+"""Polling of directories for newly arrived (and complete) files"""
+
+import fnmatch
+import logging
+import os
+import os.path as op
+import time
+
+lgr = logging.getLogger('datalad.hirni.watch_folder')
+
+
+class FolderWatcher(object):
+    """Report files in watched directories, once they stopped changing
+
+    A file counts as complete, once its size and modification time didn't
+    change for `settle` seconds. Hidden files (like the temporary files of
+    rsync) are ignored. Each version of a file is reported once; a file that
+    is replaced later on, is reported again.
+
+    Parameters
+    ----------
+    paths: list of str
+      directories to watch (not recursively)
+    settle: float
+      seconds a file needs to stay unchanged
+    pattern: str
+      glob pattern file names need to match
+    """
+
+    def __init__(self, paths, settle=10., pattern='*'):
+        self.paths = [op.abspath(p) for p in paths]
+        self.settle = settle
+        self.pattern = pattern
+        # path -> (size, mtime, time it was first seen like this)
+        self._candidates = dict()
+        # path -> (size, mtime) as reported
+        self._reported = dict()
+
+    def _scan(self):
+        for d in self.paths:
+            try:
+                entries = list(os.scandir(d))
+            except OSError as e:
+                lgr.warning("Cannot watch %s: %s", d, e)
+                continue
+            for entry in entries:
+                if entry.name.startswith('.') or \
+                        not fnmatch.fnmatch(entry.name, self.pattern):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    # vanished in between
+                    continue
+                yield entry.path, (st.st_size, st.st_mtime_ns)
+
+    def poll(self, now=None):
+        """Check the watched directories
+
+        Returns
+        -------
+        list of str
+          paths of files that became complete since the last call
+        """
+
+        now = time.time() if now is None else now
+        ready = []
+        present = set()
+        for path, state in self._scan():
+            present.add(path)
+            if self._reported.get(path) == state:
+                continue
+            candidate = self._candidates.get(path)
+            if candidate is None or candidate[:2] != state:
+                # new or still changing
+                self._candidates[path] = state + (now,)
+                continue
+            if now - candidate[2] >= self.settle:
+                del self._candidates[path]
+                self._reported[path] = state
+                ready.append(path)
+        # forget about files that vanished
+        for d in (self._candidates, self._reported):
+            for path in set(d).difference(present):
+                del d[path]
+        return sorted(ready)
+
+    @property
+    def pending(self):
+        """Number of files seen, but not complete yet"""
+        return len(self._candidates)
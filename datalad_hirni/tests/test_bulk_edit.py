@@ -0,0 +1,134 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test editing many specification snippets at once"""
+
+import os.path as op
+
+from datalad.api import Dataset
+from datalad.support.exceptions import InsufficientArgumentsError
+from datalad.support.json_py import (
+    dump2stream,
+    load_stream,
+)
+from datalad.tests.utils import (
+    assert_equal,
+    assert_false,
+    assert_raises,
+    assert_result_count,
+    assert_true,
+    ok_clean_git,
+    with_tempfile,
+)
+
+from datalad_hirni.support.bulk_edit import (
+    edit_snippet,
+    SnippetFilter,
+)
+
+
+def _edit(value, approved=False):
+    return dict(value=value, approved=approved)
+
+
+def test_snippet_filter():
+    snippet = {'type': 'dicomseries', 'uid': '1.2.3',
+               'description': _edit('func_task-oneback_run-1'),
+               'id': _edit(401, True),
+               'bids-task': _edit(None),
+               'tags': ['functional']}
+    assert_true(SnippetFilter()(snippet))
+    assert_true(SnippetFilter(type='dicom*', uid='1.2.*',
+                              match={'id': '401'},
+                              regex={'description': '^func_task-one'},
+                              unapproved=['bids-task'],
+                              tags=['functional'])(snippet))
+    assert_false(SnippetFilter(type='dicomseries:all')(snippet))
+    assert_false(SnippetFilter(uid='1.2.4')(snippet))
+    assert_false(SnippetFilter(match={'id': 402})(snippet))
+    assert_false(SnippetFilter(regex={'description': '^anat'})(snippet))
+    assert_false(SnippetFilter(regex={'bids-task': '.*'})(snippet))
+    assert_false(SnippetFilter(unapproved=['id'])(snippet))
+    assert_false(SnippetFilter(tags=['functional', 'other'])(snippet))
+
+    # raw lines are only skipped, if they can't match
+    line = '{"type":"dicomseries","uid":"1.2.3"}'
+    assert_true(SnippetFilter(type='dicomseries', uid='1.2.3').prefilter(line))
+    assert_false(SnippetFilter(type='generic_file').prefilter(line))
+    assert_false(SnippetFilter(uid='1.2.4').prefilter(line))
+    assert_true(SnippetFilter(type='generic_*').prefilter(line))
+
+
+def test_edit_snippet():
+    snippet = {'type': 'dicomseries', 'bids-task': _edit('rest', True)}
+    assert_false(edit_snippet(snippet, values={'bids-task': 'rest'},
+                              approve=['bids-task', 'bids-run']))
+    assert_true(edit_snippet(snippet, values={'bids-task': 'oneback',
+                                              'bids-run': '01'}))
+    assert_equal(snippet['bids-task'], _edit('oneback', True))
+    assert_equal(snippet['bids-run'], _edit('01'))
+    assert_true(edit_snippet(snippet, approve=['bids-run'],
+                             unapprove=['bids-task']))
+    assert_equal(snippet['bids-task'], _edit('oneback'))
+    assert_equal(snippet['bids-run'], _edit('01', True))
+
+
+@with_tempfile
+def test_bulk_edit(path):
+
+    ds = Dataset(path).create()
+    acq1 = op.join(ds.path, 'acq1', 'studyspec.json')
+    acq2 = op.join(ds.path, 'acq2', 'studyspec.json')
+    dump2stream([
+        {'type': 'dicomseries:all', 'location': 'dicoms'},
+        {'type': 'dicomseries', 'uid': '1.1',
+         'description': _edit('func_task-oneback_run-1'),
+         'bids-task': _edit(None)},
+        {'type': 'dicomseries', 'uid': '1.2',
+         'description': _edit('anat_T1w'),
+         'bids-task': _edit(None)},
+    ], acq1)
+    dump2stream([
+        {'type': 'dicomseries', 'uid': '2.1',
+         'description': _edit('func_task-oneback_run-2'),
+         'bids-task': _edit('oneback', True)},
+    ], acq2)
+    ds.save(message="add specs")
+    with open(acq2, 'rb') as f:
+        acq2_content = f.read()
+
+    assert_raises(InsufficientArgumentsError, ds.hirni_bulk_edit)
+    assert_raises(InsufficientArgumentsError, ds.hirni_bulk_edit,
+                  values={'uid': '1.3'})
+
+    start = ds.repo.get_hexsha()
+    res = ds.hirni_bulk_edit(type='dicomseries',
+                             regex={'description': '^func_task-oneback'},
+                             values={'bids-task': 'oneback'},
+                             approve=['bids-task'])
+    assert_result_count(res, 1, action='hirni bulk edit', status='ok',
+                        path=acq1)
+    assert_result_count(res, 1, action='hirni bulk edit',
+                        status='notneeded', path=acq2)
+    # a single commit
+    assert_equal(ds.repo.get_hexsha('HEAD~1'), start)
+    ok_clean_git(ds.path)
+
+    snippets = list(load_stream(acq1))
+    assert_equal(snippets[1]['bids-task'], _edit('oneback', True))
+    assert_equal(snippets[2]['bids-task'], _edit(None))
+    with open(acq2, 'rb') as f:
+        assert_equal(f.read(), acq2_content)
+
+    # limited to an acquisition
+    res = ds.hirni_bulk_edit(path=op.join(ds.path, 'acq2'),
+                             unapprove=['bids-task'])
+    assert_result_count(res, 1, action='hirni bulk edit', status='ok',
+                        path=acq2)
+    assert_equal(list(load_stream(acq2))[0]['bids-task'], _edit('oneback'))
@@ -0,0 +1,75 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test study-wide specification catalog"""
+
+import os.path as op
+
+from datalad.api import Dataset
+from datalad.support.json_py import dump2stream
+from datalad.tests.utils import (
+    assert_equal,
+    assert_result_count,
+    with_tempfile,
+)
+
+
+def _edit(value, approved=False):
+    return dict(value=value, approved=approved)
+
+
+@with_tempfile
+def test_catalog(path):
+
+    ds = Dataset(path).create()
+    dump2stream([
+        {'type': 'dicomseries', 'uid': '1.1',
+         'bids-modality': _edit('bold'),
+         'bids-task': _edit('rest'),
+         'tags': ['functional']},
+        {'type': 'dicomseries', 'uid': '1.2',
+         'bids-modality': _edit('T1w', True)},
+    ], op.join(ds.path, 'acq1', 'studyspec.json'))
+    dump2stream([
+        {'type': 'dicomseries', 'uid': '2.1',
+         'bids-modality': _edit('bold', True),
+         'bids-task': _edit('rest', True),
+         'id': _edit(401, True)},
+        {'type': 'generic_file', 'location': 'events.tsv'},
+    ], op.join(ds.path, 'acq2', 'studyspec.json'))
+
+    res = ds.hirni_catalog()
+    assert_result_count(res, 2)
+    assert_result_count(res, 2, status='ok', message='added')
+
+    # nothing to re-ingest
+    assert_result_count(ds.hirni_catalog(), 2, status='notneeded')
+
+    res = ds.hirni_catalog(match={'bids-modality': 'bold'})
+    assert_equal(sorted(r['snippet']['uid'] for r in res), ['1.1', '2.1'])
+
+    res = ds.hirni_catalog(unapproved='bids-task')
+    assert_result_count(res, 1)
+    assert_result_count(res, 1,
+                        path=op.join(ds.path, 'acq1', 'studyspec.json'))
+
+    assert_result_count(ds.hirni_catalog(type='generic_file'), 1)
+    assert_result_count(ds.hirni_catalog(tag='functional'), 1)
+    # non-string values are matched by their JSON representation
+    assert_result_count(ds.hirni_catalog(match='id=401'), 1)
+
+    # changed specs are picked up
+    dump2stream([
+        {'type': 'dicomseries', 'uid': '1.1',
+         'bids-modality': _edit('bold', True),
+         'bids-task': _edit('rest', True)},
+    ], op.join(ds.path, 'acq1', 'studyspec.json'))
+    res = ds.hirni_catalog()
+    assert_result_count(res, 1, status='ok', message='updated')
+    assert_result_count(ds.hirni_catalog(unapproved='bids-task'), 0)
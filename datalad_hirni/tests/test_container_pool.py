@@ -0,0 +1,104 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test keeping containers warm"""
+
+import os.path as op
+from unittest.mock import (
+    MagicMock,
+    patch,
+)
+
+from datalad.api import Dataset
+from datalad.config import ConfigManager
+from datalad.tests.utils import (
+    assert_equal,
+    assert_is,
+    assert_raises,
+    with_tempfile,
+)
+
+from datalad_hirni.support.container_pool import (
+    _get_env_var,
+    _singularity_exec,
+    _split_options,
+    ContainerPool,
+)
+
+
+def test_env_var():
+    assert_equal(_get_env_var('conversion'),
+                 'DATALAD_CONTAINERS_CONVERSION_CMDEXEC')
+    assert_equal(_get_env_var('dicom-conv2'),
+                 'DATALAD_CONTAINERS_DICOM__CONV2_CMDEXEC')
+    # names not expressible via the environment
+    assert_is(_get_env_var('dicom_conv'), None)
+    assert_is(_get_env_var('dicom.conv'), None)
+    assert_is(_get_env_var('Conversion'), None)
+
+
+def test_env_var_roundtrip():
+    # the variable has to end up as the container's config
+    with patch.dict('os.environ',
+                    {_get_env_var('dicom-conv'): 'singularity exec x {cmd}'}):
+        cfg = ConfigManager(dataset=None)
+        assert_equal(cfg.get('datalad.containers.dicom-conv.cmdexec'),
+                     'singularity exec x {cmd}')
+
+
+def test_singularity_exec():
+    match = _singularity_exec.match('singularity exec {img} {cmd}')
+    assert_equal(match.group('options'), '')
+    match = _singularity_exec.match(
+        'singularity exec --cleanenv -B /data {img} {cmd}')
+    assert_equal(match.group('options'), '--cleanenv -B /data')
+    # not executed via singularity exec:
+    assert_is(_singularity_exec.match('docker run {img} {cmd}'), None)
+    assert_is(_singularity_exec.match('singularity run {img} {cmd}'), None)
+    assert_is(_singularity_exec.match(
+        'singularity exec {img} sh -c {cmd}'), None)
+
+
+def test_split_options():
+    assert_equal(_split_options(''), ([], []))
+    # setting up the container when starting the instance, the rest with
+    # each execution
+    assert_equal(
+        _split_options('--cleanenv -B /data --contain --pwd /work '
+                       '--bind=/in:/out --env "A=b c"'),
+        (['-B', '/data', '--contain', '--bind=/in:/out'],
+         ['--cleanenv', '--pwd', '/work', '--env', 'A=b c']))
+    # unknown options, missing values and placeholders can't be split
+    assert_is(_split_options('--some-new-option'), None)
+    assert_is(_split_options('--cleanenv -B'), None)
+    assert_is(_split_options('-B {img_dspath}'), None)
+
+
+def test_pool_env():
+    pool = ContainerPool()
+    assert_equal(pool.env, {})
+    pool._instances['/some/image.simg'] = (
+        'hirni-conv-1', 'DATALAD_CONTAINERS_CONV_CMDEXEC',
+        'singularity exec instance://hirni-conv-1 {cmd}')
+    assert_equal(pool.env, {'DATALAD_CONTAINERS_CONV_CMDEXEC':
+                            'singularity exec instance://hirni-conv-1 {cmd}'})
+    # nothing to stop
+    pool._instances.clear()
+
+
+@with_tempfile
+def test_pool_stopped_on_failure(path):
+    ds = Dataset(path).create()
+    pool = MagicMock(env={})
+    with patch('datalad_hirni.commands.spec2bids.get_container_pool',
+               return_value=pool):
+        # reading the missing specification fails mid-conversion
+        assert_raises(Exception, ds.hirni_spec2bids,
+                      op.join(ds.path, 'missing.json'), on_failure='ignore')
+    pool.stop.assert_called_once_with()
@@ -0,0 +1,87 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test hirni-daemon and hirni-client"""
+
+import os
+import os.path as op
+import threading
+import time
+
+from datalad.api import Dataset
+from datalad.support.json_py import dump2stream
+from datalad.tests.utils import (
+    assert_equal,
+    assert_false,
+    assert_raises,
+    assert_result_count,
+    with_tempfile,
+)
+
+from datalad_hirni.client import (
+    get_socket_path,
+    main,
+    submit,
+)
+from datalad_hirni.support.daemon import HirniDaemon
+
+
+@with_tempfile
+def test_daemon(path):
+
+    ds = Dataset(path).create()
+    dump2stream([{'type': 'dicomseries', 'uid': '1.2.3'}],
+                op.join(ds.path, 'acq1', 'studyspec.json'))
+
+    daemon = HirniDaemon(ds)
+    server = threading.Thread(target=daemon.serve)
+    server.start()
+    socket_path = get_socket_path(ds.path)
+    while not op.exists(socket_path):
+        time.sleep(0.1)
+
+    try:
+        assert_result_count(list(submit(socket_path, 'ping')), 1,
+                            status='ok', message='pong')
+        # a second daemon can't serve the same socket
+        assert_raises(RuntimeError, HirniDaemon(ds).serve)
+
+        res = list(submit(socket_path, 'catalog', {'type': 'dicomseries'}))
+        assert_result_count(res, 1, status='ok', action='hirni catalog')
+        assert_equal(res[0]['snippet']['uid'], '1.2.3')
+
+        assert_result_count(list(submit(socket_path, 'bogus')), 1,
+                            status='impossible')
+        # relative paths are resolved against the client's working
+        # directory and the client's dataset is used
+        other = Dataset(op.join(path, 'other')).create()
+        dump2stream([{'type': 'dicomseries', 'uid': '4.5.6'}],
+                    op.join(other.path, 'acq2', 'studyspec.json'))
+        res = list(submit(socket_path, 'validate',
+                          {'path': op.join(os.curdir, 'studyspec.json')},
+                          cwd=op.join(other.path, 'acq2'),
+                          dataset=other.path))
+        assert_result_count(res, 1, action='hirni validate',
+                            path=op.join(other.path, 'acq2',
+                                         'studyspec.json'))
+        res = list(submit(socket_path, 'catalog', {'type': 'dicomseries'},
+                          dataset=other.path))
+        assert_result_count(res, 1, action='hirni catalog')
+        assert_equal(res[0]['snippet']['uid'], '4.5.6')
+        # via commandline interface of the client
+        assert_equal(main(['-d', ds.path, 'hirni-catalog']), 0)
+        assert_equal(main(['-d', ds.path, 'bogus']), 1)
+    finally:
+        list(submit(socket_path, 'shutdown'))
+        server.join()
+
+    assert_equal(daemon.jobs, 4)
+    assert_false(op.exists(socket_path))
+    # no daemon running anymore
+    assert_equal(main(['-d', ds.path, 'ping']), 2)
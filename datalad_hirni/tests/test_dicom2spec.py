@@ -268,3 +268,29 @@ def test_dicom2spec(path):
     assert_result_count(res, 1, path=op.join(ds.path, 'spec_structural.json'))
     assert_result_count(res, 1, path=op.join(ds.path, '.gitattributes'))
     ok_clean_git(ds.path)
+
+
+@with_tempfile
+def test_dicom2spec_rerun(path):
+
+    # ## SETUP a raw ds
+    ds = install(source=test_raw_ds.get_raw_dataset(), path=path)
+    # ## END SETUP
+
+    spec_path = op.join(path, "func_acq", "studyspec.json")
+    ds.hirni_dicom2spec(path=op.join("func_acq", "dicoms"),
+                        spec=op.join("func_acq", "studyspec.json"))
+    with open(spec_path, 'rb') as f:
+        content = f.read()
+
+    # existing series are looked up via the spec's index and updated rather
+    # than added again
+    from datalad_hirni.support.spec_index import SpecIndex
+    ds.hirni_dicom2spec(path=op.join("func_acq", "dicoms"),
+                        spec=op.join("func_acq", "studyspec.json"))
+    assert op.exists(SpecIndex(spec_path).index_path)
+    with open(spec_path, 'rb') as f:
+        assert_equal(f.read(), content)
+    func_spec = list(load_stream(spec_path))
+    assert_equal(len(func_spec), 2)
+    ok_clean_git(ds.path)
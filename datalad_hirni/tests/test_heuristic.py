@@ -0,0 +1,60 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test the heudiconv heuristic"""
+
+from datalad.tests.utils import assert_equal
+
+from datalad_hirni.support.hirni_heuristic import (
+    get_bids_name,
+    get_series_groups,
+)
+
+
+def _get_series(uid, modality, run=None, tags=None):
+    series = {'type': 'dicomseries',
+              'uid': uid,
+              'bids-modality': {'value': modality, 'approved': False},
+              'bids-task': {'value': 'oneback', 'approved': False}}
+    if run:
+        series['bids-run'] = {'value': run, 'approved': False}
+    if tags:
+        series['tags'] = tags
+    return series
+
+
+def test_get_bids_name():
+
+    assert_equal(get_bids_name(_get_series('1', 'bold', run='01'), '02'),
+                 'sub-02/func/sub-02_task-oneback_run-01_bold')
+    assert_equal(get_bids_name(_get_series('1', 't1'), '02'),
+                 'sub-02/anat/sub-02_T1w')
+
+
+def test_get_series_groups():
+
+    series = [_get_series('1', 'bold', run='01'),
+              _get_series('2', 'bold', run='02'),
+              _get_series('3', 'bold', run='03'),
+              # converted to the same name as 1
+              _get_series('4', 'bold', run='01'),
+              _get_series('5', 't1'),
+              _get_series('6', 't1', tags=['hirni-dicom-converter-ignore'])]
+
+    groups = get_series_groups(series, 3)
+    assert_equal(len(groups), 3)
+    # ignored series aren't converted at all
+    assert_equal(sorted(uid for g in groups for uid in g),
+                 ['1', '2', '3', '4', '5'])
+    # same name, same group
+    assert_equal([g for g in groups if '1' in g], [['1', '4']])
+
+    # not more groups than there are distinct names
+    assert_equal(len(get_series_groups(series, 10)), 4)
+    assert_equal(get_series_groups(series, 1), [['1', '4', '2', '3', '5']])
@@ -1,13 +1,27 @@
+import os.path as op
 from os.path import join as opj
+from shutil import copyfile
+from unittest.mock import patch
 
 import datalad_hirni
 from datalad.api import Dataset
 
 from datalad.tests.utils import ok_exists, ok_file_under_git
+from datalad.tests.utils import assert_result_count
+from datalad.tests.utils import ok_clean_git
+from datalad.tests.utils import assert_in
+from datalad.tests.utils import assert_equal
+from datalad.tests.utils import assert_raises
+from datalad.support.json_py import load_stream
 from datalad.tests.utils import with_tempfile
 
 from datalad_neuroimaging.tests.utils import create_dicom_tarball
 
+from datalad_hirni.support.dicom_tarball import (
+    get_annex_key,
+    get_key_extension,
+)
+
 
 @with_tempfile(mkdir=True)
 @with_tempfile
@@ -37,9 +51,18 @@ def test_import_tarball(src, ds_path):
                       annexed=False)
     ok_exists(opj(ds.path, 'user_defined_acquisition', 'dicoms', 'structural'))
 
-    # now import again, but let the import routine figure out an acquisition
-    # name based on DICOM metadata (ATM just the first occurring PatientID,
-    # I think)
+    # importing the very same content again is detected as such:
+    res = ds.hirni_import_dcm(path=filename, acqid=None)
+    assert_result_count(res, 1, status='notneeded',
+                        path=opj(ds.path, 'user_defined_acquisition',
+                                 'dicoms'))
+    assert not op.exists(opj(ds.path, 'sub-02'))
+
+    # now import another tarball and let the import routine figure out an
+    # acquisition name based on DICOM metadata (ATM just the first occurring
+    # PatientID, I think)
+    filename = opj(src, "functional.tar.gz")
+    create_dicom_tarball(flavor="functional", path=filename)
     ds.hirni_import_dcm(path=filename, acqid=None)
 
     subs = ds.subdatasets(fulfilled=True, recursive=True, recursion_limit=None,
@@ -48,5 +71,189 @@ def test_import_tarball(src, ds_path):
     assert opj(ds.path, 'sub-02', 'dicoms') in [s.path for s in subs]
     ok_exists(opj(ds.path, 'sub-02', 'studyspec.json'))
     ok_file_under_git(opj(ds.path, 'sub-02', 'studyspec.json'), annexed=False)
-    ok_exists(opj(ds.path, 'sub-02', 'dicoms', 'structural'))
+    ok_exists(opj(ds.path, 'sub-02', 'dicoms', 'functional'))
+    ok_file_under_git(opj(ds.path, '.datalad', 'hirni', 'tarballs.json'),
+                      annexed=False)
+
+
+
+@with_tempfile(mkdir=True)
+@with_tempfile
+def test_batch_import_tarballs(src, ds_path):
+
+    for flavor in ["structural", "functional"]:
+        create_dicom_tarball(flavor=flavor,
+                             path=opj(src, "{}.tar.gz".format(flavor)))
+
+    ds = Dataset(ds_path).create(cfg_proc=['hirni'])
+    ds.config.set("datalad.hirni.import.acquisition-format",
+                  "{PatientID}_{SeriesNumber}", where='dataset')
+    ds.save(message="TEST: configure acquisition id detection")
+
+    res = ds.hirni_batch_import_dcm(path=opj(src, "*.tar.gz"), jobs=2)
+    assert_result_count(res, 2, status='ok', type='dataset',
+                        action='import DICOM tarball')
+
+    subs = ds.subdatasets(fulfilled=True, recursive=True,
+                          recursion_limit=None, result_xfm='datasets')
+    for r in res:
+        assert r['path'] in [s.path for s in subs]
+        ok_exists(opj(r['path'], op.pardir, 'studyspec.json'))
+    ok_clean_git(ds.path)
+
+
+@with_tempfile(mkdir=True)
+@with_tempfile
+def test_watch(src, ds_path):
+
+    ds = Dataset(ds_path).create(cfg_proc=['hirni'])
+    ds.config.set("datalad.hirni.import.acquisition-format",
+                  "{PatientID}_{SeriesNumber}", where='dataset')
+    ds.save(message="TEST: configure acquisition id detection")
+
+    for flavor in ["structural", "functional"]:
+        create_dicom_tarball(flavor=flavor,
+                             path=opj(src, "{}.tar.gz".format(flavor)))
+    # same content under another name as well as a hidden file:
+    copyfile(opj(src, "structural.tar.gz"), opj(src, "copy.tar.gz"))
+    copyfile(opj(src, "structural.tar.gz"), opj(src, ".partial"))
+
+    res = ds.hirni_watch(src, once=True, interval=0.1, settle=0, jobs=2)
+    assert_result_count(res, 2, status='ok', type='dataset',
+                        action='import DICOM tarball')
+    assert_result_count(res, 1, status='notneeded')
+    for r in res:
+        if r['status'] == 'ok':
+            ok_exists(opj(r['path'], op.pardir, 'studyspec.json'))
+    ok_clean_git(ds.path)
+
+    # nothing new arrived:
+    res = ds.hirni_watch(src, once=True, interval=0.1, settle=0)
+    assert_result_count(res, 0, status='ok')
+
+
+@with_tempfile(mkdir=True)
+@with_tempfile
+def test_watch_failure(src, ds_path):
+
+    ds = Dataset(ds_path).create(cfg_proc=['hirni'])
+    ds.config.set("datalad.hirni.import.acquisition-format",
+                  "{PatientID}_{SeriesNumber}", where='dataset')
+    ds.save(message="TEST: configure acquisition id detection")
+
+    for flavor in ["structural", "functional"]:
+        create_dicom_tarball(flavor=flavor,
+                             path=opj(src, "{}.tar.gz".format(flavor)))
+
+    # the first tarball to be moved into place fails, the next one is
+    # imported nevertheless
+    from datalad_hirni.commands import watch
+    move = watch._move_to_acquisition
+    calls = []
+
+    def fail_once(src_dir, target_ds, ses):
+        calls.append(ses)
+        if len(calls) == 1:
+            raise RuntimeError("simulated failure")
+        return move(src_dir, target_ds, ses)
+
+    with patch.object(watch, '_move_to_acquisition', fail_once):
+        res = ds.hirni_watch(src, once=True, interval=0.1, settle=0, jobs=1,
+                             on_failure='ignore')
+    assert_result_count(res, 1, status='error', type='file',
+                        action='import DICOM tarball')
+    assert_result_count(res, 1, status='ok', type='dataset',
+                        action='import DICOM tarball')
+    assert_equal(len(calls), 2)
+    assert not op.exists(opj(ds.path, calls[0]))
+    ok_exists(opj(ds.path, calls[1], 'studyspec.json'))
+    assert not op.exists(opj(ds.path, '.git', 'datalad',
+                             'hirni_import_watch'))
+    ok_clean_git(ds.path)
+
+
+@with_tempfile(mkdir=True)
+@with_tempfile
+def test_deferred_aggregation(src, ds_path):
+
+    ds = Dataset(ds_path).create(cfg_proc=['hirni'])
+    ds.config.set("datalad.hirni.import.acquisition-format",
+                  "{PatientID}_{SeriesNumber}", where='dataset')
+    ds.config.set("datalad.hirni.aggregate.threshold", "2", where='local')
+    ds.save(message="TEST: configure acquisition id detection")
+
+    paths = []
+    for flavor in ["structural", "functional"]:
+        filename = opj(src, "{}.tar.gz".format(flavor))
+        create_dicom_tarball(flavor=flavor, path=filename)
+        res = ds.hirni_import_dcm(path=filename)
+        paths.extend(r['path'] for r in res
+                     if r['action'] == 'import DICOM tarball')
+        # specification was created right away
+        ok_exists(opj(paths[-1], op.pardir, 'studyspec.json'))
+
+    # aggregation of both in one go happened on the second import only:
+    assert_result_count(res, 2, action='hirni aggregate', status='ok')
+    for p in paths:
+        assert_in('dicom', ds.meta_dump(
+            p, reporton='datasets',
+            return_type='item-or-list')['metadata'])
+    assert_result_count(ds.hirni_aggregate(), 0)
+    ok_clean_git(ds.path)
+
+
+@with_tempfile(mkdir=True)
+@with_tempfile
+def test_import_tarball_no_extract(src, ds_path):
+
+    filename = opj(src, "structural.tar.gz")
+    create_dicom_tarball(flavor="structural", path=filename)
+
+    ds = Dataset(ds_path).create(cfg_proc=['hirni'])
+    ds.config.set("datalad.hirni.import.acquisition-format",
+                  "sub-{PatientID}", where='dataset')
+    ds.save(message="TEST: configure acquisition id detection")
+
+    ds.hirni_import_dcm(path=filename, no_extract=True)
+
+    dicom_ds = Dataset(opj(ds.path, 'sub-02', 'dicoms'))
+    ok_exists(opj(ds.path, 'sub-02', 'studyspec.json'))
+    # series metadata was read from the headers in the archive:
+    ok_file_under_git(opj(dicom_ds.path, '.datalad', 'hirni',
+                          'dicomseries.json'),
+                      annexed=False)
+    spec = list(load_stream(opj(ds.path, 'sub-02', 'studyspec.json')))
+    assert_in('dicomseries', [s['type'] for s in spec])
+
+    # DICOMs are known to annex, but were never extracted:
+    dicoms = [f for f in dicom_ds.repo.get_annexed_files()]
+    assert dicoms
+    assert not any(dicom_ds.repo.file_has_content(dicoms))
+    # keys are those the dataset's backend assigns to extracted files, so
+    # that the same content is shared:
+    for f in dicoms:
+        assert_equal(dicom_ds.repo.get_file_key(f).split('-')[0], 'MD5E')
+    # still they can be obtained from the archive:
+    assert_result_count(dicom_ds.get(dicoms[0]), 1, status='ok')
+    with open(opj(dicom_ds.path, dicoms[0]), 'rb') as f:
+        assert_equal(dicom_ds.repo.get_file_key(dicoms[0]),
+                     get_annex_key(f.read(), dicoms[0]))
+    ok_clean_git(ds.path)
+
 
+def test_annex_key():
+    assert_equal(get_annex_key(b'x', op.join('a', 'b.tar.gz')),
+                 'MD5E-s1--9dd4e461268c8034f5c8564e155c67a6.tar.gz')
+    assert_equal(get_annex_key(b'x', 'b.tar.gz', backend='MD5'),
+                 'MD5-s1--9dd4e461268c8034f5c8564e155c67a6')
+    assert_raises(ValueError, get_annex_key, b'x', 'b', backend='WORM')
+    for name, ext in (('image.dcm', '.dcm'),
+                      ('MR000001', ''),
+                      # too long extensions end it
+                      ('1.3.12.2.1107.5.2.43.66012.30000019', ''),
+                      ('x.jpeg.nii', '.jpeg.nii'),
+                      ('x.html5', ''),
+                      # invalid characters are left out
+                      ('a.b-c.gz', '.gz'),
+                      ('a.b.c.d', '.c.d')):
+        assert_equal(get_key_extension(name), ext)
@@ -0,0 +1,65 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test that loading the command suite stays cheap"""
+
+import os
+import subprocess
+import sys
+
+from datalad.tests.utils import (
+    assert_greater,
+    assert_not_in,
+)
+
+from datalad_hirni import command_suite
+
+# dependencies only to be imported once a command actually runs
+heavy_modules = [
+    'datalad_metalad',
+    'datalad_container',
+    'datalad.interface.download_url',
+    'datalad_neuroimaging',
+    'mock',
+]
+
+# budget (in milliseconds) for the time spent importing hirni's own modules
+# (excluding their dependencies); can be adjusted for slow machines via
+# HIRNI_IMPORT_BUDGET_MS
+import_budget_ms = float(os.environ.get('HIRNI_IMPORT_BUDGET_MS', 150))
+
+
+def _get_import_times():
+    # import all command modules the way datalad does to build its API
+    code = "; ".join("import {}".format(c[0]) for c in command_suite[1])
+    out = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True).stderr
+    # lines look like: "import time:  self [us] | cumulative | imported package"
+    times = dict()
+    for line in out.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        times[module.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def test_import_time():
+    times = _get_import_times()
+
+    for m in heavy_modules:
+        assert_not_in(m, times)
+
+    own_ms = sum(t[0] for m, t in times.items()
+                 if m.startswith('datalad_hirni')) / 1000.
+    assert_greater(import_budget_ms, own_ms)
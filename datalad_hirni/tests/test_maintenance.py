@@ -0,0 +1,90 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test deferred git maintenance"""
+
+import os.path as op
+
+from datalad.api import Dataset
+from datalad.tests.utils import (
+    assert_result_count,
+    assert_equal,
+    with_tempfile,
+)
+
+from datalad_hirni.support.maintenance import (
+    get_pending,
+    maintain_if_due,
+    schedule_maintenance,
+)
+
+
+@with_tempfile
+def test_deferred_maintenance(path):
+
+    ds = Dataset(path).create()
+    subs = [ds.create(op.join('acq{}'.format(i), 'dicoms'))
+            for i in range(3)]
+
+    ds.config.set('datalad.hirni.maintenance.threshold', '3',
+                  where='local')
+
+    # nothing pending yet
+    assert_equal(get_pending(ds), [])
+
+    schedule_maintenance(ds, [subs[0].path])
+    # same dataset twice is pending once
+    schedule_maintenance(ds, [subs[0].path, subs[1].path])
+    assert_equal(get_pending(ds), [subs[0].path, subs[1].path])
+
+    # below threshold: nothing happens
+    assert_equal(list(maintain_if_due(ds)), [])
+    assert_equal(len(get_pending(ds)), 2)
+
+    schedule_maintenance(ds, [subs[2].path])
+    res = list(maintain_if_due(ds))
+    assert_result_count(res, 3, action='hirni maintenance')
+    assert_equal(get_pending(ds), [])
+
+    # explicit maintenance of a dataset, that isn't pending; it was just
+    # packed, so there's nothing to do
+    res = ds.hirni_maintenance(path=subs[0].path)
+    assert_result_count(res, 1, status='notneeded', path=subs[0].path)
+
+
+def _add_paths(ds_path, paths):
+    # module-level, to be run in worker processes
+    from datalad_hirni.support.path_queue import PathQueue
+    queue = PathQueue(Dataset(ds_path), 'test')
+    for p in paths:
+        queue.add([p])
+
+
+@with_tempfile
+def test_path_queue_concurrency(path):
+
+    from concurrent.futures import ProcessPoolExecutor
+    from datalad_hirni.support.path_queue import PathQueue
+
+    ds = Dataset(path).create()
+    queue = PathQueue(ds, 'test')
+    first = [op.join(ds.path, 'first{}'.format(i)) for i in range(50)]
+    queue.add(first)
+    added = [op.join(ds.path, 'added{}'.format(i)) for i in range(200)]
+    # paths added while others are removed don't get lost
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        futures = [pool.submit(_add_paths, ds.path, added[i::2])
+                   for i in range(2)]
+        for p in first:
+            queue.remove([p])
+        for f in futures:
+            f.result()
+    assert_equal(sorted(queue.pending()), sorted(added))
+    queue.remove(added)
+    assert_equal(queue.pending(), [])
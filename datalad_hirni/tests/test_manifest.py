@@ -0,0 +1,90 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test manifests of converted BIDS files"""
+
+import json
+import os
+import os.path as op
+
+from datalad.tests.utils import (
+    assert_equal,
+    with_tempfile,
+)
+
+from datalad_hirni.support.manifest import (
+    find_manifests,
+    get_hash_algorithm,
+    hash_file,
+    select_files,
+    verify_manifest,
+    write_manifest,
+)
+
+
+def _write(path, content):
+    if not op.exists(op.dirname(path)):
+        os.makedirs(op.dirname(path))
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+@with_tempfile(mkdir=True)
+def test_manifest(path):
+    _write(op.join(path, 'sub-01', 'ses-1', 'func', 'bold.nii.gz'), 'bold')
+    _write(op.join(path, 'sub-01', 'ses-1', 'func', 'events.tsv'), 'events')
+    _write(op.join(path, 'sub-01', 'ses-2', 'anat', 'T1w.nii.gz'), 'T1w')
+    _write(op.join(path, 'sub-01', 'ses-1', '.hidden'), 'nothing')
+    _write(op.join(path, 'sub-01', 'ses-1', 'func', 'other_bold.nii.gz'),
+           'other acquisition')
+    _write(op.join(path, 'sub-01', 'ses-1', 'sub-01_ses-1_scans.tsv'),
+           'scans')
+    _write(op.join(path, 'participants.tsv'), 'participants')
+
+    events = op.join('sub-01', 'ses-1', 'func', 'events.tsv')
+    bold = op.join('sub-01', 'ses-1', 'func', 'bold.nii.gz')
+    # only what the acquisition's procedures wrote within its directories,
+    # except the tables shared with other acquisitions
+    written = [bold, events, op.join('sub-01', 'ses-2', 'anat', 'T1w.nii.gz'),
+               op.join('sub-01', 'ses-1', 'sub-01_ses-1_scans.tsv'),
+               op.join('sub-01', 'ses-1', '.hidden'), 'participants.tsv']
+    assert_equal(select_files(written, [op.join('sub-01', 'ses-1')]),
+                 [bold, events])
+
+    manifest = write_manifest(path, op.join('acq1', 'studyspec.json'),
+                              [bold, events], jobs=2)
+    assert_equal(manifest, op.join(path, '.hirni', 'manifests', 'acq1',
+                                   'studyspec.json'))
+    assert_equal(find_manifests(path), [manifest])
+    with open(manifest) as f:
+        recorded = json.load(f)
+    algorithm = get_hash_algorithm()
+    assert_equal(recorded['algorithm'], algorithm)
+    assert_equal(recorded['spec'], op.join('acq1', 'studyspec.json'))
+    assert_equal(sorted(recorded['files']), [bold, events])
+    assert_equal(recorded['files'][events],
+                 dict(size=6, hash=hash_file(op.join(path, events),
+                                             algorithm)))
+
+    assert_equal(verify_manifest(path, manifest, jobs=2),
+                 {bold: 'ok', events: 'ok'})
+
+    # same size, different content
+    _write(op.join(path, events), 'EVENTS')
+    os.remove(op.join(path, bold))
+    assert_equal(verify_manifest(path, manifest),
+                 {bold: 'missing', events: 'modified'})
+    # different size
+    _write(op.join(path, events), 'more events')
+    assert_equal(verify_manifest(path, manifest)[events], 'modified')
+
+    # recording anew; events.tsv wasn't written again, but is kept, while
+    # the removed image is dropped
+    write_manifest(path, op.join('acq1', 'studyspec.json'), [])
+    assert_equal(verify_manifest(path, manifest), {events: 'ok'})
@@ -0,0 +1,56 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test the DICOM series metadata cache"""
+
+import os
+import os.path as op
+
+from datalad.tests.utils import (
+    assert_equal,
+    assert_false,
+    assert_greater,
+    assert_is,
+    with_tempfile,
+)
+
+from datalad_hirni.support.metadata_cache import SeriesCache
+
+
+@with_tempfile(mkdir=True)
+def test_series_cache(path):
+
+    series = [{'SeriesNumber': i, 'SeriesDescription': 'x' * 1000}
+              for i in range(50)]
+    cache = SeriesCache(path, max_size=1024 * 1024)
+    assert_is(cache.get('dsid', 'abc'), None)
+    cache.put('dsid', 'abc', series)
+    assert_equal(cache.get('dsid', 'abc'), series)
+    # keyed by refcommit
+    assert_is(cache.get('dsid', 'def'), None)
+    # stored compressed
+    assert_equal(len(os.listdir(path)), 1)
+    entry_size = op.getsize(op.join(path, os.listdir(path)[0]))
+    assert_greater(10000, entry_size)
+
+    # disabled
+    disabled = SeriesCache(path, max_size=0)
+    assert_is(disabled.get('dsid', 'abc'), None)
+
+    # least recently used entries are evicted
+    small = SeriesCache(path, max_size=2 * entry_size)
+    small.put('dsid', 'def', series)
+    # make the first entry the oldest one, then use it
+    os.utime(op.join(path, 'dsid-def.json.gz'), (0, 0))
+    os.utime(op.join(path, 'dsid-abc.json.gz'), (1, 1))
+    assert_equal(small.get('dsid', 'abc'), series)
+    small.put('dsid', 'ghi', series)
+    assert_equal(sorted(os.listdir(path)),
+                 ['dsid-abc.json.gz', 'dsid-ghi.json.gz'])
+    assert_false(op.exists(op.join(path, 'dsid-def.json.gz')))
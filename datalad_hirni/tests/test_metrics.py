@@ -0,0 +1,59 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test export of metrics"""
+
+import json
+import os.path as op
+
+from datalad.tests.utils import (
+    assert_equal,
+    assert_in,
+    with_tempfile,
+)
+
+from datalad_hirni.support.metrics import (
+    _read_textfile,
+    record_metrics,
+)
+from datalad_hirni.support.tracing import Tracer
+
+
+@with_tempfile(mkdir=True)
+def test_record_metrics(path):
+
+    textfile = op.join(path, 'hirni.prom')
+    log = op.join(path, 'metrics', 'hirni.jsonl')
+
+    for i in range(2):
+        tracer = Tracer('dicom2spec')
+        with tracer.span('dicom2spec.rules'):
+            pass
+        tracer.counters['dicom2spec.series'] = 5
+        record_metrics((textfile, log), tracer, 1.5, failures=i)
+
+    # counters accumulate across calls
+    samples = _read_textfile(textfile)
+    assert_equal(samples[('hirni_command_runs_total', 'dicom2spec')], 2)
+    assert_equal(samples[('hirni_command_seconds_total', 'dicom2spec')], 3.)
+    assert_equal(samples[('hirni_command_failures_total', 'dicom2spec')], 1)
+    assert_equal(samples[('hirni_stage_runs_total', 'dicom2spec.rules')], 2)
+    assert_equal(samples[('hirni_events_total', 'dicom2spec.series')], 10)
+    with open(textfile) as f:
+        content = f.read()
+    assert_in('# TYPE hirni_events_total counter\n', content)
+    assert_in('hirni_events_total{event="dicom2spec.series"} 10.0\n', content)
+
+    with open(log) as f:
+        records = [json.loads(line) for line in f]
+    assert_equal(len(records), 2)
+    assert_equal(records[1]['command'], 'dicom2spec')
+    assert_equal(records[1]['failures'], 1)
+    assert_equal(records[1]['events'], {'dicom2spec.series': 5})
+    assert_in('dicom2spec.rules', records[1]['stages'])
@@ -6,5 +6,13 @@ def test_register():
     assert hasattr(da, 'hirni_spec4anything')
     assert hasattr(da, 'hirni_dicom2spec')
     assert hasattr(da, 'hirni_import_dcm')
+    assert hasattr(da, 'hirni_batch_import_dcm')
     assert hasattr(da, 'hirni_spec2bids')
-
+    assert hasattr(da, 'hirni_maintenance')
+    assert hasattr(da, 'hirni_catalog')
+    assert hasattr(da, 'hirni_validate')
+    assert hasattr(da, 'hirni_bulk_edit')
+    assert hasattr(da, 'hirni_export_specs')
+    assert hasattr(da, 'hirni_daemon')
+    assert hasattr(da, 'hirni_watch')
+    assert hasattr(da, 'hirni_aggregate')
@@ -0,0 +1,197 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test reuse of converted files under another subject label"""
+
+import gzip
+import json
+import os
+import os.path as op
+import struct
+
+from datalad.tests.utils import (
+    assert_equal,
+    assert_false,
+    assert_not_in,
+    assert_raises,
+    assert_true,
+    with_tempfile,
+)
+
+from datalad_hirni.support.relabel import (
+    get_label_pattern,
+    relabel_files,
+)
+
+
+def _write(path, content):
+    if not op.exists(op.dirname(path)):
+        os.makedirs(op.dirname(path))
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_label_pattern():
+    pattern = get_label_pattern('02')
+    assert_equal(pattern.sub('sub-001', 'sub-02/func/sub-02_task-a_bold.json'),
+                 'sub-001/func/sub-001_task-a_bold.json')
+    # other subjects are left alone
+    assert_equal(pattern.sub('sub-001', 'sub-021/sub-021_T1w.nii.gz'),
+                 'sub-021/sub-021_T1w.nii.gz')
+    assert_equal(pattern.sub('sub-001', 'xsub-02'), 'xsub-02')
+
+
+def _nifti(descrip=b'', extension=b'\0\0\0\0'):
+    header = bytearray(348)
+    struct.pack_into('<i', header, 0, 348)
+    struct.pack_into('<f', header, 108, 352.)
+    header[148:148 + len(descrip)] = descrip
+    header[344:348] = b'n+1\0'
+    return bytes(header) + extension + b'data'
+
+
+def _write_image(path, content):
+    if not op.exists(op.dirname(path)):
+        os.makedirs(op.dirname(path))
+    # gzip records the file name
+    with open(path, 'wb') as f, \
+            gzip.GzipFile(filename=op.basename(path), mode='wb',
+                          fileobj=f) as gz:
+        gz.write(content)
+
+
+def _read_files(path):
+    # path and content of all files below `path` outside .git; decompressed
+    # as well
+    found = []
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [d for d in dirs if d != '.git']
+        for f in files:
+            with open(op.join(root, f), 'rb') as fp:
+                content = fp.read()
+            if f.endswith('.gz'):
+                content += gzip.decompress(content)
+            found.append((op.relpath(op.join(root, f), path), content))
+    return found
+
+
+@with_tempfile(mkdir=True)
+@with_tempfile(mkdir=True)
+def test_relabel_files(src, dst):
+    bold = op.join(src, 'sub-origlabel', 'ses-1', 'func',
+                   'sub-origlabel_ses-1_task-a_bold')
+    _write_image(bold + '.nii.gz', _nifti(b'TE=30'))
+    _write(bold + '.json',
+           json.dumps({'TaskName': 'a',
+                       'PatientName': 'Doezilla^Jane',
+                       'PatientID': 'OrigLabel',
+                       'global': {'const': {
+                           'PatientBirthDate': '19700101',
+                           'OperatorsName': 'Roemeister^Rick'}}}))
+    _write(op.join(src, 'sub-origlabel', 'ses-1',
+                   'sub-origlabel_ses-1_scans.tsv'),
+           'filename\nfunc/sub-origlabel_ses-1_task-a_bold.nii.gz\n')
+    _write_image(op.join(src, 'sub-origlabel', 'ses-2', 'anat',
+                         'sub-origlabel_ses-2_T1w.nii.gz'), _nifti())
+    _write(op.join(src, 'sub-origlabel', 'ses-1', '.hidden'), 'origlabel')
+    _write(op.join(src, 'sub-origlabel2', 'ses-1', 'anat',
+                   'sub-origlabel2_ses-1_T1w.json'), 'origlabel2')
+    _write(op.join(src, '.heudiconv', 'origlabel', 'info', 'dicominfo.tsv'),
+           'origlabel')
+    # an existing file to be replaced
+    _write(op.join(dst, 'sub-001', 'ses-1', 'sub-001_ses-1_scans.tsv'), 'old')
+
+    copied = relabel_files(src, dst, 'origlabel', '001', session='1')
+    new_bold = op.join('sub-001', 'ses-1', 'func', 'sub-001_ses-1_task-a_bold')
+    assert_equal(sorted(op.relpath(p, dst) for p in copied),
+                 [new_bold + '.json', new_bold + '.nii.gz',
+                  op.join('sub-001', 'ses-1', 'sub-001_ses-1_scans.tsv')])
+    with gzip.open(op.join(dst, new_bold + '.nii.gz')) as f:
+        assert_equal(f.read(), _nifti(b'TE=30'))
+    assert_equal(json.loads(_read(op.join(dst, new_bold + '.json'))),
+                 {'TaskName': 'a', 'global': {'const': {}}})
+    assert_equal(_read(op.join(dst, 'sub-001', 'ses-1',
+                               'sub-001_ses-1_scans.tsv')),
+                 'filename\nfunc/sub-001_ses-1_task-a_bold.nii.gz\n')
+    assert_false(op.exists(op.join(dst, 'sub-001', 'ses-2')))
+
+    # entire subject
+    copied = relabel_files(src, dst, 'origlabel', '001')
+    assert_equal(len(copied), 4)
+    assert_true(op.exists(op.join(dst, 'sub-001', 'ses-2', 'anat',
+                                  'sub-001_ses-2_T1w.nii.gz')))
+
+    # the original label and the names appear nowhere
+    for path, content in _read_files(dst):
+        assert_not_in('origlabel', path.lower())
+        for s in (b'origlabel', b'doezilla', b'roemeister', b'19700101'):
+            assert_not_in(s, content.lower())
+    # nothing left behind
+    assert_equal(os.listdir(op.join(dst, '.git', 'datalad')), [])
+
+
+@with_tempfile(mkdir=True)
+@with_tempfile(mkdir=True)
+def test_relabel_numeric(src, dst):
+    # a numeric label can't be told apart from numbers and times
+    anat = op.join(src, 'sub-02', 'anat')
+    _write(op.join(src, 'sub-02', 'sub-02_scans.tsv'),
+           'filename\tacq_time\n'
+           'anat/sub-02_T1w.nii.gz\t2019-02-14T10:02:15\n')
+    _write(op.join(anat, 'sub-02_T1w.json'),
+           json.dumps({'AcquisitionTime': '10:02:15.020000',
+                       'EchoTime': 0.0202,
+                       'PatientID': 'sub-02'}))
+    _write_image(op.join(anat, 'sub-02_T1w.nii.gz'), _nifti(b'TE=2.02'))
+
+    copied = relabel_files(src, dst, '02', 'abc')
+    assert_equal(len(copied), 3)
+    assert_equal(_read(op.join(dst, 'sub-abc', 'sub-abc_scans.tsv')),
+                 'filename\tacq_time\n'
+                 'anat/sub-abc_T1w.nii.gz\t2019-02-14T10:02:15\n')
+    assert_equal(json.loads(_read(op.join(dst, 'sub-abc', 'anat',
+                                          'sub-abc_T1w.json'))),
+                 {'AcquisitionTime': '10:02:15.020000', 'EchoTime': 0.0202})
+    for path, content in _read_files(dst):
+        assert_not_in('sub-02', path)
+        assert_not_in(b'sub-02', content)
+
+
+@with_tempfile(mkdir=True)
+@with_tempfile(mkdir=True)
+def test_relabel_refused(src, dst):
+    _write(op.join(dst, 'sub-001', 'sub-001_scans.tsv'), 'old')
+    # a file, which can be copied, along with each that can't
+    for i, (name, content) in enumerate((
+            ('sub-origlabel_T1w.json', '{"ProtocolName": "ORIGLABEL_t1"}'),
+            ('sub-origlabel_T1w.tsv', 'origlabel'),
+            ('sub-origlabel_T1w.nii.gz', _nifti(b'origlabel')),
+            ('sub-origlabel_T1w.nii.gz', _nifti(extension=b'\1\0\0\0')),
+            ('sub-origlabel_T1w.nii.gz', b'no image'),
+            ('origlabel_T1w.json', '{}'),
+            ('sub-origlabel_T1w.dcm', 'DICOM'))):
+        session = op.join(src, 'sub-origlabel', 'ses-{}'.format(i))
+        _write_image(op.join(session, 'sub-origlabel_bold.nii.gz'), _nifti())
+        path = op.join(session, 'anat', name)
+        if isinstance(content, bytes):
+            _write_image(path, content)
+        else:
+            _write(path, content)
+        with assert_raises(ValueError) as cm:
+            relabel_files(src, dst, 'origlabel', '001', session=str(i))
+        assert_not_in('origlabel', str(cm.exception).lower())
+        assert_equal(sorted(os.listdir(dst)), ['.git', 'sub-001'])
+        assert_equal(os.listdir(op.join(dst, 'sub-001')),
+                     ['sub-001_scans.tsv'])
+        assert_equal(os.listdir(op.join(dst, '.git', 'datalad')), [])
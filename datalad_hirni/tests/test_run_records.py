@@ -0,0 +1,90 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test run records of commits saving several procedure runs"""
+
+import json
+import os
+import os.path as op
+
+from datalad.api import Dataset
+from datalad.tests.utils import (
+    assert_equal,
+    assert_in,
+    assert_not_in,
+    assert_result_count,
+    ok_clean_git,
+    with_tempfile,
+)
+
+from datalad_hirni.support.run_records import (
+    format_run_record,
+    parse_commit_message,
+)
+
+
+def _get_message(ds, rev='HEAD'):
+    out, _ = ds.repo._git_custom_command(
+        [], ['git', 'log', '-1', '--format=%B', rev])
+    return out
+
+
+@with_tempfile
+def test_parse_commit_message(path):
+
+    ds = Dataset(path).create()
+    ds.run("echo one > one.txt", message="first")
+    first = _get_message(ds)
+    ds.run("echo two > two.txt", message="second", sidecar=True)
+    second = _get_message(ds)
+    with open(op.join(ds.path, 'three.txt'), 'w') as f:
+        f.write('three')
+    ds.save('three.txt', message="plain save")
+    third = _get_message(ds)
+
+    record = parse_commit_message(first)
+    assert_equal(record['message'], 'first')
+    assert_equal(record['run']['cmd'], "echo one > one.txt")
+    # sidecar records are referenced by ID only
+    record = parse_commit_message(second)
+    assert_equal(record['message'], 'second')
+    assert_in(record['run'],
+              os.listdir(op.join(ds.path, '.datalad', 'runinfo')))
+    record = parse_commit_message(third)
+    assert_equal(record, {'message': 'plain save'})
+    assert_not_in('run', parse_commit_message(''))
+
+
+@with_tempfile
+def test_format_run_record(path):
+
+    ds = Dataset(path).create()
+    cmd = "echo '{x}' > out.txt"
+    with open(op.join(ds.path, 'out.txt'), 'w') as f:
+        f.write('{x}\n')
+    ds.save('out.txt', to_git=True,
+            message=format_run_record(ds, cmd, "[HIRNI] all in one",
+                                      hirni_procedures=[{'message': 'a'}]))
+    record = parse_commit_message(_get_message(ds))
+    assert_equal(record['message'], "[HIRNI] all in one")
+    assert_equal(record['run']['exit'], 0)
+    assert_equal(record['run']['hirni_procedures'], [{'message': 'a'}])
+
+    # it's a run record datalad can re-execute
+    with open(op.join(ds.path, 'out.txt'), 'w') as f:
+        f.write('changed\n')
+    ds.save('out.txt', to_git=True, message="change it")
+    res = ds.rerun('HEAD~1', return_type='list', on_failure='ignore')
+    assert_result_count(res, 0, status='error')
+    ok_clean_git(ds.path)
+    with open(op.join(ds.path, 'out.txt')) as f:
+        assert_equal(f.read(), '{x}\n')
+    assert_equal(json.loads(_get_message(ds).split(
+        '=== Do not change lines below ===\n')[1].split('\n^^^')[0])['cmd'],
+        record['run']['cmd'])
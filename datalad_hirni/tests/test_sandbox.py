@@ -0,0 +1,319 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test isolated runs of conversion procedures"""
+
+import ast
+import json
+import os
+import os.path as op
+from unittest.mock import patch
+
+from datalad.api import Dataset
+from datalad.support.json_py import dump2stream
+from datalad.tests.utils import (
+    assert_equal,
+    assert_false,
+    assert_in,
+    assert_raises,
+    assert_result_count,
+    assert_true,
+    ok_clean_git,
+    with_tempfile,
+)
+
+from datalad_hirni.support.sandbox import (
+    create_sandbox,
+    merge_files,
+    merge_sandbox,
+)
+
+
+# stand-in for hirni-dicom-converter, writing what heudiconv writes when
+# converting the series listed in HIRNI_SERIES_UIDS
+_converter = r'''
+import ast
+import gzip
+import json
+import os
+import os.path as op
+import sys
+
+from datalad.distribution.dataset import Dataset
+
+ds = Dataset(sys.argv[1])
+sub = os.environ['DATALAD_RUN_SUBSTITUTIONS_BIDS__SUBJECT']
+uids = os.environ.get('HIRNI_SERIES_UIDS', '0.' + sub).split()
+
+
+def read(path, default):
+    path = op.join(ds.path, path)
+    if not op.exists(path):
+        return default
+    with open(path, 'rb') as f:
+        return f.read().decode('utf-8')
+
+
+def write(path, content):
+    path = op.join(ds.path, path)
+    if not op.exists(op.dirname(path)):
+        os.makedirs(op.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(content if isinstance(content, bytes)
+                else content.encode('utf-8'))
+
+
+info = op.join('.heudiconv', sub, 'info')
+scans = op.join('sub-' + sub, 'sub-{}_scans.tsv'.format(sub))
+scans_content = read(scans, 'filename\tacq_time\n')
+auto = ast.literal_eval(read(op.join(info, sub + '.auto.txt'), '{}'))
+filegroup = json.loads(read(op.join(info, 'filegroup.json'), '{}'))
+for uid in uids:
+    name = 'anat/sub-{}_acq-{}_T1w'.format(sub, uid.replace('.', ''))
+    write(op.join('sub-' + sub, name + '.nii.gz'), gzip.compress(uid.encode()))
+    write(op.join('sub-' + sub, name + '.json'),
+          json.dumps({'SeriesInstanceUID': uid}))
+    scans_content += '{}.nii.gz\tn/a\n'.format(name)
+    auto[(op.join('sub-' + sub, name), ('nii.gz',), None)] = [uid]
+    filegroup[uid] = [name + '.nii.gz']
+write(scans, scans_content)
+write(op.join(info, sub + '.auto.txt'), repr(auto))
+write(op.join(info, 'filegroup.json'), json.dumps(filegroup))
+write('participants.tsv', 'participant_id\tage\nsub-{}\tn/a\n'.format(sub))
+ds.save(message='convert ' + ' '.join(uids))
+'''
+
+
+def test_merge_files():
+    scans = 'sub-01_scans.tsv'
+    assert_equal(
+        merge_files(scans, b'filename\tacq_time\na.nii.gz\tn/a\n',
+                    b'filename\tacq_time\nb.nii.gz\tn/a\na.nii.gz\tn/a\n'),
+        b'filename\tacq_time\na.nii.gz\tn/a\nb.nii.gz\tn/a\n')
+    # BIDS tables are keyed by their first column
+    assert_raises(ValueError, merge_files, scans,
+                  b'filename\tacq_time\na.nii.gz\tn/a\n',
+                  b'filename\tacq_time\na.nii.gz\t10:00\n')
+    assert_raises(ValueError, merge_files, scans,
+                  b'filename\na.nii.gz\n', b'filename\tacq_time\n')
+    # other tables by entire rows
+    assert_equal(
+        merge_files('dicominfo.tsv', b'a\tb\n1\t2\n', b'a\tb\n1\t3\n'),
+        b'a\tb\n1\t2\n1\t3\n')
+
+    assert_equal(json.loads(merge_files('filegroup.json', b'{"1": ["a"]}',
+                                        b'{"2": ["b"], "1": ["a"]}')
+                            .decode('utf-8')),
+                 {'1': ['a'], '2': ['b']})
+    assert_raises(ValueError, merge_files, 'filegroup.json',
+                  b'{"1": ["a"]}', b'{"1": ["b"]}')
+    assert_raises(ValueError, merge_files, 'x.json', b'[1]', b'[2]')
+
+    assert_equal(
+        ast.literal_eval(merge_files(
+            '01.auto.txt',
+            repr({('a', ('nii.gz',), None): ['1']}).encode('utf-8'),
+            repr({('a', ('nii.gz',), None): ['2'],
+                  ('b', ('nii.gz',), None): ['3']}).encode('utf-8')
+        ).decode('utf-8')),
+        {('a', ('nii.gz',), None): ['1', '2'],
+         ('b', ('nii.gz',), None): ['3']})
+    assert_raises(ValueError, merge_files, 'notes.txt', b'some', b'thing')
+    assert_raises(ValueError, merge_files, 'image.nii.gz', b'1', b'2')
+
+
+@with_tempfile
+@with_tempfile
+def test_subdataset_changes(path, sandbox_path):
+    ds = Dataset(path).create()
+    ds.create('code')
+    base = ds.repo.get_hexsha()
+    sandbox = create_sandbox(ds.path, sandbox_path)
+    with open(op.join(sandbox.path, 'code', 'committed'), 'w') as f:
+        f.write('committed')
+    sandbox.save(recursive=True, message="change subdataset")
+    with open(op.join(sandbox.path, 'code', 'uncommitted'), 'w') as f:
+        f.write('uncommitted')
+
+    res = list(merge_sandbox(ds, sandbox.path, base))
+    # neither change is lost silently
+    assert_result_count(res, 2, action='hirni merge', status='error',
+                        path=op.join(ds.path, 'code'))
+    assert_false(op.exists(op.join(ds.path, 'code', 'committed')))
+    assert_false(op.exists(sandbox.path))
+
+
+@with_tempfile
+@with_tempfile
+def test_unsaved_changes(path, sandbox_path):
+    ds = Dataset(path).create()
+    base = ds.repo.get_hexsha()
+    with open(op.join(ds.path, 'participants.tsv'), 'w') as f:
+        f.write('participant_id\nsub-01\n')
+    sandbox = create_sandbox(ds.path, sandbox_path, unsaved=True)
+    # the procedure starts from the unsaved changes ...
+    ok_clean_git(sandbox.path)
+    assert_equal(_read(op.join(sandbox.path, 'participants.tsv')),
+                 'participant_id\nsub-01\n')
+    start = sandbox.repo.get_hexsha()
+    with open(op.join(sandbox.path, 'participants.tsv'), 'w') as f:
+        f.write('participant_id\nsub-01\nsub-02\n')
+    sandbox.save(message="add sub-02")
+
+    # ... which aren't replayed, and neither is saved
+    res = list(merge_sandbox(ds, sandbox.path, start, save=False))
+    assert_result_count(res, 1)
+    assert_result_count(res, 1, action='hirni merge', status='ok',
+                        files=['participants.tsv'],
+                        commit_message='add sub-02')
+    assert_equal(ds.repo.get_hexsha(), base)
+    assert_equal(_read(op.join(ds.path, 'participants.tsv')),
+                 'participant_id\nsub-01\nsub-02\n')
+
+
+def _make_bids_ds(path):
+    ds = Dataset(path).create(cfg_proc=['text2git'])
+    with open(op.join(ds.path, '.datalad', 'procedures',
+                      'fake-heudiconv.py'), 'w') as f:
+        f.write(_converter)
+    ds.save(op.join('.datalad', 'procedures', 'fake-heudiconv.py'),
+            message="add converter")
+    return ds
+
+
+def _add_spec(ds, acquisition, subject):
+    spec = op.join(ds.path, acquisition, 'studyspec.json')
+    dump2stream([{'type': 'dicomseries:all',
+                  'location': 'dicoms',
+                  'subject': {'value': subject, 'approved': True},
+                  'procedures': [{'procedure-name': {
+                      'value': 'fake-heudiconv', 'approved': True}}]}],
+                spec)
+    ds.save(spec, to_git=True, message="add spec")
+    return spec
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+@with_tempfile
+def test_series_groups(path):
+    ds = _make_bids_ds(path)
+    spec = _add_spec(ds, 'acq1', '01')
+
+    with patch('datalad_hirni.commands.spec2bids.get_series_groups',
+               return_value=[['1.1', '1.3'], ['1.2']]):
+        res = ds.hirni_spec2bids(spec, series_groups=2, on_failure='ignore',
+                                 return_type='list')
+    assert_result_count(res, 0, status='error')
+    assert_result_count(res, 1, action='fake-heudiconv', status='ok',
+                        message="acquisition converted.")
+    ok_clean_git(ds.path)
+
+    # both groups' commits were replayed
+    log, _ = ds.repo._git_custom_command([], ['git', 'log', '--format=%s'])
+    assert_in('convert 1.1 1.3', log.splitlines())
+    assert_in('convert 1.2', log.splitlines())
+
+    anat = op.join(ds.path, 'sub-01', 'anat')
+    for uid in ('11', '12', '13'):
+        assert_equal(
+            json.loads(_read(op.join(anat, 'sub-01_acq-{}_T1w.json'
+                                     ''.format(uid))))['SeriesInstanceUID'],
+            '.'.join(uid))
+        # annexed images were added to the dataset's annex by the groups
+        assert_true(op.exists(op.join(anat, 'sub-01_acq-{}_T1w.nii.gz'
+                                            ''.format(uid))))
+    # files written by both groups are merged
+    assert_equal(
+        sorted(_read(op.join(ds.path, 'sub-01',
+                             'sub-01_scans.tsv')).splitlines()),
+        ['anat/sub-01_acq-{}_T1w.nii.gz\tn/a'.format(uid)
+         for uid in ('11', '12', '13')] + ['filename\tacq_time'])
+    assert_equal(_read(op.join(ds.path, 'participants.tsv')),
+                 'participant_id\tage\nsub-01\tn/a\n')
+    info = op.join(ds.path, '.heudiconv', '01', 'info')
+    assert_equal(sorted(json.loads(_read(op.join(info, 'filegroup.json')))),
+                 ['1.1', '1.2', '1.3'])
+    assert_equal(len(ast.literal_eval(_read(op.join(info, '01.auto.txt')))),
+                 3)
+    # no sandbox left behind
+    assert_equal(os.listdir(op.join(ds.path, '.git', 'datalad',
+                                    'hirni_sandboxes')), [])
+
+
+@with_tempfile
+def test_jobs(path):
+    ds = _make_bids_ds(path)
+    specs = [_add_spec(ds, 'acq1', '01'), _add_spec(ds, 'acq2', '02')]
+
+    res = ds.hirni_spec2bids(specs, jobs=2, manifest=True,
+                             on_failure='ignore', return_type='list')
+    assert_result_count(res, 0, status='error')
+    assert_result_count(res, 2, action='fake-heudiconv', status='ok',
+                        message="acquisition converted.")
+    ok_clean_git(ds.path)
+    # both subjects were converted concurrently into participants.tsv
+    assert_equal(
+        sorted(_read(op.join(ds.path, 'participants.tsv')).splitlines()),
+        ['participant_id\tage', 'sub-01\tn/a', 'sub-02\tn/a'])
+    for sub in ('01', '02'):
+        assert_true(op.exists(op.join(ds.path, 'sub-' + sub,
+                                      'sub-{}_scans.tsv'.format(sub))))
+    # a manifest lists what the acquisition's procedure wrote only
+    for acq, sub in (('acq1', '01'), ('acq2', '02')):
+        with open(op.join(ds.path, '.hirni', 'manifests', acq,
+                          'studyspec.json')) as f:
+            files = json.load(f)['files']
+        assert_equal(sorted(files),
+                     [op.join('sub-' + sub, 'anat',
+                              'sub-{}_acq-0{}_T1w.{}'.format(sub, sub, ext))
+                      for ext in ('json', 'nii.gz')])
+
+
+@with_tempfile
+def test_squash(path):
+    ds = _make_bids_ds(path)
+    specs = [_add_spec(ds, 'acq1', '01'), _add_spec(ds, 'acq2', '02')]
+    base = ds.repo.get_hexsha()
+
+    res = ds.hirni_spec2bids(specs, squash=True, manifest=True,
+                             on_failure='ignore', return_type='list')
+    assert_result_count(res, 0, status='error')
+    assert_result_count(res, 2, action='fake-heudiconv', status='ok',
+                        message="acquisition converted.")
+    ok_clean_git(ds.path)
+    # a single commit with the converted files and the manifests
+    assert_equal(ds.repo.get_hexsha('HEAD~1'), base)
+    out, _ = ds.repo._git_custom_command(
+        [], ['git', 'diff', '--name-only', base, 'HEAD'])
+    for f in ('participants.tsv',
+              op.join('sub-01', 'anat', 'sub-01_acq-01_T1w.nii.gz'),
+              op.join('sub-02', 'anat', 'sub-02_acq-02_T1w.nii.gz'),
+              op.join('.hirni', 'manifests', 'acq2', 'studyspec.json')):
+        assert_in(f, out.splitlines())
+    assert_equal(
+        sorted(_read(op.join(ds.path, 'participants.tsv')).splitlines()),
+        ['participant_id\tage', 'sub-01\tn/a', 'sub-02\tn/a'])
+
+    # it's a run record of the conversion, keeping those of the procedures
+    out, _ = ds.repo._git_custom_command(
+        [], ['git', 'log', '-1', '--format=%B'])
+    assert_true(out.startswith(
+        "[DATALAD RUNCMD] [HIRNI] Convert 2 specification(s)\n"))
+    record = json.loads(out.split(
+        '=== Do not change lines below ===\n')[1].split('\n^^^')[0])
+    assert_equal(record['cmd'],
+                 'datalad hirni-spec2bids --squash --manifest '
+                 'acq1/studyspec.json acq2/studyspec.json')
+    assert_equal(record['exit'], 0)
+    assert_equal(sorted(r['message'] for r in record['hirni_procedures']),
+                 ['convert 0.01', 'convert 0.02'])
@@ -0,0 +1,166 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test scheduling of conversion procedures"""
+
+from datalad.tests.utils import (
+    assert_equal,
+    assert_false,
+    assert_in,
+    assert_is,
+    assert_true,
+)
+
+from datalad_hirni.support.scheduler import (
+    add_dependencies,
+    default_type_order,
+    get_type_rank,
+    ProcedureTask,
+    run_tasks,
+)
+
+
+def _proc(name, inputs=None, outputs=None):
+    proc = {'procedure-name': {'value': name, 'approved': False}}
+    if inputs is not None:
+        proc['inputs'] = {'value': inputs, 'approved': False}
+    if outputs is not None:
+        proc['outputs'] = {'value': outputs, 'approved': False}
+    return proc
+
+
+def _task(spec, snippet, proc, subject='01'):
+    return ProcedureTask(
+        spec, snippet, proc, proc['procedure-name']['value'],
+        dict(PROC=proc['procedure-name']['value']),
+        {'bids-subject': subject, 'location': 'acq1/events.tsv'},
+        get_type_rank(snippet['type'], default_type_order))
+
+
+def _worker(ds_path, proc_name, env):
+    # module-level, to be usable in worker processes
+    return [dict(action=proc_name, path=ds_path,
+                 status='error' if proc_name.startswith('fail') else 'ok',
+                 uids=env.get('HIRNI_SERIES_UIDS'))]
+
+
+def test_type_rank():
+    assert_equal(get_type_rank('dicomseries:all', default_type_order), 0)
+    assert_equal(get_type_rank('dicomseries', default_type_order), 1)
+    assert_equal(get_type_rank('generic_events', default_type_order), 2)
+    assert_equal(get_type_rank('generic_events', ['generic_*']), 0)
+
+
+def test_dependencies():
+    all_dicoms = {'type': 'dicomseries:all'}
+    events = {'type': 'generic_events'}
+    physio = {'type': 'generic_physio'}
+    other_events = {'type': 'generic_events'}
+
+    # undeclared: by type order within an acquisition, in order of a snippet
+    # and one after another within a subject directory
+    tasks = [_task('acq1/studyspec.json', all_dicoms, _proc('heudiconv')),
+             _task('acq1/studyspec.json', events, _proc('copy')),
+             _task('acq1/studyspec.json', events, _proc('fix')),
+             _task('acq1/studyspec.json', physio, _proc('physio')),
+             _task('acq2/studyspec.json', other_events, _proc('copy'),
+                   subject='02')]
+    add_dependencies(tasks)
+    assert_equal([t.deps for t in tasks],
+                 [set(), {0}, {0, 1}, {0, 1, 2}, set()])
+
+    # another acquisition of the same subject writes into the same subject
+    # directory
+    tasks.append(_task('acq3/studyspec.json', {'type': 'generic_events'},
+                       _proc('copy')))
+    tasks.append(_task('acq3/studyspec.json', {'type': 'generic_events'},
+                       _proc('copy', inputs='acq3/events.tsv',
+                             outputs='sub-01/func/events.tsv')))
+    tasks.append(_task('acq4/studyspec.json', {'type': 'generic_events'},
+                       _proc('copy', inputs='acq4/events.tsv',
+                             outputs='sub-02/func/events.tsv')))
+    # declaring different outputs than another declared one in the same
+    # subject directory doesn't make it wait for that one
+    tasks.append(_task('acq4/studyspec.json', {'type': 'generic_events'},
+                       _proc('copy', inputs='acq4/events.tsv',
+                             outputs='sub-01/func/other_events.tsv')))
+    add_dependencies(tasks)
+    assert_equal(tasks[5].trees, {'sub-01'})
+    assert_equal([t.deps for t in tasks[5:]],
+                 [{0, 1, 2, 3}, {0, 1, 2, 3, 5}, {4}, {0, 1, 2, 3, 5}])
+
+    # declared paths
+    tasks = [_task('acq1/studyspec.json', all_dicoms,
+                   _proc('heudiconv', inputs='acq1/dicoms',
+                         outputs='sub-{bids-subject}')),
+             _task('acq1/studyspec.json', events,
+                   _proc('copy', inputs='{location}',
+                         outputs='sub-{bids-subject}/func/events.tsv')),
+             _task('acq1/studyspec.json', physio,
+                   _proc('physio', inputs=['acq1/physio'],
+                         outputs=['derivatives/physio/*'])),
+             _task('acq2/studyspec.json', other_events,
+                   _proc('summary', inputs=['derivatives/physio'],
+                         outputs=[]))]
+    add_dependencies(tasks)
+    assert_equal(tasks[1].inputs, ['acq1/events.tsv'])
+    assert_equal(tasks[1].outputs, ['sub-01/func/events.tsv'])
+    # events are written into heudiconv's output; physio is independent of
+    # both, but read by the summary
+    assert_equal([t.deps for t in tasks],
+                 [set(), {0}, set(), {2}])
+
+    # converters next to heudiconv, if it declares what it writes
+    tasks = [_task('acq1/studyspec.json', all_dicoms,
+                   _proc('heudiconv', inputs='acq1/dicoms',
+                         outputs=['sub-{bids-subject}/anat',
+                                  'sub-{bids-subject}/*_scans.tsv'])),
+             _task('acq1/studyspec.json', events,
+                   _proc('copy', inputs='{location}',
+                         outputs='sub-{bids-subject}/func/events.tsv'))]
+    add_dependencies(tasks)
+    assert_equal([t.deps for t in tasks], [set(), set()])
+
+
+def test_run_tasks():
+    snippets = [{'type': 'dicomseries:all'}, {'type': 'generic_events'},
+                {'type': 'generic_physio'}]
+    tasks = [_task('acq1/studyspec.json', snippets[0],
+                   _proc('fail-convert', inputs='acq1/dicoms',
+                         outputs='sub-01')),
+             _task('acq1/studyspec.json', snippets[1],
+                   _proc('copy', inputs='a', outputs='b')),
+             _task('acq1/studyspec.json', snippets[1],
+                   _proc('fix', inputs='b', outputs='b')),
+             _task('acq1/studyspec.json', snippets[2], _proc('physio'))]
+    tasks[0].groups = [['1.2.3'], ['1.2.4', '1.2.5']]
+    add_dependencies(tasks)
+    # 'physio' waits for the failing conversion, 'copy' and 'fix' don't
+    assert_equal(tasks[3].deps, {0})
+    assert_false(tasks[1].deps)
+
+    ran = {t.proc_name: (results, i)
+           for i, (t, results) in enumerate(
+               run_tasks(tasks, 3, _worker, '/some/ds'))}
+    assert_equal(set(ran), {'fail-convert', 'copy', 'fix', 'physio'})
+    # one run per group
+    assert_equal(sorted(r['uids'] for r in ran['fail-convert'][0]),
+                 ['1.2.3', '1.2.4 1.2.5'])
+    assert_is(ran['physio'][0], None)
+    assert_true(ran['copy'][1] < ran['fix'][1])
+    assert_in('ok', [r['status'] for r in ran['fix'][0]])
+
+    # what a run returns is merged in this process
+    tasks = tasks[1:3]
+    add_dependencies(tasks)
+    merged = list(run_tasks(
+        tasks, 2, _worker, '/some/ds',
+        merge=lambda rs: rs + [dict(action='merge', status='ok')]))
+    assert_equal([[r['action'] for r in results] for t, results in merged],
+                 [['copy', 'merge'], ['fix', 'merge']])
@@ -0,0 +1,105 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test export of specification snippets into Parquet files"""
+
+import json
+import os
+import os.path as op
+
+from nose import SkipTest
+
+from datalad.support.json_py import dump2stream
+from datalad.tests.utils import (
+    assert_equal,
+    assert_false,
+    with_tempfile,
+)
+
+import datalad_hirni.support.spec_export as spec_export
+
+
+def _edit(value, approved=False):
+    return dict(value=value, approved=approved)
+
+
+@with_tempfile(mkdir=True)
+@with_tempfile(mkdir=True)
+def test_export_specs(path, target):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SkipTest("pyarrow not available")
+
+    acq1 = op.join(path, 'acq1', 'studyspec.json')
+    acq2 = op.join(path, 'acq2', 'studyspec.json')
+    dump2stream([
+        {'type': 'dicomseries:all', 'location': 'dicoms'},
+        {'type': 'dicomseries', 'uid': '1.1', 'location': 'dicoms',
+         'id': _edit(401, True),
+         'bids-task': _edit('rest'),
+         'tags': ['functional']},
+        {'type': 'dicomseries', 'uid': '1.2', 'location': 'dicoms',
+         'id': _edit(402),
+         'bids-modality': _edit('T1w', True)},
+    ], acq1)
+    dump2stream([
+        {'type': 'generic_events', 'location': 'events.tsv',
+         'comment': 'first run',
+         'procedures': [{'procedure-name': _edit('copy-converter')}]},
+    ], acq2)
+
+    res = list(spec_export.export_specs(path, [acq1, acq2], target))
+    assert_equal(res, [(acq1, 'added', 3), (acq2, 'added', 1)])
+
+    # the entire target is a single table; fields of either file are kept
+    rows = sorted(pq.read_table(target).to_pylist(),
+                  key=lambda r: (r['path'], r['line']))
+    assert_equal(len(rows), 4)
+    assert_equal(rows[1]['path'], op.join('acq1', 'studyspec.json'))
+    assert_equal(rows[1]['line'], 1)
+    assert_equal(rows[1]['uid'], '1.1')
+    assert_equal(dict(rows[1]['fields']),
+                 {'id': dict(value='401', approved=True),
+                  'bids-task': dict(value='rest', approved=False)})
+    assert_equal(rows[1]['tags'], ['functional'])
+    assert_equal(dict(rows[2]['fields'])['bids-modality'],
+                 dict(value='T1w', approved=True))
+    assert_equal(rows[0]['tags'], None)
+    assert_equal(rows[0]['fields'], [])
+    assert_equal(rows[3]['path'], op.join('acq2', 'studyspec.json'))
+    assert_equal(json.loads(rows[3]['procedures']),
+                 [{'procedure-name': _edit('copy-converter')}])
+    assert_equal(dict(rows[3]['fields']),
+                 {'comment': dict(value='first run', approved=None)})
+
+    # only changed files are exported again; small batches give the same
+    # result
+    spec_export.batch_size = 2
+    try:
+        dump2stream([
+            {'type': 'generic_events', 'location': 'events.tsv'},
+            {'type': 'generic_events', 'location': 'other.tsv'},
+            {'type': 'generic_events', 'location': 'more.tsv'},
+        ], acq2)
+        res = list(spec_export.export_specs(path, [acq1, acq2], target))
+    finally:
+        spec_export.batch_size = 10000
+    assert_equal(res, [(acq1, 'unchanged', None), (acq2, 'updated', 3)])
+    assert_equal(
+        pq.read_table(op.join(target, 'acq2', 'studyspec.parquet')).column(
+            'location').to_pylist(),
+        ['events.tsv', 'other.tsv', 'more.tsv'])
+
+    # vanished files are removed from the export
+    os.remove(acq1)
+    res = list(spec_export.export_specs(path, [acq2], target))
+    assert_equal(res, [(acq2, 'unchanged', None),
+                       (acq1, 'removed', None)])
+    assert_false(op.exists(op.join(target, 'acq1', 'studyspec.parquet')))
@@ -0,0 +1,98 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test helpers for specification files"""
+
+import os
+import os.path as op
+
+from datalad.support.json_py import load_stream
+from datalad.tests.utils import (
+    assert_equal,
+    assert_false,
+    assert_true,
+    with_tempfile,
+)
+
+from datalad_hirni.support.spec_helpers import (
+    load_stream_of_type,
+    write_spec,
+)
+
+
+snippets = [
+    {'type': 'generic_file',
+     'location': 'README',
+     'id': {'value': None, 'approved': False}},
+    {'type': 'dicomseries',
+     'uid': '1.2.3.10',
+     'id': {'value': 10, 'approved': False}},
+    {'type': 'dicomseries',
+     'uid': '1.2.3.9',
+     'id': {'value': 9, 'approved': False}},
+    {'type': 'dicomseries:all',
+     'location': 'dicoms'},
+]
+
+
+@with_tempfile(mkdir=True)
+def test_write_spec(path):
+
+    spec_path = op.join(path, 'studyspec.json')
+    assert_true(write_spec(snippets, spec_path))
+    # canonical order: by type, then numerically by id
+    assert_equal(list(load_stream(spec_path)),
+                 [snippets[3], snippets[2], snippets[1], snippets[0]])
+
+    # nothing changed: file isn't touched
+    mtime = os.stat(spec_path).st_mtime_ns
+    assert_false(write_spec(list(reversed(snippets)), spec_path))
+    assert_equal(os.stat(spec_path).st_mtime_ns, mtime)
+
+    # unchanged lines are kept as they are, even if formatted differently
+    with open(spec_path) as f:
+        lines = f.readlines()
+    lines[1] = lines[1].replace(',', ', ')
+    with open(spec_path, 'w') as f:
+        f.writelines(lines)
+    changed = dict(snippets[1], comment={'value': 'rerun', 'approved': True})
+    assert_true(write_spec([snippets[0], changed, snippets[2], snippets[3]],
+                           spec_path))
+    with open(spec_path) as f:
+        new_lines = f.readlines()
+    assert_equal(new_lines[1], lines[1])
+    assert_equal(new_lines[3], lines[3])
+    assert_equal(list(load_stream(spec_path)),
+                 [snippets[3], snippets[2], changed, snippets[0]])
+    # no leftovers from writing
+    assert_equal(os.listdir(path), ['studyspec.json'])
+
+
+@with_tempfile(mkdir=True)
+def test_load_stream_of_type(path):
+
+    spec_path = op.join(path, 'studyspec.json')
+    # a nested "type" doesn't confuse the filter
+    generic = {'type': 'generic_file',
+               'location': 'README',
+               'procedures': [{'type': 'dicomseries'}]}
+    write_spec(snippets + [generic], spec_path)
+    # lines not in compact format are found as well
+    with open(spec_path, 'a') as f:
+        f.write('{"type" : "dicomseries", "uid": "1.2.3.11"}\n')
+
+    assert_equal([s['uid'] for s in
+                  load_stream_of_type(spec_path, 'dicomseries')],
+                 ['1.2.3.9', '1.2.3.10', '1.2.3.11'])
+    assert_equal([s['type'] for s in
+                  load_stream_of_type(spec_path, 'dicomseries',
+                                      prefix=True)],
+                 ['dicomseries:all'] + ['dicomseries'] * 3)
+    assert_equal(list(load_stream_of_type(spec_path, 'generic_file')),
+                 [snippets[0], generic])
@@ -0,0 +1,119 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test byte-offset index of specification files"""
+
+import os
+import os.path as op
+
+from datalad.api import Dataset
+from datalad.support.json_py import (
+    dump2stream,
+    load_stream,
+)
+from datalad.tests.utils import (
+    assert_equal,
+    assert_false,
+    assert_raises,
+    assert_true,
+    with_tempfile,
+)
+
+from datalad_hirni.support.spec_index import (
+    get_snippet_key,
+    SpecIndex,
+)
+
+
+snippets = [
+    {'type': 'dicomseries:all',
+     'location': 'dicoms'},
+    {'type': 'dicomseries',
+     'location': 'dicoms',
+     'uid': '1.2.3',
+     'id': {'value': 401, 'approved': False}},
+    {'type': 'generic_file',
+     'location': 'README',
+     'id': {'value': None, 'approved': False},
+     'comment': {'value': "", 'approved': False}},
+]
+
+
+@with_tempfile
+def test_spec_index(path):
+
+    ds = Dataset(path).create()
+    spec_path = op.join(ds.path, 'studyspec.json')
+    dump2stream(snippets, spec_path)
+
+    idx = SpecIndex(spec_path)
+    assert_equal(sorted(idx.keys()),
+                 sorted(get_snippet_key(s) for s in snippets))
+    for s in snippets:
+        assert_equal(idx.get(get_snippet_key(s)), s)
+    assert_equal(idx.get(get_snippet_key({'type': 'generic_file',
+                                          'location': 'other'})),
+                 None)
+    # lookup disregarding the id
+    key = idx.find('dicomseries', '1.2.3')
+    assert_equal(key, get_snippet_key(snippets[1]))
+    assert_equal(idx.position(key), 1)
+    assert_equal(idx.find('dicomseries', '1.2.4'), None)
+
+    # replace a snippet in the middle; the others are untouched
+    changed = dict(snippets[1],
+                   comment={'value': "rerun", 'approved': True})
+    idx.replace(changed)
+    assert_equal(list(load_stream(spec_path)),
+                 [snippets[0], changed, snippets[2]])
+    # index was updated, rather than invalidated
+    assert_equal(idx.get(get_snippet_key(snippets[2])), snippets[2])
+
+    # a new instance picks up the stored index
+    assert_equal(SpecIndex(spec_path).get(get_snippet_key(changed)), changed)
+
+    # changes from elsewhere are detected
+    dump2stream(snippets[1:], spec_path)
+    idx = SpecIndex(spec_path)
+    assert_equal(idx.get(get_snippet_key(snippets[0])), None)
+    assert_equal(idx.get(get_snippet_key(snippets[1])), snippets[1])
+
+    assert_raises(KeyError, idx.replace, snippets[0])
+    assert_equal(idx.position(get_snippet_key(snippets[2])), 1)
+
+
+@with_tempfile
+def test_spec4anything_replace(path):
+
+    ds = Dataset(path).create()
+    os.makedirs(op.join(ds.path, 'acq'))
+    for f in ('one.txt', 'two.txt'):
+        with open(op.join(ds.path, 'acq', f), 'w') as fp:
+            fp.write(f)
+    ds.save(message="add files")
+    ds.hirni_spec4anything([op.join('acq', 'one.txt'),
+                            op.join('acq', 'two.txt')])
+    spec_path = op.join(ds.path, 'acq', 'studyspec.json')
+    with open(spec_path, 'rb') as f:
+        lines = f.readlines()
+
+    ds.hirni_spec4anything(op.join('acq', 'one.txt'),
+                           properties={'comment': 'changed'},
+                           replace=True)
+    spec = list(load_stream(spec_path))
+    assert_equal(len(spec), 2)
+    assert_equal(spec[0]['comment'], {'value': 'changed', 'approved': True})
+    # replaced in place by means of the index, keeping the other line
+    idx = SpecIndex(spec_path)
+    assert_true(op.exists(idx.index_path))
+    assert_equal(idx.get(get_snippet_key(spec[0])), spec[0])
+    with open(spec_path, 'rb') as f:
+        new_lines = f.readlines()
+    assert_equal(new_lines[1], lines[1])
+    assert_false(new_lines[0] == lines[0])
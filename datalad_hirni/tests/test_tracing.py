@@ -0,0 +1,78 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test tracing of hirni commands"""
+
+import json
+import os.path as op
+
+from datalad.api import Dataset
+from datalad.tests.utils import (
+    assert_equal,
+    assert_in,
+    assert_not_in,
+    assert_true,
+    with_tempfile,
+)
+
+from datalad_hirni.support.tracing import (
+    span,
+    Tracer,
+)
+
+
+def test_tracer():
+
+    # without an active trace, spans are no-ops
+    with span('nothing'):
+        pass
+
+    tracer = Tracer('test', profile=True)
+    for i in range(3):
+        with tracer.span('outer', round=i):
+            with tracer.span('inner'):
+                pass
+    summary = tracer.summary()
+    assert_equal(sorted(summary), ['inner', 'outer'])
+    assert_equal(summary['outer']['count'], 3)
+    assert_equal(tracer.events[0]['depth'], 1)
+    assert_equal(tracer.events[1]['info'], {'round': 0})
+    profile = tracer.stop()
+    assert_true(profile)
+    assert_in('cumtime', profile[0])
+
+
+@with_tempfile
+@with_tempfile
+def test_traced_command(path, trace_dir):
+
+    ds = Dataset(path).create()
+    with open(op.join(ds.path, 'some.txt'), 'w') as f:
+        f.write('content')
+    ds.save('some.txt')
+
+    # not traced by default
+    res = ds.hirni_spec4anything('some.txt', return_type='list')
+    assert_not_in('spans', res[-1])
+    assert_true(all('spans' not in r for r in res))
+
+    trace_file = op.join(trace_dir, '{command}.json')
+    ds.config.set('datalad.hirni.trace', trace_file, where='local')
+    res = ds.hirni_spec4anything('some.txt', properties='{"comment": "x"}',
+                                 replace=True, return_type='list')
+    # summary is attached to the last result only
+    assert_in('spec4anything.write', res[-1]['spans'])
+    assert_true(all('spans' not in r for r in res[:-1]))
+
+    with open(op.join(trace_dir, 'spec4anything.json')) as f:
+        trace = json.load(f)
+    assert_equal(trace['command'], 'spec4anything')
+    assert_in('spec4anything.save', trace['spans'])
+    assert_equal(set(e['ph'] for e in trace['traceEvents']), {'X'})
+    assert_not_in('profile', trace)
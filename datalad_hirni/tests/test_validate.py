@@ -0,0 +1,86 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test validation of specification files"""
+
+import os.path as op
+
+from datalad.api import Dataset
+from datalad.support.json_py import dump2stream
+from datalad.tests.utils import (
+    assert_equal,
+    assert_result_count,
+    with_tempfile,
+)
+
+from datalad_hirni.support.spec_schema import get_validator
+
+
+valid_series = {
+    'type': 'dicomseries',
+    'location': 'dicoms',
+    'uid': '1.2.3',
+    'dataset-id': None,
+    'dataset-refcommit': None,
+    'tags': [],
+    'bids-modality': {'value': 'bold', 'approved': False},
+}
+
+valid_all = {
+    'type': 'dicomseries:all',
+    'location': 'dicoms',
+    'procedures': [{
+        'procedure-name': {'value': 'hirni-dicom-converter',
+                           'approved': False},
+        'on-anonymize': {'value': False, 'approved': False}}],
+}
+
+
+def test_validator():
+    validator = get_validator()
+    assert_equal(validator.validate(valid_series), [])
+    assert_equal(validator.validate(valid_all), [])
+    assert_equal(validator.validate({'type': 'generic_file',
+                                     'location': 'README',
+                                     'comment': {'value': '',
+                                                 'approved': True}}),
+                 [])
+
+    assert_equal(validator.validate({'type': 'unknown'}),
+                 ["unknown snippet type 'unknown'"])
+    problems = validator.validate(dict(valid_series, uid=None, comment='x'))
+    assert_equal(len(problems), 2)
+    assert_equal(
+        validator.validate(dict(valid_all, procedures={'on-anonymize': 1})),
+        ["'procedures' contains a procedure without 'procedure-name'"])
+
+
+@with_tempfile
+def test_validate(path):
+
+    ds = Dataset(path).create()
+    dump2stream([valid_all, valid_series],
+                op.join(ds.path, 'acq1', 'studyspec.json'))
+    dump2stream([valid_all, dict(valid_series, tags='ignore'), {}],
+                op.join(ds.path, 'acq2', 'studyspec.json'))
+
+    res = ds.hirni_validate(on_failure='ignore')
+    assert_result_count(res, 2)
+    assert_result_count(res, 1, status='ok',
+                        path=op.join(ds.path, 'acq1', 'studyspec.json'))
+    assert_result_count(res, 1, status='error',
+                        path=op.join(ds.path, 'acq2', 'studyspec.json'))
+    # all problems are reported at once
+    problems = [r for r in res if r['status'] == 'error'][0]['problems']
+    assert_equal([p[0] for p in problems], [2, 3])
+
+    # validate an explicitly given file only
+    assert_result_count(
+        ds.hirni_validate(op.join(ds.path, 'acq1', 'studyspec.json')),
+        1, status='ok')
@@ -0,0 +1,46 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# -*- coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test polling of watched directories"""
+
+import os.path as op
+
+from datalad.tests.utils import (
+    assert_equal,
+    with_tempfile,
+)
+
+from datalad_hirni.support.watch_folder import FolderWatcher
+
+
+@with_tempfile(mkdir=True)
+def test_folder_watcher(path):
+
+    watcher = FolderWatcher([path], settle=10, pattern='*.tar')
+    tarball = op.join(path, 'acq.tar')
+    with open(tarball, 'w') as f:
+        f.write('part')
+    for ignored in ('.acq.tar', 'acq.txt'):
+        with open(op.join(path, ignored), 'w') as f:
+            f.write('ignored')
+
+    assert_equal(watcher.poll(now=0), [])
+    assert_equal(watcher.pending, 1)
+
+    # still being written
+    with open(tarball, 'a') as f:
+        f.write(' and more')
+    assert_equal(watcher.poll(now=5), [])
+    assert_equal(watcher.poll(now=10), [])
+
+    # unchanged long enough
+    assert_equal(watcher.poll(now=15), [tarball])
+    assert_equal(watcher.pending, 0)
+    # reported once only
+    assert_equal(watcher.poll(now=100), [])
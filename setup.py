@@ -52,6 +52,14 @@ setup(
         'datalad-webapp',
     ],
     extras_require={
+        # faster hashing of converted files for manifests
+        'manifest': [
+            'xxhash',
+        ],
+        # hirni-export-specs
+        'export': [
+            'pyarrow',
+        ],
         'devel-docs': [
             # used for converting README.md -> .rst for long_description
             'pypandoc',
@@ -73,6 +81,9 @@ setup(
         'datalad.tests': [
             'hirni=datalad_hirni',
         ],
+        'console_scripts': [
+            'hirni-client=datalad_hirni.client:main',
+        ],
     },
     include_package_data=True,
 )